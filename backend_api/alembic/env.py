@@ -1,23 +1,31 @@
 # tessyfarm_smartloop/backend_api/alembic/env.py
-# ... other imports
 from logging.config import fileConfig
 import os
 import sys
 
-# Add the app directory to the Python path
+from alembic import context
+from sqlalchemy import create_engine, pool
+
+# Add the backend_api directory to the Python path
 # This allows Alembic to find your app's modules (models, config)
-sys.path.insert(0, os.path.realpath(os.path.join(os.path.dirname(__file__), '..', '..')))
+sys.path.insert(0, os.path.realpath(os.path.join(os.path.dirname(__file__), '..')))
 # Now you can import from your app
 from app.core.db import Base  # Your SQLAlchemy Base
 from app.core.config import settings # Your application settings
+from app.models import farm # noqa: F401  (registers the models on Base.metadata, for autogenerate)
+
+# The Alembic Config object, which provides access to the values within alembic.ini
+config = context.config
+
+# Interpret the config file for Python logging (not when called programmatically, e.g. from tests)
+if config.config_file_name is not None and config.attributes.get("configure_logger", True):
+    fileConfig(config.config_file_name)
+
+target_metadata = Base.metadata
 
-# ... rest of the file
 
 def run_migrations_offline() -> None:
-    """Run migrations in 'offline' mode.
-    # ...
-    """
-    # url = config.get_main_option("sqlalchemy.url") # Original line
+    """Run migrations in 'offline' mode (alembic upgrade --sql): emit the SQL instead of running it."""
     url = settings.ASSEMBLED_DATABASE_URL # Use Pydantic settings
     context.configure(
         url=url, # Use the URL from settings
@@ -25,26 +33,36 @@ def run_migrations_offline() -> None:
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
     )
-    # ...
+
+    with context.begin_transaction():
+        context.run_migrations()
+
 
 def run_migrations_online() -> None:
-    """Run migrations in 'online' mode.
-    # ...
     """
-    # connectable = engine_from_config( # Original lines
-    #     config.get_section(config.config_ini_section, {}),
-    #     prefix="sqlalchemy.",
-    #     poolclass=pool.NullPool,
-    # )
+    Run migrations in 'online' mode against the primary database from settings, or against
+    a connection passed in config.attributes["connection"] (tests/conftest.py does that).
+    """
+    connection = config.attributes.get("connection")
+    if connection is not None:
+        context.configure(connection=connection, target_metadata=target_metadata)
+        with context.begin_transaction():
+            context.run_migrations()
+        return
 
-    # Create a new engine instance using your settings
-    from sqlalchemy import create_engine
-    connectable = create_engine(settings.ASSEMBLED_DATABASE_URL) # Use Pydantic settings
+    # Create a new engine instance using your settings (always the primary, never the read replica)
+    connectable = create_engine(settings.ASSEMBLED_DATABASE_URL, poolclass=pool.NullPool)
 
     with connectable.connect() as connection:
         context.configure(
             connection=connection, target_metadata=target_metadata
         )
-        # ...
+
+        with context.begin_transaction():
+            context.run_migrations()
 
 
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,34 @@
+"""sensor_readings: (device_id, timestamp) and BRIN timestamp indexes for range aggregation
+
+Revision ID: 2b5f0e6c9d84
+Revises: a8e3740d5b19
+Create Date: 2026-10-19 10:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '2b5f0e6c9d84'
+down_revision: Union[str, None] = 'a8e3740d5b19'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # sensor_readings is the large, write-heavy table: build without blocking the IoT listener's inserts.
+    # CONCURRENTLY cannot run inside a transaction, hence the autocommit block.
+    with op.get_context().autocommit_block():
+        op.create_index('ix_sensor_readings_device_id_timestamp', 'sensor_readings', ['device_id', 'timestamp'],
+                        postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_sensor_readings_timestamp_brin', 'sensor_readings', ['timestamp'],
+                        postgresql_using='brin', postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_sensor_readings_timestamp_brin', table_name='sensor_readings',
+                      postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_sensor_readings_device_id_timestamp', table_name='sensor_readings',
+                      postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,42 @@
+"""add cycle_features (per-cycle aggregated sensor features store)
+
+Revision ID: 3f8a2c61d0e4
+Revises: 9c1e4a7d2b60
+Create Date: 2026-10-19 09:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = '3f8a2c61d0e4'
+down_revision: Union[str, None] = '9c1e4a7d2b60'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Starts empty; rows are computed on first use (services/yield_features.load_cycle_aggregates)
+    op.create_table(
+        'cycle_features',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('crop_cycle_id', sa.Integer(), nullable=False),
+        sa.Column('feature_version', sa.String(), nullable=False),
+        sa.Column('data_watermark', sa.Integer(), nullable=False),
+        sa.Column('window_end', sa.DateTime(), nullable=False),
+        sa.Column('source_updated_at', sa.DateTime(), nullable=True),
+        sa.Column('features', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+        sa.Column('computed_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['crop_cycle_id'], ['crop_cycles.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('crop_cycle_id', 'feature_version', name='uq_cycle_features_cycle_version'),
+    )
+    op.create_index('ix_cycle_features_id', 'cycle_features', ['id'])
+    op.create_index('ix_cycle_features_crop_cycle_id', 'cycle_features', ['crop_cycle_id'])
+
+
+def downgrade() -> None:
+    op.drop_table('cycle_features')
@@ -0,0 +1,36 @@
+"""yield_predictions: one row per crop cycle and model version (batch upsert key)
+
+Revision ID: 5e0b93f47a21
+Revises: b72d5e9a1c38
+Create Date: 2026-10-19 09:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '5e0b93f47a21'
+down_revision: Union[str, None] = 'b72d5e9a1c38'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Existing rows (one per cycle) satisfy the wider constraint as they are
+    op.drop_constraint('yield_predictions_crop_cycle_id_key', 'yield_predictions', type_='unique')
+    op.create_unique_constraint('uq_yield_predictions_cycle_model', 'yield_predictions', ['crop_cycle_id', 'model_version'])
+    op.create_index('ix_yield_predictions_crop_cycle_id', 'yield_predictions', ['crop_cycle_id'])
+
+
+def downgrade() -> None:
+    # Only one prediction per cycle fits the old constraint: keep the most recent one
+    op.execute("""
+        DELETE FROM yield_predictions p
+        USING yield_predictions newer
+        WHERE newer.crop_cycle_id = p.crop_cycle_id
+          AND (COALESCE(newer.prediction_date, '-infinity'), newer.id) > (COALESCE(p.prediction_date, '-infinity'), p.id)
+    """)
+    op.drop_index('ix_yield_predictions_crop_cycle_id', table_name='yield_predictions')
+    op.drop_constraint('uq_yield_predictions_cycle_model', 'yield_predictions', type_='unique')
+    op.create_unique_constraint('yield_predictions_crop_cycle_id_key', 'yield_predictions', ['crop_cycle_id'])
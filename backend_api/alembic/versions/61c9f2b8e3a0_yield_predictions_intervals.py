@@ -0,0 +1,27 @@
+"""yield_predictions: prediction interval bounds
+
+Revision ID: 61c9f2b8e3a0
+Revises: d4a16c8e2f57
+Create Date: 2026-10-19 09:50:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '61c9f2b8e3a0'
+down_revision: Union[str, None] = 'd4a16c8e2f57'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('yield_predictions', sa.Column('prediction_interval_low', sa.Float(), nullable=True))
+    op.add_column('yield_predictions', sa.Column('prediction_interval_high', sa.Float(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('yield_predictions', 'prediction_interval_high')
+    op.drop_column('yield_predictions', 'prediction_interval_low')
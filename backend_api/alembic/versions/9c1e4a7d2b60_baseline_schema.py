@@ -0,0 +1,107 @@
+"""baseline schema: sensor readings, farms, fields, crop cycles and yield predictions
+
+Revision ID: 9c1e4a7d2b60
+Revises: 
+Create Date: 2026-10-19 09:00:00.000000
+
+Tables as they were before migrations were tracked. Databases created back then already
+have them: `alembic stamp 9c1e4a7d2b60` instead of running this revision.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = '9c1e4a7d2b60'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'sensor_readings',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('device_id', sa.String(), nullable=False),
+        sa.Column('temperature', sa.Float(), nullable=True),
+        sa.Column('humidity', sa.Float(), nullable=True),
+        sa.Column('soil_moisture', sa.Float(), nullable=True),
+        sa.Column('custom_data', sa.JSON(), nullable=True),
+        sa.Column('timestamp', sa.DateTime(), nullable=False),
+        sa.Column('received_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_sensor_readings_id', 'sensor_readings', ['id'])
+    op.create_index('ix_sensor_readings_device_id', 'sensor_readings', ['device_id'])
+
+    op.create_table(
+        'farms',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('location_text', sa.String(), nullable=True),
+        sa.Column('total_area_hectares', sa.Float(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_farms_id', 'farms', ['id'])
+    op.create_index('ix_farms_name', 'farms', ['name'], unique=True)
+
+    op.create_table(
+        'fields',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('farm_id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('area_hectares', sa.Float(), nullable=True),
+        sa.Column('soil_type', sa.String(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['farm_id'], ['farms.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_fields_id', 'fields', ['id'])
+    op.create_index('ix_fields_name', 'fields', ['name'])
+
+    op.create_table(
+        'crop_cycles',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('field_id', sa.Integer(), nullable=False),
+        sa.Column('crop_type', sa.String(), nullable=False),
+        sa.Column('planting_date', sa.DateTime(), nullable=False),
+        sa.Column('expected_harvest_date', sa.DateTime(), nullable=True),
+        sa.Column('actual_harvest_date', sa.DateTime(), nullable=True),
+        sa.Column('actual_yield_tonnes', sa.Float(), nullable=True),
+        sa.Column('notes', sa.String(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['field_id'], ['fields.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_crop_cycles_id', 'crop_cycles', ['id'])
+    op.create_index('ix_crop_cycles_crop_type', 'crop_cycles', ['crop_type'])
+
+    op.create_table(
+        'yield_predictions',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('crop_cycle_id', sa.Integer(), nullable=False),
+        sa.Column('model_version', sa.String(), nullable=False),
+        sa.Column('prediction_date', sa.DateTime(), nullable=True),
+        sa.Column('predicted_yield_tonnes', sa.Float(), nullable=False),
+        sa.Column('confidence_score', sa.Float(), nullable=True),
+        sa.Column('input_features_summary', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+        sa.ForeignKeyConstraint(['crop_cycle_id'], ['crop_cycles.id']),
+        sa.PrimaryKeyConstraint('id'),
+        # PostgreSQL's default name for the column-level UNIQUE that create_all used to emit
+        sa.UniqueConstraint('crop_cycle_id', name='yield_predictions_crop_cycle_id_key'),
+    )
+    op.create_index('ix_yield_predictions_id', 'yield_predictions', ['id'])
+
+
+def downgrade() -> None:
+    op.drop_table('yield_predictions')
+    op.drop_table('crop_cycles')
+    op.drop_table('fields')
+    op.drop_table('farms')
+    op.drop_table('sensor_readings')
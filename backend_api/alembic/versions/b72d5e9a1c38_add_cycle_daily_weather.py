@@ -0,0 +1,49 @@
+"""add cycle_daily_weather (daily weather accumulators per crop cycle)
+
+Revision ID: b72d5e9a1c38
+Revises: 3f8a2c61d0e4
+Create Date: 2026-10-19 09:20:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'b72d5e9a1c38'
+down_revision: Union[str, None] = '3f8a2c61d0e4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Starts empty; the first run of the daily rollup (ml_models/scripts/daily_weather_rollup.py)
+    # backfills every active cycle from its planting date
+    op.create_table(
+        'cycle_daily_weather',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('crop_cycle_id', sa.Integer(), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('reading_count', sa.Integer(), nullable=False),
+        sa.Column('temp_count', sa.Integer(), nullable=False),
+        sa.Column('temp_sum', sa.Float(), nullable=True),
+        sa.Column('min_temp', sa.Float(), nullable=True),
+        sa.Column('max_temp', sa.Float(), nullable=True),
+        sa.Column('mean_temp', sa.Float(), nullable=True),
+        sa.Column('gdd', sa.Float(), nullable=True),
+        sa.Column('humidity_count', sa.Integer(), nullable=False),
+        sa.Column('humidity_sum', sa.Float(), nullable=True),
+        sa.Column('moisture_count', sa.Integer(), nullable=False),
+        sa.Column('moisture_sum', sa.Float(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['crop_cycle_id'], ['crop_cycles.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('crop_cycle_id', 'day', name='uq_cycle_daily_weather_cycle_day'),
+    )
+    op.create_index('ix_cycle_daily_weather_id', 'cycle_daily_weather', ['id'])
+    op.create_index('ix_cycle_daily_weather_crop_cycle_id', 'cycle_daily_weather', ['crop_cycle_id'])
+
+
+def downgrade() -> None:
+    op.drop_table('cycle_daily_weather')
@@ -0,0 +1,27 @@
+"""cycle_daily_weather: drop accumulators built with the unanchored device-to-field rule
+
+Revision ID: c3e85f1a7b92
+Revises: e7d21a4b6c03
+Create Date: 2026-10-19 11:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3e85f1a7b92'
+down_revision: Union[str, None] = 'e7d21a4b6c03'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Rows rolled up before FEATURE_VERSION v3 may count field_10's devices under field_1 and are not
+    # versioned. Until the next daily rollup backfills them, features fall back to raw readings.
+    op.execute('DELETE FROM cycle_daily_weather')
+
+
+def downgrade() -> None:
+    # Data-only revision; the accumulators are rebuilt by the daily rollup either way
+    pass
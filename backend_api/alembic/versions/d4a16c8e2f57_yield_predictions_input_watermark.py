@@ -0,0 +1,30 @@
+"""yield_predictions: input watermark columns for incremental batch scoring
+
+Revision ID: d4a16c8e2f57
+Revises: 5e0b93f47a21
+Create Date: 2026-10-19 09:40:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4a16c8e2f57'
+down_revision: Union[str, None] = '5e0b93f47a21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # NULL on existing rows, so the next batch run re-scores their cycles once
+    op.add_column('yield_predictions', sa.Column('feature_version', sa.String(), nullable=True))
+    op.add_column('yield_predictions', sa.Column('input_watermark', sa.Integer(), nullable=True))
+    op.add_column('yield_predictions', sa.Column('source_updated_at', sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('yield_predictions', 'source_updated_at')
+    op.drop_column('yield_predictions', 'input_watermark')
+    op.drop_column('yield_predictions', 'feature_version')
@@ -0,0 +1,71 @@
+"""add alert_rules and sensor_alerts (streaming alerts in the IoT listener)
+
+Revision ID: e7d21a4b6c03
+Revises: 2b5f0e6c9d84
+Create Date: 2026-10-19 10:20:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7d21a4b6c03'
+down_revision: Union[str, None] = '2b5f0e6c9d84'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'alert_rules',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('enabled', sa.Boolean(), nullable=False),
+        sa.Column('device_id', sa.String(), nullable=True),
+        sa.Column('field_id', sa.Integer(), nullable=True),
+        sa.Column('metric', sa.String(), nullable=False),
+        sa.Column('kind', sa.String(), nullable=False),
+        sa.Column('operator', sa.String(), nullable=False),
+        sa.Column('threshold', sa.Float(), nullable=False),
+        sa.Column('duration_seconds', sa.Float(), nullable=True),
+        sa.Column('hysteresis', sa.Float(), nullable=False),
+        sa.Column('severity', sa.String(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['field_id'], ['fields.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_alert_rules_id', 'alert_rules', ['id'])
+    op.create_index('ix_alert_rules_device_id', 'alert_rules', ['device_id'])
+    op.create_index('ix_alert_rules_field_id', 'alert_rules', ['field_id'])
+
+    op.create_table(
+        'sensor_alerts',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('rule_id', sa.Integer(), nullable=True),
+        sa.Column('rule_name', sa.String(), nullable=False),
+        sa.Column('device_id', sa.String(), nullable=False),
+        sa.Column('field_id', sa.Integer(), nullable=True),
+        sa.Column('metric', sa.String(), nullable=False),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('severity', sa.String(), nullable=False),
+        sa.Column('value', sa.Float(), nullable=True),
+        sa.Column('threshold', sa.Float(), nullable=False),
+        sa.Column('reading_timestamp', sa.DateTime(), nullable=False),
+        sa.Column('message', sa.String(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['rule_id'], ['alert_rules.id'], ondelete='SET NULL'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_sensor_alerts_id', 'sensor_alerts', ['id'])
+    op.create_index('ix_sensor_alerts_rule_id', 'sensor_alerts', ['rule_id'])
+    op.create_index('ix_sensor_alerts_device_id', 'sensor_alerts', ['device_id'])
+    op.create_index('ix_sensor_alerts_field_id', 'sensor_alerts', ['field_id'])
+    op.create_index('ix_sensor_alerts_created_at', 'sensor_alerts', ['created_at'])
+
+
+def downgrade() -> None:
+    op.drop_table('sensor_alerts')
+    op.drop_table('alert_rules')
@@ -0,0 +1,97 @@
+# tessyfarm_smartloop/backend_api/app/apis/version1/endpoints/alerts.py
+from datetime import datetime
+from typing import List, Literal, Optional
+
+from fastapi import APIRouter, HTTPException, Depends, Query, status
+from sqlalchemy.orm import Session
+
+from ....core.db import get_db, get_read_db
+from ....models.farm import AlertRule, SensorAlert
+from ..schemas import AlertRuleCreate, AlertRuleUpdate, AlertRuleResponse, SensorAlertResponse, validate_alert_rule
+
+router = APIRouter()
+
+# Rules are evaluated in-stream by the IoT listener, which picks up changes within
+# ALERT_RULES_RELOAD_SECONDS. Alerts it raises are stored in sensor_alerts and listed here.
+
+# --- Alert Rule Endpoints ---
+
+@router.post("/rules/", response_model=AlertRuleResponse, status_code=status.HTTP_201_CREATED)
+def create_alert_rule(rule: AlertRuleCreate, db: Session = Depends(get_db)):
+    db_rule = AlertRule(**rule.model_dump())
+    db.add(db_rule)
+    db.commit()
+    db.refresh(db_rule)
+    return db_rule
+
+@router.get("/rules/", response_model=List[AlertRuleResponse])
+def read_alert_rules(device_id: Optional[str] = None, field_id: Optional[int] = None, enabled: Optional[bool] = None,
+                     skip: int = 0, limit: int = 100, db: Session = Depends(get_read_db)):
+    query = db.query(AlertRule)
+    if device_id is not None:
+        query = query.filter(AlertRule.device_id == device_id)
+    if field_id is not None:
+        query = query.filter(AlertRule.field_id == field_id)
+    if enabled is not None:
+        query = query.filter(AlertRule.enabled == enabled)
+    return query.order_by(AlertRule.id).offset(skip).limit(limit).all()
+
+@router.get("/rules/{rule_id}", response_model=AlertRuleResponse)
+def read_alert_rule(rule_id: int, db: Session = Depends(get_read_db)):
+    db_rule = db.query(AlertRule).filter(AlertRule.id == rule_id).first()
+    if db_rule is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Alert rule not found")
+    return db_rule
+
+@router.put("/rules/{rule_id}", response_model=AlertRuleResponse)
+def update_alert_rule(rule_id: int, rule_update: AlertRuleUpdate, db: Session = Depends(get_db)):
+    db_rule = db.query(AlertRule).filter(AlertRule.id == rule_id).first()
+    if db_rule is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Alert rule not found")
+
+    update_data = rule_update.model_dump(exclude_unset=True)
+    for key, value in update_data.items():
+        setattr(db_rule, key, value)
+    try:
+        validate_alert_rule(db_rule) # The merged rule must still be complete
+    except ValueError as e:
+        db.rollback()
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+
+    db.add(db_rule)
+    db.commit()
+    db.refresh(db_rule)
+    return db_rule
+
+@router.delete("/rules/{rule_id}", status_code=status.HTTP_204_NO_CONTENT)
+def delete_alert_rule(rule_id: int, db: Session = Depends(get_db)):
+    db_rule = db.query(AlertRule).filter(AlertRule.id == rule_id).first()
+    if db_rule is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Alert rule not found")
+    # Past alerts keep rule_name; their rule_id is set to NULL by the foreign key
+    db.delete(db_rule)
+    db.commit()
+    return None # No content response
+
+# --- Alert Endpoints ---
+
+@router.get("/", response_model=List[SensorAlertResponse])
+def read_alerts(device_id: Optional[str] = None, field_id: Optional[int] = None, rule_id: Optional[int] = None,
+                alert_status: Optional[Literal["triggered", "resolved"]] = Query(None, alias="status"),
+                since: Optional[datetime] = None, limit: int = Query(100, gt=0, le=1000),
+                db: Session = Depends(get_read_db)):
+    """
+    Most recent alert transitions first, optionally filtered by device, field, rule, status and creation time.
+    """
+    query = db.query(SensorAlert)
+    if device_id is not None:
+        query = query.filter(SensorAlert.device_id == device_id)
+    if field_id is not None:
+        query = query.filter(SensorAlert.field_id == field_id)
+    if rule_id is not None:
+        query = query.filter(SensorAlert.rule_id == rule_id)
+    if alert_status is not None:
+        query = query.filter(SensorAlert.status == alert_status)
+    if since is not None:
+        query = query.filter(SensorAlert.created_at >= since)
+    return query.order_by(SensorAlert.created_at.desc(), SensorAlert.id.desc()).limit(limit).all()
@@ -1,14 +1,34 @@
 # tessyfarm_smartloop/backend_api/app/apis/version1/endpoints/farm_data.py
-from fastapi import APIRouter, HTTPException, Body, Depends
+from fastapi import APIRouter, HTTPException, Body, Depends, Request
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from typing import List, Dict # Keep Dict if you still intend to group by device_id in Python
-
-from ..schemas import SensorDataCreate, SensorDataResponse
-from ....core.db import get_db # Navigate up to core.db
+from itertools import groupby
+from datetime import datetime
+
+from ..schemas import SensorDataCreate, SensorDataResponse, SensorAggregationRequest, SensorAggregationResponse
+from ....core.db import get_db, get_read_db # Navigate up to core.db; reads may go to the replica
+from ....core.responses import fast_json_response, rows_to_dicts
+from ....services.columnar import preferred_columnar_format, fetch_sensor_columns, columnar_response
+from ....services.sensor_aggregation import aggregate_sensor_readings
 from ....models.farm import SensorReading # Navigate up to models.farm
 
 router = APIRouter()
 
+# Columns selected by the high-volume read endpoints. Keys mirror SensorDataResponse so the
+# fast path emits the same JSON shape without building ORM objects or Pydantic models per row.
+SENSOR_READING_COLUMNS = (
+    SensorReading.id,
+    SensorReading.device_id,
+    SensorReading.temperature,
+    SensorReading.humidity,
+    SensorReading.soil_moisture,
+    SensorReading.custom_data,
+    SensorReading.timestamp,
+    SensorReading.received_at,
+)
+SENSOR_READING_KEYS = tuple(column.key for column in SENSOR_READING_COLUMNS)
+
 # Remove the DUMMY_SENSOR_DATA_STORE and DUMMY_DB_ID_COUNTER
 
 @router.post("/sensor-data/", response_model=SensorDataResponse, status_code=201)
@@ -41,37 +61,68 @@ async def receive_sensor_data(
 @router.get("/sensor-data/{device_id}", response_model=List[SensorDataResponse])
 async def get_sensor_data_for_device(
     device_id: str, 
-    db: Session = Depends(get_db)
+    request: Request,
+    db: Session = Depends(get_read_db)
 ):
     """
     Retrieve all sensor data for a specific device from the database.
+    Rows are read as Core tuples and encoded directly (see core/responses.py).
+    Send `Accept: application/vnd.tessyfarm.columnar+json` (or Arrow IPC) for a columnar body,
+    fetched straight into NumPy arrays (see services/columnar.py).
     """
-    readings = db.query(SensorReading).filter(SensorReading.device_id == device_id).order_by(SensorReading.timestamp.desc()).all()
-    if not readings:
-        # It's better to return an empty list than a 404 if the device *could* exist but just has no data.
-        # A 404 might be appropriate if devices themselves were registered entities and this one wasn't found.
-        # For now, an empty list is fine.
-        return []
-    return readings
+    columnar_format = preferred_columnar_format(request)
+    if columnar_format:
+        columns, _, _ = fetch_sensor_columns(db, filters=[SensorReading.device_id == device_id],
+                                             order_by=[SensorReading.timestamp.desc()])
+        return columnar_response(request, columnar_format, columns)
+
+    stmt = select(*SENSOR_READING_COLUMNS)\
+        .where(SensorReading.device_id == device_id)\
+        .order_by(SensorReading.timestamp.desc())
+    rows = db.execute(stmt).all()
+    # An empty list (rather than a 404) is returned if the device has no data yet.
+    return fast_json_response(request, rows_to_dicts(SENSOR_READING_KEYS, rows))
 
 
 @router.get("/sensor-data/", response_model=Dict[str, List[SensorDataResponse]])
-async def get_all_sensor_data(db: Session = Depends(get_db)):
+async def get_all_sensor_data(request: Request, db: Session = Depends(get_read_db)):
     """
     Retrieve all sensor data from the database, grouped by device_id.
+    Columnar JSON is keyed by device_id; Arrow output carries a device_id column instead.
     """
-    all_readings = db.query(SensorReading).order_by(SensorReading.device_id, SensorReading.timestamp.desc()).all()
-    
-    grouped_data: Dict[str, List[SensorDataResponse]] = {}
-    for reading in all_readings:
-        # Convert SQLAlchemy model instance to Pydantic model instance for consistent response
-        # This happens automatically if response_model is correctly defined and using from_attributes
-        pydantic_reading = SensorDataResponse.model_validate(reading) # Explicit validation for clarity
-        if reading.device_id not in grouped_data:
-            grouped_data[reading.device_id] = []
-        grouped_data[reading.device_id].append(pydantic_reading)
-        
-    return grouped_data
+    columnar_format = preferred_columnar_format(request)
+    if columnar_format:
+        columns, device_ids, device_counts = fetch_sensor_columns(db, order_by=[SensorReading.timestamp.desc()], by_device=True)
+        return columnar_response(request, columnar_format, columns, device_ids=device_ids, device_counts=device_counts)
+
+    stmt = select(*SENSOR_READING_COLUMNS)\
+        .order_by(SensorReading.device_id, SensorReading.timestamp.desc())
+    rows = db.execute(stmt).all()
+
+    # Rows arrive ordered by device_id, so a single groupby pass builds the grouping.
+    # No per-row model_validate here: the response is returned as-is, skipping the
+    # second validation FastAPI would otherwise run against response_model.
+    grouped_data = {
+        device_id: rows_to_dicts(SENSOR_READING_KEYS, device_rows)
+        for device_id, device_rows in groupby(rows, key=lambda row: row.device_id)
+    }
+    return fast_json_response(request, grouped_data)
+
+
+@router.post("/sensor-data/aggregate", response_model=SensorAggregationResponse)
+def aggregate_sensor_data(request: SensorAggregationRequest, db: Session = Depends(get_read_db)):
+    """
+    Time-bucketed aggregates of a farm's, a field's or a set of devices' readings, one series per
+    field, device or for the whole scope, computed in a single grouped query.
+    E.g. average soil moisture per field of farm 1 over the last week, per day:
+    {"scope": "farm", "scope_id": 1, "start": ..., "bucket": "P1D", "metrics": ["soil_moisture"]}
+    """
+    try:
+        return aggregate_sensor_readings(
+            db, request.scope, request.scope_id, request.device_ids, request.start,
+            request.end or datetime.utcnow(), request.bucket, request.metrics, request.aggregates, request.group_by)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
 
 # In backend_api/app/apis/version1/endpoints/farm_data.py (or a new predictions.py)
 # ... (other imports)
@@ -87,6 +138,8 @@ class YieldPredictionResponse(BaseModel):
     prediction_date: datetime
     predicted_yield_tonnes: float
     confidence_score: Optional[float] = None
+    prediction_interval_low: Optional[float] = None
+    prediction_interval_high: Optional[float] = None
     input_features_summary: Optional[Dict[str, Any]] = None
 
     class Config:
@@ -94,7 +147,7 @@ class YieldPredictionResponse(BaseModel):
 
 # --- Add to router in farm_data.py or a new predictions_router.py ---
 @router.get("/yield-predictions/{crop_cycle_id}", response_model=Optional[YieldPredictionResponse], tags=["Predictions"])
-async def get_yield_prediction(crop_cycle_id: int, db: Session = Depends(get_db)):
+async def get_yield_prediction(crop_cycle_id: int, db: Session = Depends(get_read_db)):
     """
     Retrieve the latest yield prediction for a specific crop cycle.
     """
@@ -109,7 +162,7 @@ async def get_yield_prediction(crop_cycle_id: int, db: Session = Depends(get_db)
     return prediction
 
 @router.get("/fields/{field_id}/current-yield-prediction", response_model=Optional[YieldPredictionResponse], tags=["Predictions"])
-async def get_current_yield_prediction_for_field(field_id: int, db: Session = Depends(get_db)):
+async def get_current_yield_prediction_for_field(field_id: int, db: Session = Depends(get_read_db)):
     """
     Retrieve the latest yield prediction for the most current active crop cycle on a field.
     This requires identifying the 'current' or 'latest' crop cycle for a field.
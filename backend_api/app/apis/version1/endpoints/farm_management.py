@@ -3,7 +3,7 @@ from fastapi import APIRouter, HTTPException, Depends, Body, status
 from sqlalchemy.orm import Session
 from typing import List, Optional
 
-from ....core.db import get_db
+from ....core.db import get_db, get_read_db
 from ....models.farm import Farm, Field, CropCycle # Import your SQLAlchemy models
 from ..schemas import ( # Import your Pydantic schemas
     FarmCreate, FarmUpdate, FarmResponse, FarmResponseWithFields,
@@ -24,12 +24,12 @@ def create_farm(farm: FarmCreate, db: Session = Depends(get_db)):
     return db_farm
 
 @router.get("/farms/", response_model=List[FarmResponse], tags=["Farm Management"])
-def read_farms(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def read_farms(skip: int = 0, limit: int = 100, db: Session = Depends(get_read_db)):
     farms = db.query(Farm).offset(skip).limit(limit).all()
     return farms
 
 @router.get("/farms/{farm_id}", response_model=FarmResponseWithFields, tags=["Farm Management"])
-def read_farm(farm_id: int, db: Session = Depends(get_db)):
+def read_farm(farm_id: int, db: Session = Depends(get_read_db)):
     db_farm = db.query(Farm).filter(Farm.id == farm_id).first()
     if db_farm is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Farm not found")
@@ -79,7 +79,7 @@ def create_field(field: FieldCreate, db: Session = Depends(get_db)):
     return db_field
 
 @router.get("/fields/", response_model=List[FieldResponse], tags=["Field Management"])
-def read_fields(farm_id: Optional[int] = None, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def read_fields(farm_id: Optional[int] = None, skip: int = 0, limit: int = 100, db: Session = Depends(get_read_db)):
     query = db.query(Field)
     if farm_id is not None:
         query = query.filter(Field.farm_id == farm_id)
@@ -87,7 +87,7 @@ def read_fields(farm_id: Optional[int] = None, skip: int = 0, limit: int = 100,
     return fields
 
 @router.get("/fields/{field_id}", response_model=FieldResponseWithCropCycles, tags=["Field Management"])
-def read_field(field_id: int, db: Session = Depends(get_db)):
+def read_field(field_id: int, db: Session = Depends(get_read_db)):
     db_field = db.query(Field).filter(Field.id == field_id).first()
     if db_field is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Field not found")
@@ -140,7 +140,7 @@ def create_crop_cycle(crop_cycle: CropCycleCreate, db: Session = Depends(get_db)
     return db_crop_cycle
 
 @router.get("/crop-cycles/", response_model=List[CropCycleResponse], tags=["Crop Cycle Management"])
-def read_crop_cycles(field_id: Optional[int] = None, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def read_crop_cycles(field_id: Optional[int] = None, skip: int = 0, limit: int = 100, db: Session = Depends(get_read_db)):
     query = db.query(CropCycle)
     if field_id is not None:
         query = query.filter(CropCycle.field_id == field_id)
@@ -148,7 +148,7 @@ def read_crop_cycles(field_id: Optional[int] = None, skip: int = 0, limit: int =
     return crop_cycles
 
 @router.get("/crop-cycles/{cycle_id}", response_model=CropCycleResponse, tags=["Crop Cycle Management"])
-def read_crop_cycle(cycle_id: int, db: Session = Depends(get_db)):
+def read_crop_cycle(cycle_id: int, db: Session = Depends(get_read_db)):
     db_crop_cycle = db.query(CropCycle).filter(CropCycle.id == cycle_id).first()
     if db_crop_cycle is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Crop cycle not found")
@@ -0,0 +1,102 @@
+# tessyfarm_smartloop/backend_api/app/apis/version1/endpoints/predictions.py
+import asyncio
+from datetime import datetime
+from functools import partial
+
+from fastapi import APIRouter, HTTPException, Depends, status
+from sqlalchemy.orm import Session
+
+from ....core.db import get_db, get_read_db
+from ....models.farm import CropCycle
+from ....services.model_registry import ModelRegistryError
+from ....services.yield_scoring import model_holder, predict_crop_cycle
+from ....services.yield_scenarios import fetch_scope_features, simulate_scenarios
+from ..schemas import OnlineYieldPredictionResponse, ActiveModelResponse, ScenarioRequest, ScenarioResponse
+
+router = APIRouter()
+
+# Online predictions are computed on demand from the latest readings with the active model,
+# instead of waiting for the scheduled batch run. Results are cached until new readings arrive.
+
+@router.get("/online/model", response_model=ActiveModelResponse)
+def get_active_model():
+    """
+    Version and training metrics of the model currently loaded for online scoring.
+    """
+    try:
+        family = model_holder.get()
+    except ModelRegistryError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    bundle = family.global_bundle
+    return ActiveModelResponse(
+        version=bundle.version,
+        feature_names=bundle.feature_names,
+        feature_version=bundle.feature_version,
+        metrics=bundle.metrics,
+        group_by=family.group_by,
+        groups=sorted(family.groups),
+    )
+
+@router.get("/online/crop-cycles/{crop_cycle_id}", response_model=OnlineYieldPredictionResponse)
+async def predict_crop_cycle_online(crop_cycle_id: int, db: Session = Depends(get_read_db)):
+    """
+    Compute a fresh yield prediction for an active crop cycle.
+    """
+    try:
+        prediction = await predict_crop_cycle(db, crop_cycle_id)
+    except ModelRegistryError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    if prediction is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Active crop cycle not found")
+    return prediction
+
+def _current_crop_cycle_id(db: Session, field_id: int):
+    # Same notion of "current" as /farm-data/fields/{field_id}/current-yield-prediction
+    current_crop_cycle = db.query(CropCycle.id)\
+                           .filter(CropCycle.field_id == field_id)\
+                           .filter(CropCycle.actual_harvest_date == None)\
+                           .order_by(CropCycle.planting_date.desc())\
+                           .first()
+    return current_crop_cycle.id if current_crop_cycle else None
+
+@router.get("/online/fields/{field_id}", response_model=OnlineYieldPredictionResponse)
+async def predict_field_online(field_id: int, db: Session = Depends(get_read_db)):
+    """
+    Compute a fresh yield prediction for the current active crop cycle on a field.
+    """
+    # Blocking query; keep it off the event loop like the rest of the online path
+    crop_cycle_id = await asyncio.get_running_loop().run_in_executor(None, _current_crop_cycle_id, db, field_id)
+    if crop_cycle_id is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No active crop cycle on this field")
+    return await predict_crop_cycle_online(crop_cycle_id, db)
+
+@router.post("/online/scenarios", response_model=ScenarioResponse)
+async def simulate_yield_scenarios(request: ScenarioRequest, db: Session = Depends(get_db),
+                                   read_db: Session = Depends(get_read_db)):
+    """
+    What-if yield predictions for the active cycles of a crop cycle, field, farm or every field,
+    under each combination of the requested feature perturbations.
+    Features are read from the replica (if any); refreshed cycle_features rows are written to the primary.
+    """
+    if request.scope != "all" and request.scope_id is None:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=f"scope_id is required for scope '{request.scope}'")
+    loop = asyncio.get_running_loop()
+    try:
+        family = await loop.run_in_executor(None, model_holder.get)
+    except ModelRegistryError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    now = datetime.utcnow()
+    # Model loading and the feature queries block too; run them in the executor as well
+    features_df = await loop.run_in_executor(
+        None, partial(fetch_scope_features, db, family, request.scope, request.scope_id, now=now, read_db=read_db))
+    if features_df.empty:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No active crop cycles in scope")
+
+    perturbations = [p.model_dump() for p in request.perturbations]
+    try:
+        # One large scoring call; keep it off the event loop like the online batcher
+        result = await loop.run_in_executor(
+            None, simulate_scenarios, family, features_df, perturbations, request.include_cycles)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+    return ScenarioResponse(**result, computed_at=now)
@@ -1,7 +1,7 @@
 # tessyfarm_smartloop/backend_api/app/apis/version1/schemas.py
-from pydantic import BaseModel, Field
-from datetime import datetime
-from typing import Optional, List, Any # Ensure List is imported
+from pydantic import BaseModel, Field, model_validator
+from datetime import datetime, timedelta
+from typing import Optional, List, Any, Dict, Literal, Union # Ensure List is imported
 
 # ... (Existing SensorDataCreate, SensorDataResponse, YieldPredictionResponse) ...
 
@@ -85,3 +85,147 @@ class FarmResponseWithFields(FarmResponse):
 # Schema to list crop cycles within a field response
 class FieldResponseWithCropCycles(FieldResponse):
     crop_cycles: List[CropCycleResponse] = []
+
+# --- Online Prediction Schemas ---
+class OnlineYieldPredictionResponse(BaseModel):
+    crop_cycle_id: int
+    field_id: int
+    model_version: str
+    model_group: Optional[str] = None # Per-group model that scored the cycle (e.g. crop type); None = global model
+    predicted_yield_tonnes: float # Per hectare, same unit as the batch predictions
+    prediction_interval_low: Optional[float] = None # Per-tree quantiles, see settings.PREDICTION_INTERVAL_*
+    prediction_interval_high: Optional[float] = None
+    confidence_score: Optional[float] = None
+    input_features_summary: Dict[str, Optional[float]]
+    computed_at: datetime
+    cached: bool = False # True when served from the in-process cache (no new readings since)
+
+class ActiveModelResponse(BaseModel):
+    version: str
+    feature_names: List[str]
+    feature_version: Optional[str] = None
+    metrics: Dict[str, Any] = {}
+    group_by: List[str] = [] # Columns the per-group models are keyed by, empty if there are none
+    groups: List[str] = []
+
+# --- What-if Scenario Schemas ---
+class FeaturePerturbation(BaseModel):
+    feature: str # One of the active model's feature_names, e.g. "avg_soil_moisture"
+    mode: Literal["scale", "shift", "set"] = "scale" # Multiply by, add, or replace with each value
+    values: List[float] = Field(..., min_length=1) # One scenario level per value, e.g. [0.9] for "10% lower"
+
+class ScenarioRequest(BaseModel):
+    scope: Literal["crop_cycle", "field", "farm", "all"] # Active cycles the scenarios are applied to
+    scope_id: Optional[int] = None # Id of the crop cycle, field or farm; not used for "all"
+    perturbations: List[FeaturePerturbation] = Field(..., min_length=1) # Scenarios = cartesian product of their values
+    include_cycles: bool = False # Also return every cycle's prediction per scenario
+
+class ScenarioDistribution(BaseModel):
+    levels: Dict[str, float] = {} # Feature -> level applied; empty for the baseline
+    mean: float # Predicted yield per hectare over the cycles in scope
+    std: float
+    min: float
+    p10: float
+    p50: float
+    p90: float
+    max: float
+    mean_change: float # Mean minus the baseline mean
+    predictions: Optional[List[float]] = None # In crop_cycle_ids order, with include_cycles
+
+class ScenarioResponse(BaseModel):
+    model_version: str
+    crop_cycle_ids: List[int]
+    baseline: ScenarioDistribution
+    scenarios: List[ScenarioDistribution]
+    computed_at: datetime
+
+# --- Sensor Aggregation Schemas ---
+class SensorAggregationRequest(BaseModel):
+    scope: Literal["farm", "field", "devices"] # Readings of a farm's or field's devices, or of device_ids
+    scope_id: Optional[int] = None # Farm or field id; not used for "devices"
+    device_ids: Optional[List[str]] = None # Required for "devices"
+    start: datetime
+    end: Optional[datetime] = None # Exclusive; defaults to now
+    bucket: timedelta # Bucket width, e.g. "PT1H" or seconds
+    metrics: List[Literal["temperature", "humidity", "soil_moisture"]] = Field(..., min_length=1)
+    aggregates: List[Literal["avg", "min", "max", "sum", "count"]] = Field(["avg"], min_length=1)
+    group_by: Literal["field", "device", "scope"] = "field" # One series per field, per device, or one overall
+
+class SensorAggregationSeries(BaseModel):
+    key: str # Field id, device id, or the scope name for group_by="scope"
+    buckets: List[int] # Indexes of the buckets holding readings; bucket i starts at start + i * bucket_seconds
+    reading_count: List[int]
+    values: Dict[str, List[Union[int, float, None]]] # "<metric>_<aggregate>" -> one value per entry of buckets
+
+class SensorAggregationResponse(BaseModel):
+    scope: str
+    scope_id: Optional[int] = None
+    group_by: str
+    start: datetime
+    end: datetime
+    bucket_seconds: float
+    bucket_count: int
+    series: List[SensorAggregationSeries]
+
+# --- Alert Schemas (rules are evaluated by the IoT listener, see iot_listener/alert_rules.py) ---
+class AlertRuleBase(BaseModel):
+    name: str = Field(..., min_length=1, max_length=100, examples=["Field 7 dry"])
+    enabled: bool = True
+    device_id: Optional[str] = None # Target one device...
+    field_id: Optional[int] = None # ...or every device of a field (exactly one of the two)
+    metric: Literal["temperature", "humidity", "soil_moisture"]
+    kind: Literal["threshold", "rate_of_change", "sustained"] = "threshold" # rate_of_change is per hour
+    operator: Literal["<", ">"]
+    threshold: float = Field(..., examples=[0.2])
+    duration_seconds: Optional[float] = Field(None, gt=0, examples=[1800]) # Required for sustained rules
+    hysteresis: float = Field(0.0, ge=0, examples=[0.02]) # Resolves only once back past threshold by this margin
+    severity: Literal["info", "warning", "critical"] = "warning"
+
+def validate_alert_rule(rule):
+    """Raises ValueError unless exactly one target is set and sustained rules have a duration (schemas or ORM rows)."""
+    if (rule.device_id is None) == (rule.field_id is None):
+        raise ValueError("Exactly one of device_id and field_id must be set")
+    if rule.kind == "sustained" and not rule.duration_seconds:
+        raise ValueError("Sustained rules need duration_seconds")
+
+class AlertRuleCreate(AlertRuleBase):
+    @model_validator(mode="after")
+    def check_target_and_duration(self):
+        validate_alert_rule(self)
+        return self
+
+class AlertRuleUpdate(AlertRuleBase):
+    name: Optional[str] = Field(None, min_length=1, max_length=100) # All fields optional
+    enabled: Optional[bool] = None
+    metric: Optional[Literal["temperature", "humidity", "soil_moisture"]] = None
+    kind: Optional[Literal["threshold", "rate_of_change", "sustained"]] = None
+    operator: Optional[Literal["<", ">"]] = None
+    threshold: Optional[float] = None
+    hysteresis: Optional[float] = Field(None, ge=0)
+    severity: Optional[Literal["info", "warning", "critical"]] = None
+
+class AlertRuleResponse(AlertRuleBase):
+    id: int
+    created_at: datetime
+    updated_at: datetime
+
+    class Config:
+        from_attributes = True
+
+class SensorAlertResponse(BaseModel):
+    id: int
+    rule_id: Optional[int] = None # None once the rule is deleted
+    rule_name: str
+    device_id: str
+    field_id: Optional[int] = None
+    metric: str
+    status: str # triggered or resolved
+    severity: str
+    value: Optional[float] = None # Reading, or change per hour for rate_of_change rules
+    threshold: float
+    reading_timestamp: datetime
+    message: Optional[str] = None
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
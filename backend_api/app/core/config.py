@@ -14,11 +14,66 @@ class Settings(BaseSettings):
     POSTGRES_DB: str
     POSTGRES_PORT: str = "5432"
     DATABASE_URL: str | None = None # Assembled URL
+    # Optional streaming replica for read-only endpoints and ML feature queries (see core/db.py),
+    # e.g. postgresql+psycopg2://user:password@db_replica:5432/tessyfarm. Unset: everything uses the primary.
+    REPLICA_DATABASE_URL: str | None = None
+    READ_YOUR_WRITES_SECONDS: float = 5.0 # After a client's write, its reads stay on the primary this long
 
     # MQTT Settings
     MQTT_BROKER_HOST: str = "mqtt_broker"
     MQTT_BROKER_PORT: int = 1883
 
+    # Fast-path response settings (see core/responses.py)
+    RESPONSE_COMPRESSION_MIN_BYTES: int = 1024 # Smaller bodies are sent uncompressed
+    RESPONSE_GZIP_LEVEL: int = 5
+    RESPONSE_BROTLI_QUALITY: int = 4 # Low quality keeps brotli cheap enough for per-request use
+
+    # Per-request instrumentation (see core/instrumentation.py), exposed at /metrics
+    REQUEST_METRICS_ENABLED: bool = True
+    REQUEST_QUERY_BUDGET: int = 25 # Requests running more SQL statements than this are flagged
+    REQUEST_BUDGET_OFFENDERS_KEPT: int = 100 # Most recent over-budget requests listed at /metrics
+
+    # Model registry (see services/model_registry.py); ml_models is mounted at /app/ml_models
+    MODEL_REGISTRY_DIR: str = "/app/ml_models/saved_models/registry"
+    MODEL_GROUP_CACHE_SIZE: int = 8 # Per-group (crop type) models kept loaded per process, see services/model_family.py
+    # Prediction intervals span these quantiles of the per-tree predictions (see ModelBundle.predict_interval)
+    PREDICTION_INTERVAL_LOWER: float = 0.1
+    PREDICTION_INTERVAL_UPPER: float = 0.9
+    # Stage profiles of the ML jobs run with --profile (see services/stage_profiler.py)
+    PROFILE_DIR: str = "/app/ml_models/saved_models/profiles"
+    # Engineered training matrix cache for yield_model_trainer.py (see services/training_snapshot.py)
+    TRAINING_SNAPSHOT_DIR: str = "/app/ml_models/saved_models/training_snapshot"
+
+    # Stream readings through running aggregators instead of a database GROUP BY (see services/yield_features.py)
+    FEATURE_AGGREGATION_STREAMING: bool = False
+    FEATURE_STREAM_CHUNK_SIZE: int = 50000 # Readings per fetch; bounds client memory
+    # Days before the last rolled-up one that the daily weather rollup recomputes, picking up late readings
+    WEATHER_ROLLUP_LOOKBACK_DAYS: int = 3
+    # Batch predictor: also re-score cycles whose stored prediction is older than this, even if their
+    # inputs are unchanged (cycle_duration_days and gdd_approx advance with time). 0 disables it, which
+    # leaves a cycle whose sensors went quiet on its old prediction until the weekly --full run.
+    PREDICTION_MAX_AGE_HOURS: float = 24
+
+    # Online yield prediction (see services/yield_scoring.py)
+    MODEL_RELOAD_CHECK_SECONDS: float = 5.0 # How often the ACTIVE pointer is checked for a new version
+    ONLINE_PREDICTION_MAX_BATCH_SIZE: int = 64
+    ONLINE_PREDICTION_MAX_WAIT_MS: int = 5 # How long a request may wait for others to join its batch
+    ONLINE_PREDICTION_CACHE_SIZE: int = 10000
+
+    # Resident job scheduler (ml_models/scripts/job_scheduler.py) and retention (see services/retention.py)
+    JOB_HISTORY_RETENTION_DAYS: int = 90
+    PREDICTION_RETENTION_DAYS: int = 180 # Superseded predictions older than this are deleted
+    MODEL_REGISTRY_KEEP_VERSIONS: int = 10 # Newest versions kept, plus the active one
+    PREDICTION_RUN_STATE_RETENTION_DAYS: int = 14 # Batch predictor --resume state files
+    ALERT_RETENTION_DAYS: int = 90 # sensor_alerts rows written by the IoT listener
+
+    # What-if scenarios (see services/yield_scenarios.py)
+    SCENARIO_MAX_ROWS: int = 500000 # Cycles x (scenarios + baseline) scored per request
+
+    # Cross-device sensor aggregation (see services/sensor_aggregation.py)
+    SENSOR_AGGREGATION_MAX_BUCKETS: int = 2000 # Per series; (end - start) / bucket above this is rejected
+    SENSOR_AGGREGATION_MAX_DEVICES: int = 200 # device_ids accepted for scope "devices"
+
     model_config = SettingsConfigDict(env_file=".env", extra="ignore")
 
     @property
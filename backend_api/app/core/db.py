@@ -1,18 +1,108 @@
 # tessyfarm_smartloop/backend_api/app/core/db.py
-from sqlalchemy import create_engine
+import math
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, declarative_base # updated import
+from starlette.datastructures import MutableHeaders
+from starlette.requests import HTTPConnection
 from .config import settings
+from .instrumentation import TimedQueuePool, instrument_engine
 
 # Construct the database URL
 # DATABASE_URL should now be correctly assembled by Pydantic settings
 SQLALCHEMY_DATABASE_URL = settings.ASSEMBLED_DATABASE_URL
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+# TimedQueuePool is a plain QueuePool that also reports checkout wait per request (core/instrumentation.py)
+engine = create_engine(SQLALCHEMY_DATABASE_URL, poolclass=TimedQueuePool)
+if settings.REQUEST_METRICS_ENABLED:
+    instrument_engine(engine)
+
+# Read replica (settings.REPLICA_DATABASE_URL), used through get_read_db by read-only endpoints and
+# for the ML feature queries. Without one, read sessions are plain primary sessions.
+# Read-your-writes: a request that commits ORM changes gets a cookie (READ_YOUR_WRITES_COOKIE) pinning
+# that client's reads to the primary for READ_YOUR_WRITES_SECONDS, which should cover replication lag.
+# To try it locally, run a second Postgres as a streaming replica of the first
+# (pg_basebackup -R from the primary) and point REPLICA_DATABASE_URL at it.
+replica_engine = None
+if settings.REPLICA_DATABASE_URL:
+    replica_engine = create_engine(settings.REPLICA_DATABASE_URL, poolclass=TimedQueuePool)
+    if settings.REQUEST_METRICS_ENABLED:
+        instrument_engine(replica_engine)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=replica_engine or engine)
 
 Base = declarative_base() # This will be used by our models
 
+READ_YOUR_WRITES_COOKIE = "tessyfarm_primary_until"
+
+
+@dataclass
+class _ClientWrites:
+    primary_until: float = 0.0 # Epoch seconds from the client's cookie
+    wrote: bool = False # Set when this request committed a write
+
+
+_client_writes: ContextVar[Optional[_ClientWrites]] = ContextVar("client_writes", default=None)
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _mark_flushed(session, flush_context):
+    session.info["wrote"] = True
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _mark_committed(session):
+    state = _client_writes.get()
+    if session.info.pop("wrote", False) and state is not None:
+        state.wrote = True
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _clear_flushed(session):
+    session.info.pop("wrote", None)
+
+
+class ReadYourWritesMiddleware:
+    """
+    ASGI middleware keeping a client's reads on the primary for READ_YOUR_WRITES_SECONDS after it wrote.
+    Only ORM writes committed through SessionLocal count (feature-store upserts are caches, not client writes).
+    """
+
+    def __init__(self, app, window_seconds: float = None):
+        self.app = app
+        self.window_seconds = settings.READ_YOUR_WRITES_SECONDS if window_seconds is None else window_seconds
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        state = _ClientWrites()
+        try:
+            state.primary_until = float(HTTPConnection(scope).cookies.get(READ_YOUR_WRITES_COOKIE, 0))
+        except ValueError:
+            pass
+        token = _client_writes.set(state)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and state.wrote and self.window_seconds > 0:
+                until = time.time() + self.window_seconds
+                MutableHeaders(scope=message).append(
+                    "set-cookie",
+                    f"{READ_YOUR_WRITES_COOKIE}={until:.3f}; Max-Age={math.ceil(self.window_seconds)}; "
+                    "Path=/; HttpOnly; SameSite=Lax")
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _client_writes.reset(token)
+
 # Dependency to get DB session
 def get_db():
     db = SessionLocal()
@@ -21,3 +111,12 @@ def get_db():
     finally:
         db.close()
 
+# Dependency for read-only endpoints: a replica session, or a primary one within the client's read-your-writes window
+def get_read_db():
+    state = _client_writes.get()
+    pinned = state is not None and state.primary_until > time.time()
+    db = SessionLocal() if pinned else ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
@@ -0,0 +1,233 @@
+# tessyfarm_smartloop/backend_api/app/core/instrumentation.py
+"""
+Per-request performance instrumentation.
+
+- RequestMetricsMiddleware (pure ASGI) times each HTTP request and counts its response bytes.
+  Results are aggregated per route template ("GET /api/v1/farm-data/sensor-data/{device_id}"),
+  so path parameters do not create one series per device.
+- instrument_engine() hooks SQLAlchemy cursor events on an engine; every statement executed
+  while a request is in flight is counted and timed against that request.
+- TimedQueuePool measures how long a request waited to check out a connection (this includes
+  opening a new connection when the pool grows).
+- Requests issuing more than REQUEST_QUERY_BUDGET statements are counted per route, printed,
+  and kept in a bounded list of recent offenders.
+
+Request state lives in a context variable, so statements run from the threadpool (sync
+dependencies such as get_db) are attributed to the request that started them. Outside a
+request (scripts, the job scheduler) the hooks are no-ops.
+"""
+import bisect
+import itertools
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+from .config import settings
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open-ended
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+UNMATCHED_ROUTE = "<unmatched>" # 404s and other requests no route matched share one series
+
+
+@dataclass
+class RequestStats:
+    sql_count: int = 0
+    sql_seconds: float = 0.0
+    pool_wait_seconds: float = 0.0
+    response_bytes: int = 0
+
+
+_current_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that adds the time spent waiting for a checkout to the current request."""
+
+    def connect(self):
+        stats = _current_stats.get()
+        if stats is None:
+            return super().connect()
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            stats.pool_wait_seconds += time.perf_counter() - started
+
+
+def instrument_engine(engine):
+    """Counts and times the engine's statements against the request in flight (if any)."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if _current_stats.get() is not None:
+            conn.info["request_query_started"] = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        stats = _current_stats.get()
+        started = conn.info.pop("request_query_started", None)
+        if stats is not None and started is not None:
+            stats.sql_count += 1
+            stats.sql_seconds += time.perf_counter() - started
+
+
+class RouteMetrics:
+    """Running totals and a latency histogram for one route."""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0 # 5xx responses
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.latency_ms_sum = 0.0
+        self.latency_ms_max = 0.0
+        self.sql_count_sum = 0
+        self.sql_count_max = 0
+        self.sql_ms_sum = 0.0
+        self.pool_wait_ms_sum = 0.0
+        self.pool_wait_ms_max = 0.0
+        self.response_bytes_sum = 0
+        self.budget_exceeded = 0
+
+    def observe(self, status_code: int, latency_ms: float, stats: RequestStats, over_budget: bool):
+        self.requests += 1
+        self.errors += status_code >= 500
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS_MS, latency_ms)] += 1
+        self.latency_ms_sum += latency_ms
+        self.latency_ms_max = max(self.latency_ms_max, latency_ms)
+        self.sql_count_sum += stats.sql_count
+        self.sql_count_max = max(self.sql_count_max, stats.sql_count)
+        self.sql_ms_sum += stats.sql_seconds * 1000
+        pool_wait_ms = stats.pool_wait_seconds * 1000
+        self.pool_wait_ms_sum += pool_wait_ms
+        self.pool_wait_ms_max = max(self.pool_wait_ms_max, pool_wait_ms)
+        self.response_bytes_sum += stats.response_bytes
+        self.budget_exceeded += over_budget
+
+    def snapshot(self) -> Dict[str, Any]:
+        n = max(self.requests, 1)
+        labels = [f"le_{bound}" for bound in LATENCY_BUCKETS_MS] + ["le_inf"]
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "latency_ms": {
+                "mean": round(self.latency_ms_sum / n, 3),
+                "max": round(self.latency_ms_max, 3),
+                "histogram": dict(zip(labels, itertools.accumulate(self.buckets))), # Cumulative, like Prometheus' le buckets
+            },
+            "sql": {
+                "statements_mean": round(self.sql_count_sum / n, 2),
+                "statements_max": self.sql_count_max,
+                "time_ms_mean": round(self.sql_ms_sum / n, 3),
+            },
+            "pool_wait_ms": {"mean": round(self.pool_wait_ms_sum / n, 3), "max": round(self.pool_wait_ms_max, 3)},
+            "response_bytes_mean": round(self.response_bytes_sum / n),
+            "query_budget_exceeded": self.budget_exceeded,
+        }
+
+
+class RequestMetrics:
+    """Per-route metrics of this process, plus the most recent requests over the query budget."""
+
+    def __init__(self, query_budget: int = None, offenders_kept: int = None):
+        self.query_budget = settings.REQUEST_QUERY_BUDGET if query_budget is None else query_budget
+        self._routes: Dict[str, RouteMetrics] = {}
+        self._offenders = deque(maxlen=settings.REQUEST_BUDGET_OFFENDERS_KEPT if offenders_kept is None else offenders_kept)
+        self._started_at = datetime.utcnow()
+        self._lock = threading.Lock()
+
+    def observe(self, route: str, status_code: int, latency_ms: float, stats: RequestStats, path: str):
+        over_budget = stats.sql_count > self.query_budget
+        with self._lock:
+            metrics = self._routes.get(route)
+            if metrics is None:
+                metrics = self._routes[route] = RouteMetrics()
+            metrics.observe(status_code, latency_ms, stats, over_budget)
+            if over_budget:
+                self._offenders.append({
+                    "route": route,
+                    "path": path,
+                    "at": datetime.utcnow().isoformat(),
+                    "sql_statements": stats.sql_count,
+                    "sql_ms": round(stats.sql_seconds * 1000, 3),
+                    "latency_ms": round(latency_ms, 3),
+                })
+        if over_budget:
+            print(f"Query budget exceeded: {route} ({path}) ran {stats.sql_count} SQL statements "
+                  f"(budget {self.query_budget}) in {latency_ms:.1f} ms")
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "since": self._started_at.isoformat(),
+                "query_budget": self.query_budget,
+                "routes": {route: metrics.snapshot() for route, metrics in sorted(self._routes.items())},
+                "query_budget_offenders": list(self._offenders),
+            }
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+            self._offenders.clear()
+            self._started_at = datetime.utcnow()
+
+
+request_metrics = RequestMetrics()
+
+
+def _route_name(scope) -> str:
+    route = scope.get("route") # Set by FastAPI's router once a route matched
+    template = getattr(route, "path", None) or UNMATCHED_ROUTE
+    return f"{scope.get('method', '')} {template}"
+
+
+class RequestMetricsMiddleware:
+    """ASGI middleware feeding request_metrics; non-HTTP scopes pass through untouched."""
+
+    def __init__(self, app, metrics: RequestMetrics = None):
+        self.app = app
+        self.metrics = metrics or request_metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _current_stats.set(stats)
+        status_code = 500 # Reported if the app raises before sending a response
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                stats.response_bytes += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_stats.reset(token)
+            latency_ms = (time.perf_counter() - started) * 1000
+            self.metrics.observe(_route_name(scope), status_code, latency_ms, stats, scope.get("path", ""))
+
+
+def pool_status(engine) -> Dict[str, Any]:
+    """Current occupancy of the engine's connection pool."""
+    pool = engine.pool
+    if not isinstance(pool, QueuePool):
+        return {"status": pool.status()}
+    return {
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+    }
@@ -0,0 +1,74 @@
+# tessyfarm_smartloop/backend_api/app/core/responses.py
+import gzip
+from typing import Any, Iterable, Optional, Sequence
+
+import orjson
+from fastapi import Request
+from fastapi.responses import Response
+
+from .config import settings
+
+try:
+    import brotli # Optional: only needed to serve 'br' Content-Encoding
+except ImportError:
+    brotli = None
+
+# OPT_SERIALIZE_NUMPY lets callers hand NumPy arrays straight to the encoder.
+# Naive datetimes are emitted as ISO strings without an offset, same as Pydantic's default.
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY
+
+
+def rows_to_dicts(keys: Sequence[str], rows: Iterable[Sequence[Any]]) -> list:
+    """Turns Core row tuples into plain dicts without going through ORM objects or Pydantic."""
+    return [dict(zip(keys, row)) for row in rows]
+
+
+def _negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Picks 'br' or 'gzip' from an Accept-Encoding header, honouring q=0 exclusions."""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[token] = quality
+
+    if brotli is not None and accepted.get("br", 0) > 0:
+        return "br"
+    if accepted.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+
+def encoded_response(request: Request, body: bytes, media_type: str, status_code: int = 200) -> Response:
+    """
+    Wraps an already-serialized body in a Response, compressing it when the client accepts it
+    and the body is large enough for compression to pay off.
+    """
+    headers = {"Vary": "Accept-Encoding"}
+    if len(body) >= settings.RESPONSE_COMPRESSION_MIN_BYTES:
+        encoding = _negotiate_encoding(request.headers.get("accept-encoding", ""))
+        if encoding == "br":
+            body = brotli.compress(body, quality=settings.RESPONSE_BROTLI_QUALITY)
+            headers["Content-Encoding"] = "br"
+        elif encoding == "gzip":
+            body = gzip.compress(body, compresslevel=settings.RESPONSE_GZIP_LEVEL)
+            headers["Content-Encoding"] = "gzip"
+    return Response(content=body, status_code=status_code, media_type=media_type, headers=headers)
+
+
+def fast_json_response(request: Request, content: Any, status_code: int = 200) -> Response:
+    """
+    Encodes content with orjson and returns it as a (possibly compressed) JSON response.
+    Returning a Response directly means FastAPI skips response_model validation, so callers
+    are responsible for building content in the documented shape.
+    """
+    body = orjson.dumps(content, option=ORJSON_OPTIONS)
+    return encoded_response(request, body, media_type="application/json", status_code=status_code)
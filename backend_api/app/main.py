@@ -3,7 +3,11 @@ from fastapi import FastAPI
 from contextlib import asynccontextmanager
 
 from .core.config import settings
+from .core.db import engine, replica_engine, ReadYourWritesMiddleware
+from .core.instrumentation import RequestMetricsMiddleware, request_metrics, pool_status
 from .apis.version1 import api_router as api_v1_router
+from .services.model_registry import ModelRegistryError
+from .services.yield_scoring import model_holder
 # from .core import db # Will uncomment when db connection is set up
 
 # In-memory store for simple startup/shutdown events, if needed
@@ -17,6 +21,11 @@ async def lifespan(app: FastAPI):
     print("Application startup: Connecting to resources...")
     # Simulate connecting to DB or other services
     # await db.connect_to_database() # Example for database connection
+    # Load the active yield model once for online scoring (hot-swapped later when a new version is activated)
+    try:
+        model_holder.get()
+    except ModelRegistryError as e:
+        print(f"Online yield scoring disabled until a model is activated: {e}")
     yield
     # Shutdown
     print("Application shutdown: Cleaning up resources...")
@@ -30,6 +39,11 @@ app = FastAPI(
     lifespan=lifespan # Use the lifespan context manager
 )
 
+if settings.REQUEST_METRICS_ENABLED:
+    app.add_middleware(RequestMetricsMiddleware)
+if replica_engine is not None:
+    app.add_middleware(ReadYourWritesMiddleware) # Pins a client's reads to the primary right after it wrote
+
 @app.get("/health", tags=["Health Check"])
 async def health_check():
     """
@@ -37,6 +51,19 @@ async def health_check():
     """
     return {"status": "healthy", "message": "Tessyfarm API is running!"}
 
+@app.get("/metrics", tags=["Health Check"])
+async def metrics():
+    """
+    Per-route latency histograms, SQL statement counts/time, response sizes and pool checkout
+    wait for this worker process since it started, plus recent requests over the query budget.
+    """
+    return {
+        "enabled": settings.REQUEST_METRICS_ENABLED,
+        **request_metrics.snapshot(),
+        "pool": pool_status(engine),
+        "replica_pool": pool_status(replica_engine) if replica_engine is not None else None,
+    }
+
 # Include the API version 1 router
 app.include_router(api_v1_router, prefix=settings.API_V1_STR)
 
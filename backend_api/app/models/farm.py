@@ -1,11 +1,17 @@
 # tessyfarm_smartloop/backend_api/app/models/farm.py
-from sqlalchemy import Column, Integer, String, Float, DateTime, JSON
+from sqlalchemy import Column, Integer, String, Float, DateTime, JSON, Index
 from sqlalchemy.sql import func # For server-side default timestamps
 from ..core.db import Base # Import Base from our db core module
 from datetime import datetime
 
 class SensorReading(Base):
     __tablename__ = "sensor_readings"
+    __table_args__ = (
+        # Per-device time ranges (/sensor-data/{device_id}, device-set aggregation)
+        Index("ix_sensor_readings_device_id_timestamp", "device_id", "timestamp"),
+        # Time ranges across devices (farm/field aggregation); BRIN stays small on append-mostly data
+        Index("ix_sensor_readings_timestamp_brin", "timestamp", postgresql_using="brin"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     device_id = Column(String, index=True, nullable=False)
@@ -24,7 +30,7 @@ class SensorReading(Base):
 
 # tessyfarm_smartloop/backend_api/app/models/farm.py
 # ... (existing SensorReading model and imports) ...
-from sqlalchemy import ForeignKey
+from sqlalchemy import ForeignKey, UniqueConstraint, Date, Boolean
 from sqlalchemy.orm import relationship
 from sqlalchemy.dialects.postgresql import JSONB # For storing structured JSON
 
@@ -71,12 +77,110 @@ class CropCycle(Base):
 
 class YieldPrediction(Base):
     __tablename__ = "yield_predictions"
+    __table_args__ = (UniqueConstraint("crop_cycle_id", "model_version", name="uq_yield_predictions_cycle_model"),)
     id = Column(Integer, primary_key=True, index=True)
-    crop_cycle_id = Column(Integer, ForeignKey("crop_cycles.id"), nullable=False, unique=True) # One prediction per cycle
+    crop_cycle_id = Column(Integer, ForeignKey("crop_cycles.id"), nullable=False, index=True) # One prediction per cycle and model version (upsert key)
     model_version = Column(String, nullable=False)
     prediction_date = Column(DateTime, default=func.now())
     predicted_yield_tonnes = Column(Float, nullable=False)
-    confidence_score = Column(Float, nullable=True) # Optional
+    confidence_score = Column(Float, nullable=True) # 1 / (1 + interval width relative to the prediction), see model_registry.confidence_scores
+    prediction_interval_low = Column(Float, nullable=True) # Quantiles of the forest's per-tree predictions (settings.PREDICTION_INTERVAL_*)
+    prediction_interval_high = Column(Float, nullable=True)
     input_features_summary = Column(JSONB, nullable=True) # Store a summary of features used for this prediction
+    # Input watermark, used by incremental batch runs to skip cycles whose inputs have not changed
+    feature_version = Column(String, nullable=True)
+    input_watermark = Column(Integer, nullable=True) # Highest sensor_readings.id that existed when inputs were read
+    source_updated_at = Column(DateTime, nullable=True) # Latest cycle/field updated_at the prediction was based on
     
     crop_cycle = relationship("CropCycle") # No back_populates needed if one-way from prediction
+
+# Feature store: aggregated sensor features per crop cycle (see app/services/yield_features.py)
+class CycleFeature(Base):
+    __tablename__ = "cycle_features"
+    __table_args__ = (UniqueConstraint("crop_cycle_id", "feature_version", name="uq_cycle_features_cycle_version"),)
+    id = Column(Integer, primary_key=True, index=True)
+    crop_cycle_id = Column(Integer, ForeignKey("crop_cycles.id"), nullable=False, index=True)
+    feature_version = Column(String, nullable=False)
+    data_watermark = Column(Integer, nullable=False) # Highest sensor_readings.id that existed when computed
+    window_end = Column(DateTime, nullable=False) # Upper bound of the reading window used (harvest date or "now")
+    source_updated_at = Column(DateTime, nullable=True) # Latest cycle/field updated_at seen when computed
+    features = Column(JSONB, nullable=False)
+    computed_at = Column(DateTime, default=func.now())
+
+    crop_cycle = relationship("CropCycle")
+
+# Daily weather accumulators per crop cycle, upserted once per day by the rollup job
+# (ml_models/scripts/daily_weather_rollup.py). The cycle's sensor features sum these rows (see services/yield_features.py).
+class CycleDailyWeather(Base):
+    __tablename__ = "cycle_daily_weather"
+    __table_args__ = (UniqueConstraint("crop_cycle_id", "day", name="uq_cycle_daily_weather_cycle_day"),)
+    id = Column(Integer, primary_key=True, index=True)
+    crop_cycle_id = Column(Integer, ForeignKey("crop_cycles.id"), nullable=False, index=True)
+    day = Column(Date, nullable=False)
+    reading_count = Column(Integer, nullable=False)
+    temp_count = Column(Integer, nullable=False) # Non-null temperature readings (mean = temp_sum / temp_count)
+    temp_sum = Column(Float, nullable=True)
+    min_temp = Column(Float, nullable=True)
+    max_temp = Column(Float, nullable=True)
+    mean_temp = Column(Float, nullable=True)
+    gdd = Column(Float, nullable=True) # max(0, (daily min + daily max) / 2 - base temperature)
+    humidity_count = Column(Integer, nullable=False)
+    humidity_sum = Column(Float, nullable=True)
+    moisture_count = Column(Integer, nullable=False)
+    moisture_sum = Column(Float, nullable=True)
+    created_at = Column(DateTime, default=func.now())
+
+    crop_cycle = relationship("CropCycle")
+
+# Run history of the resident job scheduler (ml_models/scripts/job_scheduler.py), one row per run
+class JobRun(Base):
+    __tablename__ = "job_runs"
+    id = Column(Integer, primary_key=True, index=True)
+    job_name = Column(String, nullable=False, index=True)
+    status = Column(String, nullable=False) # running, succeeded, failed or skipped (lock held elsewhere)
+    trigger = Column(String, nullable=True) # schedule or manual
+    host = Column(String, nullable=True) # Scheduler host/container that ran it
+    started_at = Column(DateTime, nullable=False, index=True)
+    finished_at = Column(DateTime, nullable=True)
+    duration_seconds = Column(Float, nullable=True)
+    rows_affected = Column(Integer, nullable=True) # Job-specific: predictions stored, training rows, rows added/deleted
+    details = Column(JSONB, nullable=True) # Job-specific summary (run id, model version, ...)
+    error = Column(String, nullable=True)
+
+# Alert rules evaluated by the IoT listener on every incoming reading (iot_listener/alert_rules.py).
+# A rule targets one device or every device of a field (exactly one of device_id/field_id).
+class AlertRule(Base):
+    __tablename__ = "alert_rules"
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, nullable=False)
+    enabled = Column(Boolean, nullable=False, default=True)
+    device_id = Column(String, nullable=True, index=True)
+    field_id = Column(Integer, ForeignKey("fields.id"), nullable=True, index=True)
+    metric = Column(String, nullable=False) # temperature, humidity or soil_moisture
+    kind = Column(String, nullable=False) # threshold, rate_of_change (per hour) or sustained
+    operator = Column(String, nullable=False) # "<" or ">"
+    threshold = Column(Float, nullable=False)
+    duration_seconds = Column(Float, nullable=True) # sustained: how long the condition must hold
+    hysteresis = Column(Float, nullable=False, default=0.0) # Clears only once back past threshold by this margin
+    severity = Column(String, nullable=False, default="warning")
+    created_at = Column(DateTime, default=func.now())
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+    field = relationship("Field")
+
+# Alert transitions written by the IoT listener (also published on MQTT under ALERT_TOPIC_PREFIX)
+class SensorAlert(Base):
+    __tablename__ = "sensor_alerts"
+    id = Column(Integer, primary_key=True, index=True)
+    rule_id = Column(Integer, ForeignKey("alert_rules.id", ondelete="SET NULL"), nullable=True, index=True)
+    rule_name = Column(String, nullable=False) # Kept for history when the rule is deleted
+    device_id = Column(String, nullable=False, index=True)
+    field_id = Column(Integer, nullable=True, index=True)
+    metric = Column(String, nullable=False)
+    status = Column(String, nullable=False) # triggered or resolved
+    severity = Column(String, nullable=False)
+    value = Column(Float, nullable=True) # Reading (or rate per hour) that caused the transition
+    threshold = Column(Float, nullable=False)
+    reading_timestamp = Column(DateTime, nullable=False)
+    message = Column(String, nullable=True)
+    created_at = Column(DateTime, default=func.now(), index=True)
@@ -0,0 +1 @@
+# tessyfarm_smartloop/backend_api/app/services/__init__.py
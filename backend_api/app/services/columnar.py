@@ -0,0 +1,224 @@
+# tessyfarm_smartloop/backend_api/app/services/columnar.py
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import orjson
+from fastapi import Request
+from fastapi.responses import Response
+import pyarrow as pa
+from sqlalchemy import BigInteger, Float, cast, extract, func, literal, select
+from sqlalchemy.orm import Session
+
+from ..core.responses import ORJSON_OPTIONS, encoded_response
+from ..models.farm import SensorReading
+
+# Opt-in media types for the sensor endpoints. Anything else in Accept gets the row-per-object JSON.
+COLUMNAR_JSON_MEDIA_TYPE = "application/vnd.tessyfarm.columnar+json"
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+# Numeric sensor metrics carried as columns. custom_data is free-form JSON and is not included.
+METRIC_KEYS = ("temperature", "humidity", "soil_moisture")
+
+
+def _accepted_media_types(accept: str) -> Dict[str, float]:
+    """Media type -> quality from an Accept header (q defaults to 1; other parameters are ignored)."""
+    accepted = {}
+    for part in accept.split(","):
+        media_type, *params = part.split(";")
+        media_type = media_type.strip().lower()
+        if not media_type:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[media_type] = quality
+    return accepted
+
+
+def preferred_columnar_format(request: Request) -> Optional[str]:
+    """
+    Returns the columnar media type the Accept header prefers, or None for the default JSON.
+    Types with q=0 are refused; Arrow wins a tie with columnar JSON, and an explicit
+    application/json of higher quality than both keeps the default.
+    """
+    accepted = _accepted_media_types(request.headers.get("accept", ""))
+    quality, media_type = max((accepted.get(ARROW_STREAM_MEDIA_TYPE, 0), ARROW_STREAM_MEDIA_TYPE),
+                              (accepted.get(COLUMNAR_JSON_MEDIA_TYPE, 0), COLUMNAR_JSON_MEDIA_TYPE),
+                              key=lambda candidate: candidate[0])
+    if quality <= 0 or accepted.get("application/json", 0) > quality:
+        return None
+    return media_type
+
+
+# --- Binary COPY into NumPy ---
+# Columnar reads skip the per-row tuples of a normal fetch: the query runs as
+# COPY (...) TO STDOUT (FORMAT binary) and, with every selected value fixed-width and NOT NULL,
+# each row has the same byte layout, so the whole result is one structured NumPy array.
+
+COPY_SIGNATURE = b"PGCOPY\n\xff\r\n\0"
+COPY_TRAILER = b"\xff\xff"
+COPY_FIELD_KINDS = ("i4", "i8", "f4", "f8") # integer, bigint, real, double precision
+
+
+def _copy_record_dtype(fields: Sequence[Tuple[str, str]]) -> np.dtype:
+    layout = [("_columns", ">i2")]
+    for name, kind in fields:
+        if kind not in COPY_FIELD_KINDS:
+            raise ValueError(f"Unsupported binary COPY column kind '{kind}' for '{name}'")
+        layout += [(f"_{name}_length", ">i4"), (name, ">" + kind)]
+    return np.dtype(layout)
+
+
+class _BinaryCopySink:
+    """File-like target for cursor.copy_expert: parses the fixed-width rows and hands over columns per chunk."""
+
+    def __init__(self, fields: Sequence[Tuple[str, str]], on_chunk: Callable[[Dict[str, np.ndarray]], None], chunk_rows: int):
+        self.fields = fields
+        self.dtype = _copy_record_dtype(fields)
+        self.on_chunk = on_chunk
+        self.chunk_bytes = self.dtype.itemsize * max(1, chunk_rows)
+        self.pending: List[bytes] = []
+        self.pending_bytes = 0
+        self.header_read = False
+
+    def write(self, data):
+        self.pending.append(bytes(data))
+        self.pending_bytes += len(data)
+        if self.pending_bytes >= self.chunk_bytes:
+            self._parse()
+
+    def finish(self):
+        rest = self._parse()
+        if not self.header_read or rest != COPY_TRAILER:
+            raise ValueError("Unexpected binary COPY output (NULL or variable-width value in a fixed-width column?)")
+
+    def _parse(self) -> bytes:
+        buffer = b"".join(self.pending)
+        if not self.header_read:
+            if len(buffer) < 19:
+                return buffer
+            if not buffer.startswith(COPY_SIGNATURE):
+                raise ValueError("Not a binary COPY stream")
+            buffer = buffer[19 + int.from_bytes(buffer[15:19], "big"):] # Skip flags and header extension
+            self.header_read = True
+
+        rows = len(buffer) // self.dtype.itemsize
+        if rows:
+            records = np.frombuffer(buffer, dtype=self.dtype, count=rows)
+            widths_ok = all((records[f"_{name}_length"] == np.dtype(kind).itemsize).all() for name, kind in self.fields)
+            if not widths_ok or (records["_columns"] != len(self.fields)).any():
+                raise ValueError("Unexpected binary COPY row layout (NULL value in a fixed-width column?)")
+            self.on_chunk({name: records[name].astype(kind) for name, kind in self.fields}) # To native byte order
+        rest = buffer[rows * self.dtype.itemsize:]
+        self.pending, self.pending_bytes = [rest], len(rest)
+        return rest
+
+
+def copy_columns(db: Session, stmt, fields: Sequence[Tuple[str, str]],
+                 on_chunk: Optional[Callable[[Dict[str, np.ndarray]], None]] = None,
+                 chunk_rows: int = 50000) -> Optional[Dict[str, np.ndarray]]:
+    """
+    Runs stmt on db's connection (and transaction) as a binary COPY and returns one NumPy array per
+    column, without building a Python object per row or value. fields names the selected columns in
+    order with their kind ('i4', 'i8', 'f4' or 'f8'); values must be NOT NULL (coalesce floats to NaN).
+    With on_chunk, it receives the columns of every ~chunk_rows rows instead and None is returned.
+    """
+    chunks = []
+    sink = _BinaryCopySink(fields, on_chunk or chunks.append, chunk_rows)
+    compiled = stmt.compile(dialect=db.get_bind().dialect, compile_kwargs={"render_postcompile": True})
+    with db.connection().connection.cursor() as cursor:
+        query = cursor.mogrify(str(compiled), compiled.params).decode()
+        cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT binary)", sink)
+    sink.finish()
+    if on_chunk is not None:
+        return None
+    if not chunks:
+        return {name: np.empty(0, dtype=kind) for name, kind in fields}
+    return {name: np.concatenate([chunk[name] for chunk in chunks]) for name, _ in fields}
+
+
+def fetch_sensor_columns(db: Session, filters: Sequence = (), order_by: Sequence = (), by_device: bool = False
+                         ) -> Tuple[Dict[str, np.ndarray], Optional[List[str]], Optional[np.ndarray]]:
+    """
+    Timestamps (int64 epoch milliseconds) and metrics (float64, NaN when missing) of the sensor
+    readings matching filters, fetched with copy_columns.
+    With by_device, rows are ordered by device_id first, and the distinct device ids and the number
+    of rows of each are returned too (from the same snapshot), instead of a device id per row.
+    """
+    order_by = ((SensorReading.device_id,) if by_device else ()) + tuple(order_by)
+    nan = cast(literal("NaN"), Float)
+    stmt = select(
+        cast(func.floor(extract("epoch", SensorReading.timestamp) * 1000), BigInteger).label("timestamps"),
+        *(func.coalesce(getattr(SensorReading, key), nan).label(key) for key in METRIC_KEYS),
+    ).where(*filters).order_by(*order_by)
+    fields = [("timestamps", "i8")] + [(key, "f8") for key in METRIC_KEYS]
+
+    if not by_device:
+        return copy_columns(db, stmt, fields), None, None
+    if not db.in_transaction():
+        # Both statements below must see the same rows
+        db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+    device_rows = db.execute(
+        select(SensorReading.device_id, func.count()).where(*filters)
+        .group_by(SensorReading.device_id).order_by(SensorReading.device_id)
+    ).all()
+    device_ids = [device_id for device_id, _ in device_rows]
+    device_counts = np.array([count for _, count in device_rows], dtype=np.int64)
+    return copy_columns(db, stmt, fields), device_ids, device_counts
+
+
+def split_columns_by_device(columns: Dict[str, np.ndarray], device_ids: Sequence[str],
+                            device_counts: np.ndarray) -> Dict[str, Dict[str, np.ndarray]]:
+    """Splits columns ordered by device into one block per device, given each device's row count."""
+    boundaries = np.cumsum(device_counts)[:-1]
+    split = {name: np.split(values, boundaries) for name, values in columns.items()}
+    return {
+        device_id: {name: parts[i] for name, parts in split.items()}
+        for i, device_id in enumerate(device_ids)
+    }
+
+
+def _arrow_stream(columns: Dict[str, np.ndarray], device_ids: Optional[Sequence[str]] = None,
+                  device_counts: Optional[np.ndarray] = None) -> bytes:
+    arrays: List = []
+    names: List[str] = []
+    if device_ids is not None:
+        indices = np.repeat(np.arange(len(device_ids), dtype=np.int32), device_counts)
+        arrays.append(pa.DictionaryArray.from_arrays(indices, pa.array(device_ids, type=pa.string())))
+        names.append("device_id")
+    arrays.append(pa.array(columns["timestamps"].astype("datetime64[ms]"), type=pa.timestamp("ms")))
+    names.append("timestamp")
+    for key in METRIC_KEYS:
+        arrays.append(pa.array(columns[key], from_pandas=True)) # NaN -> Arrow null
+        names.append(key)
+
+    table = pa.Table.from_arrays(arrays, names=names)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def columnar_response(
+    request: Request,
+    media_type: str,
+    columns: Dict[str, np.ndarray],
+    device_ids: Optional[Sequence[str]] = None,
+    device_counts: Optional[np.ndarray] = None,
+) -> Response:
+    """
+    Encodes columns as columnar JSON or as an Arrow IPC stream.
+    With device_ids and device_counts (see fetch_sensor_columns), JSON output is keyed by device
+    and Arrow output carries a dictionary-encoded device_id column.
+    """
+    if media_type == ARROW_STREAM_MEDIA_TYPE:
+        return encoded_response(request, _arrow_stream(columns, device_ids, device_counts), media_type=ARROW_STREAM_MEDIA_TYPE)
+
+    content = columns if device_ids is None else split_columns_by_device(columns, device_ids, device_counts)
+    body = orjson.dumps(content, option=ORJSON_OPTIONS)
+    return encoded_response(request, body, media_type=COLUMNAR_JSON_MEDIA_TYPE)
@@ -0,0 +1,235 @@
+# tessyfarm_smartloop/backend_api/app/services/compact_forest.py
+"""
+Array-based inference for the yield RandomForest.
+
+CompactForest flattens every tree of a fitted sklearn forest into a handful of contiguous
+NumPy arrays (split feature, threshold, left/right child, leaf value) and evaluates all trees
+for a block of rows with vectorized gathers. The StandardScaler is folded into the
+thresholds, so raw (unscaled) features go straight in.
+
+Predictions match `model.predict(scaler.transform(X))` exactly:
+- sklearn compares float32(scaled x) <= threshold. Each folded threshold is the largest
+  raw float64 value that still goes left under that rule (found by bisection over the
+  float64 bit patterns), so `raw x <= folded threshold` takes the same branch for every x.
+- Tree outputs are summed in tree order and divided by the tree count, like
+  RandomForestRegressor.predict.
+
+predict_interval also returns quantiles of the per-tree outputs, for prediction intervals.
+
+Saved as one .npy file per array plus forest.json, so the arrays can be memory-mapped.
+"""
+import json
+import os
+from typing import Optional
+
+import numpy as np
+
+FOREST_META_FILENAME = "forest.json"
+_ARRAY_NAMES = ("feature", "threshold", "left", "right", "value", "roots", "missing_go_left")
+_ROW_BLOCK_SIZE = 256 # Rows evaluated per block; keeps the (rows x trees) working set in cache
+
+_SIGN_MASK = np.int64(0x7FFFFFFFFFFFFFFF)
+
+
+def _to_ordered(values: np.ndarray) -> np.ndarray:
+    """Maps float64 values to int64 keys with the same ordering (adjacent floats differ by 1)."""
+    bits = values.view(np.int64)
+    return np.where(bits >= 0, bits, -(bits & _SIGN_MASK))
+
+
+def _from_ordered(keys: np.ndarray) -> np.ndarray:
+    bits = np.where(keys >= 0, keys, (-keys) | ~_SIGN_MASK)
+    return bits.view(np.float64)
+
+
+def _goes_left(raw: np.ndarray, mean: np.ndarray, scale: np.ndarray, threshold: np.ndarray) -> np.ndarray:
+    # The exact comparison sklearn makes after StandardScaler.transform
+    return ((raw - mean) / scale).astype(np.float32).astype(np.float64) <= threshold
+
+
+def fold_thresholds(threshold: np.ndarray, mean: np.ndarray, scale: np.ndarray) -> np.ndarray:
+    """
+    For each split, the largest raw float64 value that goes left. mean/scale are per split
+    (the scaler statistics of the split feature); scale must be positive.
+    """
+    guess = threshold * scale + mean
+    step = (np.abs(threshold) + 1.0) * scale * 1e-5 + np.abs(mean) * 1e-12
+    lo, hi = guess - step, guess + step
+    # Widen until lo goes left and hi goes right
+    while True:
+        bad_lo = ~_goes_left(lo, mean, scale, threshold)
+        bad_hi = _goes_left(hi, mean, scale, threshold)
+        if not (bad_lo.any() or bad_hi.any()):
+            break
+        step = step * 2
+        lo = np.where(bad_lo, lo - step, lo)
+        hi = np.where(bad_hi, hi + step, hi)
+
+    lo_key, hi_key = _to_ordered(lo), _to_ordered(hi)
+    while True:
+        open_ = hi_key - lo_key > 1
+        if not open_.any():
+            break
+        mid_key = lo_key + (hi_key - lo_key) // 2
+        left = _goes_left(_from_ordered(mid_key), mean, scale, threshold)
+        lo_key = np.where(open_ & left, mid_key, lo_key)
+        hi_key = np.where(open_ & ~left, mid_key, hi_key)
+    return _from_ordered(lo_key)
+
+
+def tree_mean(tree_values: np.ndarray) -> np.ndarray:
+    """Row means of (rows, trees) outputs, summed in tree order like RandomForestRegressor.predict."""
+    total = np.zeros(tree_values.shape[0], dtype=np.float64)
+    for t in range(tree_values.shape[1]):
+        total += tree_values[:, t]
+    return total / tree_values.shape[1]
+
+
+class CompactForest:
+    """A fitted single-output regression forest as flat arrays; see the module docstring."""
+
+    def __init__(self, feature, threshold, left, right, value, roots, missing_go_left,
+                 max_depth: int, n_features: int):
+        self.feature = feature # int32, split feature per node (0 for leaves)
+        self.threshold = threshold # float64, folded raw-space threshold per node
+        self.left = left # int32, global index of the left child (leaves point to themselves)
+        self.right = right # int32
+        self.value = value # float64, leaf output per node
+        self.roots = roots # int32, global index of each tree's root
+        self.missing_go_left = missing_go_left # bool, where NaNs go at each split
+        self.max_depth = int(max_depth)
+        self.n_features = int(n_features)
+        # Children interleaved as [left, right] per node, so each step is one gather
+        self._children = np.column_stack([left, right]).ravel()
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self.feature)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, name).nbytes for name in _ARRAY_NAMES)
+
+    @classmethod
+    def from_sklearn(cls, model, scaler=None) -> "CompactForest":
+        """
+        Converts a fitted RandomForestRegressor (or any forest of single-output regression
+        trees with `estimators_`), folding an optional fitted StandardScaler into it.
+        Raises ValueError for models it cannot represent.
+        """
+        estimators = getattr(model, "estimators_", None)
+        if not estimators:
+            raise ValueError(f"{type(model).__name__} is not a fitted tree ensemble")
+        if getattr(model, "n_outputs_", 1) != 1 or not hasattr(model, "n_features_in_"):
+            raise ValueError("Only single-output regression forests are supported")
+        n_features = int(model.n_features_in_)
+
+        mean = np.zeros(n_features)
+        scale = np.ones(n_features)
+        if scaler is not None:
+            if getattr(scaler, "mean_", None) is not None:
+                mean = np.asarray(scaler.mean_, dtype=np.float64)
+            if getattr(scaler, "scale_", None) is not None:
+                scale = np.asarray(scaler.scale_, dtype=np.float64)
+
+        features, thresholds, lefts, rights, values, missing, roots = [], [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        for estimator in estimators:
+            tree = estimator.tree_
+            if tree.value.shape[1:] != (1, 1):
+                raise ValueError("Only single-output regression trees are supported")
+            node_ids = np.arange(tree.node_count)
+            is_leaf = tree.children_left < 0
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(np.where(is_leaf, np.inf, tree.threshold))
+            lefts.append(np.where(is_leaf, node_ids, tree.children_left) + offset)
+            rights.append(np.where(is_leaf, node_ids, tree.children_right) + offset)
+            values.append(tree.value[:, 0, 0])
+            go_left = getattr(tree, "missing_go_to_left", None) # Set when the forest was fitted with NaNs
+            missing.append(np.zeros(tree.node_count, dtype=bool) if go_left is None else np.asarray(go_left, dtype=bool))
+            roots.append(offset)
+            offset += tree.node_count
+            max_depth = max(max_depth, tree.max_depth)
+
+        if offset >= np.iinfo(np.int32).max:
+            raise ValueError("Forest too large for int32 node indexes")
+        feature = np.concatenate(features).astype(np.int32)
+        threshold = np.concatenate(thresholds).astype(np.float64)
+        splits = np.isfinite(threshold)
+        threshold[splits] = fold_thresholds(threshold[splits], mean[feature[splits]], scale[feature[splits]])
+        return cls(
+            feature=feature,
+            threshold=threshold,
+            left=np.concatenate(lefts).astype(np.int32),
+            right=np.concatenate(rights).astype(np.int32),
+            value=np.concatenate(values).astype(np.float64),
+            roots=np.asarray(roots, dtype=np.int32),
+            missing_go_left=np.concatenate(missing),
+            max_depth=max_depth,
+            n_features=n_features,
+        )
+
+    def _check_input(self, X) -> np.ndarray:
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f"Expected an (n, {self.n_features}) feature matrix, got {X.shape}")
+        return X
+
+    def _leaf_values(self, block: np.ndarray) -> np.ndarray:
+        """(rows, trees) outputs of every tree for one contiguous block of rows."""
+        flat = block.ravel()
+        row_offsets = (np.arange(block.shape[0]) * self.n_features)[:, np.newaxis]
+        node = np.broadcast_to(self.roots, (block.shape[0], self.n_trees)).copy()
+        has_missing = bool(self.missing_go_left.any())
+        for _ in range(self.max_depth):
+            x = flat.take(row_offsets + self.feature.take(node))
+            go_left = x <= self.threshold.take(node)
+            if has_missing:
+                go_left |= np.isnan(x) & self.missing_go_left.take(node)
+            node = self._children.take(2 * node + ~go_left)
+        return self.value.take(node)
+
+    def predict(self, X) -> np.ndarray:
+        """Mean of the tree outputs for raw (unscaled) feature rows."""
+        X = self._check_input(X)
+        out = np.empty(X.shape[0], dtype=np.float64)
+        for start in range(0, X.shape[0], _ROW_BLOCK_SIZE):
+            block = np.ascontiguousarray(X[start:start + _ROW_BLOCK_SIZE])
+            out[start:start + block.shape[0]] = tree_mean(self._leaf_values(block))
+        return out
+
+    def predict_interval(self, X, lower: float, upper: float) -> tuple:
+        """(mean, lower quantile, upper quantile) of the tree outputs for raw feature rows."""
+        X = self._check_input(X)
+        out = np.empty((3, X.shape[0]), dtype=np.float64)
+        for start in range(0, X.shape[0], _ROW_BLOCK_SIZE):
+            block = np.ascontiguousarray(X[start:start + _ROW_BLOCK_SIZE])
+            leaf_values = self._leaf_values(block)
+            out[0, start:start + block.shape[0]] = tree_mean(leaf_values)
+            out[1:, start:start + block.shape[0]] = np.quantile(leaf_values, [lower, upper], axis=1)
+        return out[0], out[1], out[2]
+
+    def save(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        for name in _ARRAY_NAMES:
+            np.save(os.path.join(directory, f"{name}.npy"), getattr(self, name))
+        with open(os.path.join(directory, FOREST_META_FILENAME), "w") as f:
+            json.dump({"max_depth": self.max_depth, "n_features": self.n_features,
+                       "n_trees": self.n_trees, "n_nodes": self.n_nodes}, f, indent=2)
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> "CompactForest":
+        with open(os.path.join(directory, FOREST_META_FILENAME), "r") as f:
+            meta = json.load(f)
+        mmap_mode = "r" if mmap else None
+        arrays = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode) for name in _ARRAY_NAMES}
+        return cls(max_depth=meta["max_depth"], n_features=meta["n_features"], **arrays)
+
+    @staticmethod
+    def exists(directory: Optional[str]) -> bool:
+        return bool(directory) and os.path.exists(os.path.join(directory, FOREST_META_FILENAME))
@@ -0,0 +1,143 @@
+# tessyfarm_smartloop/backend_api/app/services/model_family.py
+"""
+Routing of crop cycles to per-group yield models.
+
+A registry version can carry per-group models next to its global one (see
+model_registry.register_model(groups=...)). Groups are keyed by crop type, or by crop type
+and soil type, as recorded in the manifest's group_by. A cycle whose group has no model
+(too few training cycles, or a crop type not seen in training) is scored by the global model.
+
+Group models are loaded on first use and kept in a bounded LRU (MODEL_GROUP_CACHE_SIZE),
+so memory stays flat however many crop types there are; the global model stays loaded.
+"""
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from ..core.config import settings
+from .model_registry import ModelBundle, load_bundle
+from .stage_profiler import StageProfiler, DISABLED_PROFILER
+
+GROUP_BY_OPTIONS = {
+    "crop": ["crop_type"],
+    "crop_soil": ["crop_type", "soil_type"],
+}
+
+
+def group_key(values, group_by: List[str]) -> str:
+    """Normalised group key, e.g. "maize" or "maize|loam"; missing values become ""."""
+    parts = []
+    for value in values[:len(group_by)]:
+        parts.append("" if value is None or (isinstance(value, float) and np.isnan(value)) else str(value).strip().lower())
+    return "|".join(parts)
+
+
+def group_keys(df: pd.DataFrame, group_by: List[str]) -> pd.Series:
+    """group_key for every row of a frame that has the group_by columns."""
+    return pd.Series([group_key(row, group_by) for row in df[group_by].itertuples(index=False, name=None)], index=df.index)
+
+
+def feature_matrix(features_df: pd.DataFrame, feature_names: List[str], scaler) -> np.ndarray:
+    """
+    Unscaled feature matrix in model order, with NaNs imputed from the training means the
+    scaler was fitted on (the same rule the batch predictor uses).
+    """
+    X = features_df[feature_names].to_numpy(dtype=np.float64)
+    missing = np.isnan(X)
+    if missing.any():
+        X = np.where(missing, np.asarray(scaler.mean_)[np.newaxis, :], X)
+    return X
+
+
+class ModelFamily:
+    """The global bundle of a version plus its per-group bundles, loaded lazily through an LRU."""
+
+    def __init__(self, global_bundle: ModelBundle, registry_dir: Optional[str] = None, cache_size: int = None,
+                 mmap: bool = True, compact: bool = True):
+        self.global_bundle = global_bundle
+        self.version = global_bundle.version
+        self.feature_names = global_bundle.feature_names
+        self.group_by = global_bundle.manifest.get("group_by") or []
+        self.groups = global_bundle.manifest.get("groups") or {}
+        self._registry_dir = registry_dir
+        self._cache_size = cache_size or settings.MODEL_GROUP_CACHE_SIZE
+        self._mmap = mmap
+        self._compact = compact
+        self._loaded: "OrderedDict[str, ModelBundle]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, version: Optional[str] = None, registry_dir: Optional[str] = None, mmap: bool = True,
+             compact: bool = True, cache_size: int = None) -> "ModelFamily":
+        """Loads the global bundle of a version (default: the active one); group bundles load on demand."""
+        bundle = load_bundle(version, mmap=mmap, registry_dir=registry_dir, compact=compact)
+        return cls(bundle, registry_dir=registry_dir, cache_size=cache_size, mmap=mmap, compact=compact)
+
+    def key_for(self, attributes) -> Optional[str]:
+        """Group key for (crop_type, soil_type), or None when this version has no group models."""
+        if not self.group_by:
+            return None
+        return group_key(attributes, self.group_by)
+
+    def bundle_for_key(self, key: Optional[str]) -> ModelBundle:
+        if key is None or key not in self.groups:
+            return self.global_bundle
+        with self._lock:
+            bundle = self._loaded.get(key)
+            if bundle is not None:
+                self._loaded.move_to_end(key)
+                return bundle
+        # Loaded outside the lock; two threads racing on the same group just load it twice
+        bundle = load_bundle(self.version, mmap=self._mmap, registry_dir=self._registry_dir,
+                             compact=self._compact, group=key)
+        with self._lock:
+            self._loaded[key] = bundle
+            self._loaded.move_to_end(key)
+            while len(self._loaded) > self._cache_size:
+                self._loaded.popitem(last=False)
+        return bundle
+
+    def bundle_for(self, crop_type: Optional[str], soil_type: Optional[str] = None) -> ModelBundle:
+        return self.bundle_for_key(self.key_for((crop_type, soil_type)))
+
+    def partition(self, features_df: pd.DataFrame) -> List[Tuple[ModelBundle, np.ndarray]]:
+        """
+        (bundle, row mask) for each model that scores rows of a frame with crop_type/soil_type
+        columns, in first-seen order. Rows without a group model go to the global bundle.
+        """
+        if self.group_by:
+            keys = [key if key in self.groups else None for key in group_keys(features_df, self.group_by)]
+        else:
+            keys = [None] * len(features_df)
+        return [(self.bundle_for_key(key), np.array([k == key for k in keys], dtype=bool))
+                for key in dict.fromkeys(keys)] # Distinct keys, first-seen order
+
+    def predict(self, features_df: pd.DataFrame) -> np.ndarray:
+        """
+        Scores a frame with feature_names columns plus crop_type/soil_type, each row by its group's
+        model (NaNs imputed with that model's training means). Returns predictions in row order.
+        """
+        predictions = np.empty(len(features_df), dtype=np.float64)
+        for bundle, mask in self.partition(features_df):
+            X = feature_matrix(features_df[mask], bundle.feature_names, bundle.scaler)
+            predictions[mask] = bundle.predict(X)
+        return predictions
+
+    def predict_interval(self, features_df: pd.DataFrame, profiler: Optional[StageProfiler] = None) -> tuple:
+        """
+        Like predict, plus per-tree prediction interval bounds (see ModelBundle.predict_interval).
+        Returns (predictions, low, high); bounds are NaN for rows scored by a non-forest model.
+        profiler records the imputation, scaling and predict stages.
+        """
+        profiler = profiler or DISABLED_PROFILER
+        out = np.full((3, len(features_df)), np.nan)
+        for bundle, mask in self.partition(features_df):
+            with profiler.stage("imputation", rows=int(mask.sum())):
+                X = feature_matrix(features_df[mask], bundle.feature_names, bundle.scaler)
+            for i, values in enumerate(bundle.predict_interval(X, profiler=profiler)):
+                if values is not None:
+                    out[i, mask] = values
+        return out[0], out[1], out[2]
@@ -0,0 +1,263 @@
+# tessyfarm_smartloop/backend_api/app/services/model_registry.py
+"""
+Local registry for trained yield model bundles.
+
+Layout under settings.MODEL_REGISTRY_DIR:
+    ACTIVE                      # id of the active version (replaced atomically)
+    <version>/manifest.json     # feature names, feature version, metrics, training params
+    <version>/model.joblib      # uncompressed, so its NumPy arrays can be memory-mapped
+    <version>/scaler.joblib
+    <version>/forest/           # CompactForest arrays with the scaler folded in (tree ensembles only)
+    <version>/<artifact>        # optional extra files, e.g. the trainer's search_results.csv
+    <version>/groups/<n>/       # optional per-group models (model, scaler, forest), see services/model_family.py
+
+Bundles are written to a temporary directory and renamed into place, so readers never see
+a half-written version. Loading with mmap=True maps the arrays read-only from the page cache,
+which is shared by every process that loads the same version.
+"""
+import json
+import os
+import shutil
+import tempfile
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import joblib
+import numpy as np
+
+from ..core.config import settings
+from .compact_forest import CompactForest, tree_mean
+from .stage_profiler import StageProfiler, DISABLED_PROFILER
+
+ACTIVE_POINTER_FILENAME = "ACTIVE"
+MANIFEST_FILENAME = "manifest.json"
+MODEL_FILENAME = "model.joblib"
+SCALER_FILENAME = "scaler.joblib"
+FOREST_DIRNAME = "forest"
+GROUPS_DIRNAME = "groups"
+
+
+class ModelRegistryError(Exception):
+    """Raised when a requested version (or the active pointer) does not exist."""
+
+
+@dataclass
+class ModelBundle:
+    version: str
+    model: Any
+    scaler: Any
+    feature_names: List[str]
+    feature_version: Optional[str] = None
+    metrics: Dict[str, Any] = field(default_factory=dict)
+    manifest: Dict[str, Any] = field(default_factory=dict)
+    forest: Optional[CompactForest] = None # Set when loaded with compact=True; model is then None
+    group: Optional[str] = None # Group key for per-group models, None for the global one
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """Scores raw (unscaled, imputed) feature rows in feature_names order."""
+        if self.forest is not None:
+            return self.forest.predict(X)
+        return self.model.predict(self.scaler.transform(X))
+
+    def predict_interval(self, X: np.ndarray, lower: float = None, upper: float = None,
+                         profiler: Optional[StageProfiler] = None) -> tuple:
+        """
+        (predictions, interval low, interval high) for raw feature rows. The interval spans the
+        lower/upper quantiles (default: settings.PREDICTION_INTERVAL_*) of the per-tree outputs;
+        models that are not tree ensembles get None bounds.
+        profiler records the scaling and predict stages (see services/stage_profiler.py).
+        """
+        lower = settings.PREDICTION_INTERVAL_LOWER if lower is None else lower
+        upper = settings.PREDICTION_INTERVAL_UPPER if upper is None else upper
+        profiler = profiler or DISABLED_PROFILER
+        if self.forest is not None:
+            # The scaler is folded into the forest's thresholds, so there is no scaling stage
+            with profiler.stage("predict", rows=len(X)):
+                return self.forest.predict_interval(X, lower, upper)
+        with profiler.stage("scaling", rows=len(X)):
+            X_scaled = self.scaler.transform(X)
+        with profiler.stage("predict", rows=len(X)):
+            estimators = getattr(self.model, "estimators_", None)
+            if not estimators:
+                return self.model.predict(X_scaled), None, None
+            # (rows, trees); each tree scores all rows at once
+            tree_values = np.stack([estimator.predict(X_scaled) for estimator in estimators], axis=1)
+            low, high = np.quantile(tree_values, [lower, upper], axis=1)
+            return tree_mean(tree_values), low, high
+
+
+def confidence_scores(predictions: np.ndarray, low: Optional[np.ndarray], high: Optional[np.ndarray]) -> Optional[np.ndarray]:
+    """
+    Confidence in (0, 1] from the relative interval width w = (high - low) / |prediction|:
+    1 / (1 + w), so a zero-width interval gives 1 and an interval as wide as the prediction 0.5.
+    """
+    if low is None or high is None:
+        return None
+    width = (high - low) / np.maximum(np.abs(predictions), 1e-9)
+    return 1.0 / (1.0 + width)
+
+
+def _registry_dir(registry_dir: Optional[str]) -> str:
+    return registry_dir or settings.MODEL_REGISTRY_DIR
+
+
+def _write_atomic(path: str, text: str):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def _dump_model_files(directory: str, model, scaler) -> bool:
+    """Writes model, scaler and (when convertible) the compact forest. Returns whether the forest was written."""
+    os.makedirs(directory, exist_ok=True)
+    # No compression: compressed pickles cannot be memory-mapped
+    joblib.dump(model, os.path.join(directory, MODEL_FILENAME))
+    joblib.dump(scaler, os.path.join(directory, SCALER_FILENAME))
+    try:
+        CompactForest.from_sklearn(model, scaler).save(os.path.join(directory, FOREST_DIRNAME))
+        return True
+    except ValueError as e:
+        print(f"Model registry: no compact forest for {type(model).__name__} ({e}).")
+        return False
+
+
+def register_model(model, scaler, feature_names: List[str], metrics: Optional[Dict[str, Any]] = None,
+                   feature_version: Optional[str] = None, params: Optional[Dict[str, Any]] = None,
+                   activate: bool = True, registry_dir: Optional[str] = None,
+                   artifacts: Optional[Dict[str, str]] = None,
+                   groups: Optional[Dict[str, Dict[str, Any]]] = None, group_by: Optional[List[str]] = None) -> str:
+    """
+    Saves a trained bundle under a new version id and (by default) makes it the active one.
+    artifacts maps extra file names to text content stored alongside the bundle.
+    groups maps group keys (see model_family.group_key) to {"model", "scaler", "metrics"} for
+    per-group models trained on the same features; model/scaler are then the global fallback.
+    """
+    root = _registry_dir(registry_dir)
+    os.makedirs(root, exist_ok=True)
+    version = datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")
+
+    staging_dir = tempfile.mkdtemp(prefix=f".{version}-", dir=root)
+    try:
+        compact_forest = _dump_model_files(staging_dir, model, scaler)
+        group_entries = {}
+        for n, (key, group) in enumerate(sorted((groups or {}).items())):
+            # Numbered directories, so group keys never have to be valid file names
+            path = os.path.join(GROUPS_DIRNAME, str(n))
+            group_entries[key] = {
+                "path": path,
+                "compact_forest": _dump_model_files(os.path.join(staging_dir, path), group["model"], group["scaler"]),
+                "metrics": group.get("metrics") or {},
+            }
+        for filename, content in (artifacts or {}).items():
+            with open(os.path.join(staging_dir, filename), "w") as f:
+                f.write(content)
+        manifest = {
+            "version": version,
+            "created_at": datetime.utcnow().isoformat(),
+            "model_class": type(model).__name__,
+            "feature_names": list(feature_names),
+            "feature_version": feature_version,
+            "compact_forest": compact_forest,
+            "artifacts": sorted(artifacts or {}),
+            "group_by": list(group_by) if group_entries else None,
+            "groups": group_entries,
+            "metrics": metrics or {},
+            "params": params or {},
+        }
+        _write_atomic(os.path.join(staging_dir, MANIFEST_FILENAME), json.dumps(manifest, indent=2, default=str))
+        os.rename(staging_dir, os.path.join(root, version))
+    except Exception:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+
+    if activate:
+        activate_version(version, registry_dir=root)
+    return version
+
+
+def activate_version(version: str, registry_dir: Optional[str] = None):
+    root = _registry_dir(registry_dir)
+    if not os.path.exists(os.path.join(root, version, MANIFEST_FILENAME)):
+        raise ModelRegistryError(f"Model version '{version}' not found in {root}")
+    _write_atomic(os.path.join(root, ACTIVE_POINTER_FILENAME), version)
+
+
+def get_active_version(registry_dir: Optional[str] = None) -> Optional[str]:
+    pointer = os.path.join(_registry_dir(registry_dir), ACTIVE_POINTER_FILENAME)
+    if not os.path.exists(pointer):
+        return None
+    with open(pointer, "r") as f:
+        return f.read().strip() or None
+
+
+def read_manifest(version: str, registry_dir: Optional[str] = None) -> Dict[str, Any]:
+    path = os.path.join(_registry_dir(registry_dir), version, MANIFEST_FILENAME)
+    if not os.path.exists(path):
+        raise ModelRegistryError(f"Model version '{version}' not found")
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def read_artifact(version: str, filename: str, registry_dir: Optional[str] = None) -> Optional[str]:
+    """Text of an extra file stored with a version (see register_model(artifacts=...)), or None."""
+    path = os.path.join(_registry_dir(registry_dir), version, filename)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return f.read()
+
+
+def list_versions(registry_dir: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Manifests of all registered versions, oldest first."""
+    root = _registry_dir(registry_dir)
+    if not os.path.isdir(root):
+        return []
+    versions = sorted(
+        name for name in os.listdir(root)
+        if not name.startswith(".") and os.path.exists(os.path.join(root, name, MANIFEST_FILENAME))
+    )
+    return [read_manifest(version, root) for version in versions]
+
+
+def load_bundle(version: Optional[str] = None, mmap: bool = True, registry_dir: Optional[str] = None,
+                compact: bool = False, group: Optional[str] = None) -> ModelBundle:
+    """
+    Loads a version (default: the active one). With mmap, large arrays are mapped read-only instead of copied.
+    With compact, the CompactForest is loaded instead of the pickled model when the version has one.
+    group selects one of the version's per-group models instead of the global one.
+    """
+    root = _registry_dir(registry_dir)
+    version = version or get_active_version(root)
+    if not version:
+        raise ModelRegistryError(f"No active model version in {root}")
+
+    manifest = read_manifest(version, root)
+    bundle_dir = os.path.join(root, version)
+    metrics = manifest.get("metrics", {})
+    if group is not None:
+        entry = (manifest.get("groups") or {}).get(group)
+        if entry is None:
+            raise ModelRegistryError(f"Model version '{version}' has no model for group '{group}'")
+        bundle_dir = os.path.join(bundle_dir, entry["path"])
+        metrics = entry.get("metrics", {})
+
+    mmap_mode = "r" if mmap else None
+    forest_dir = os.path.join(bundle_dir, FOREST_DIRNAME)
+    if compact and CompactForest.exists(forest_dir):
+        model, forest = None, CompactForest.load(forest_dir, mmap=mmap)
+    else:
+        model, forest = joblib.load(os.path.join(bundle_dir, MODEL_FILENAME), mmap_mode=mmap_mode), None
+    scaler = joblib.load(os.path.join(bundle_dir, SCALER_FILENAME), mmap_mode=mmap_mode)
+    return ModelBundle(
+        version=version,
+        model=model,
+        scaler=scaler,
+        feature_names=manifest["feature_names"],
+        feature_version=manifest.get("feature_version"),
+        metrics=metrics,
+        manifest=manifest,
+        forest=forest,
+        group=group,
+    )
@@ -0,0 +1,80 @@
+# tessyfarm_smartloop/backend_api/app/services/retention.py
+"""
+Retention rules for derived data, applied by the scheduler's retention job.
+
+- job_runs older than JOB_HISTORY_RETENTION_DAYS
+- yield_predictions older than PREDICTION_RETENTION_DAYS that are superseded (a newer
+  prediction exists for the same cycle); the latest prediction of every cycle is kept
+- registry versions beyond the newest MODEL_REGISTRY_KEEP_VERSIONS (never the active one)
+- sensor_alerts older than ALERT_RETENTION_DAYS
+
+Sensor readings are not touched: they are the training inputs for completed cycles.
+"""
+import os
+import shutil
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from sqlalchemy import delete, exists, and_
+from sqlalchemy.orm import Session, aliased
+
+from ..core.config import settings
+from ..models.farm import JobRun, YieldPrediction, SensorAlert
+from .model_registry import get_active_version, list_versions
+
+
+def prune_job_runs(db: Session, older_than_days: Optional[int] = None) -> int:
+    days = settings.JOB_HISTORY_RETENTION_DAYS if older_than_days is None else older_than_days
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    result = db.execute(delete(JobRun).where(JobRun.started_at < cutoff, JobRun.status != "running"))
+    db.commit()
+    return result.rowcount
+
+
+def prune_superseded_predictions(db: Session, older_than_days: Optional[int] = None) -> int:
+    days = settings.PREDICTION_RETENTION_DAYS if older_than_days is None else older_than_days
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    newer = aliased(YieldPrediction)
+    superseded = exists().where(and_(
+        newer.crop_cycle_id == YieldPrediction.crop_cycle_id,
+        newer.prediction_date > YieldPrediction.prediction_date,
+    ))
+    result = db.execute(
+        delete(YieldPrediction).where(YieldPrediction.prediction_date < cutoff, superseded)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount
+
+
+def prune_alerts(db: Session, older_than_days: Optional[int] = None) -> int:
+    days = settings.ALERT_RETENTION_DAYS if older_than_days is None else older_than_days
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    result = db.execute(delete(SensorAlert).where(SensorAlert.created_at < cutoff))
+    db.commit()
+    return result.rowcount
+
+
+def prune_registry_versions(keep: Optional[int] = None, registry_dir: Optional[str] = None) -> int:
+    keep = settings.MODEL_REGISTRY_KEEP_VERSIONS if keep is None else keep
+    root = registry_dir or settings.MODEL_REGISTRY_DIR
+    active = get_active_version(root)
+    versions = [manifest["version"] for manifest in list_versions(root)] # Oldest first
+    removed = 0
+    for version in versions[:max(len(versions) - keep, 0)]:
+        if version == active:
+            continue
+        # Processes that memory-mapped this version keep their mapping until they reload
+        shutil.rmtree(os.path.join(root, version), ignore_errors=True)
+        removed += 1
+    return removed
+
+
+def apply_retention(db: Session) -> Dict[str, int]:
+    """Applies every rule; returns the number of rows/versions removed per rule."""
+    return {
+        "job_runs": prune_job_runs(db),
+        "yield_predictions": prune_superseded_predictions(db),
+        "sensor_alerts": prune_alerts(db),
+        "model_versions": prune_registry_versions(),
+    }
@@ -0,0 +1,155 @@
+# tessyfarm_smartloop/backend_api/app/services/sensor_aggregation.py
+"""
+Time-bucketed sensor aggregates across devices, for a farm, a field or an explicit device set.
+
+One grouped query per request: readings are filtered by scope and by a half-open time range on
+the raw timestamp column (so the BRIN index on timestamp and the (device_id, timestamp) index
+apply), bucketed as floor((epoch - start) / bucket_seconds) and grouped by series and bucket.
+A series is a field, a device, or the whole scope (group_by).
+
+Farm and field scopes use the placeholder device rule of the feature engineering
+(yield_features.device_in_field): a device belongs to field N when its id contains "field_N" not
+followed by another digit, so field_1 does not claim field_10's devices. Readings from devices
+matching no field are not counted.
+
+Results are sparse and columnar: per series, the indexes of the buckets holding readings and
+one array per "<metric>_<aggregate>", aligned with them. Bucket i starts at start + i * bucket.
+"""
+import math
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import select, func, and_, extract, literal, literal_column
+from sqlalchemy.orm import Session
+
+from ..core.config import settings
+from ..models.farm import Field, SensorReading
+from .columnar import METRIC_KEYS
+from .yield_features import device_in_field
+
+AGGREGATION_SCOPES = ("farm", "field", "devices")
+AGGREGATION_GROUP_BY = ("field", "device", "scope")
+AGGREGATE_FUNCTIONS = {
+    "avg": func.avg,
+    "min": func.min,
+    "max": func.max,
+    "sum": func.sum,
+    "count": func.count, # Non-null values of the metric; reading_count counts readings
+}
+EPOCH = datetime(1970, 1, 1) # Timestamps are naive UTC
+
+
+def bucket_count(start: datetime, end: datetime, bucket: timedelta) -> int:
+    return math.ceil((end - start) / bucket)
+
+
+def _naive_utc(value: datetime) -> datetime:
+    return value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo is not None else value
+
+
+def validate_aggregation(scope: str, scope_id: Optional[int], device_ids: Optional[List[str]], start: datetime,
+                         end: datetime, bucket: timedelta, metrics: List[str], aggregates: List[str], group_by: str):
+    """Raises ValueError for an unknown scope, metric or aggregate, an empty range, or too many buckets or devices."""
+    if scope not in AGGREGATION_SCOPES:
+        raise ValueError(f"Unknown scope '{scope}'; expected one of {list(AGGREGATION_SCOPES)}")
+    if group_by not in AGGREGATION_GROUP_BY:
+        raise ValueError(f"Unknown group_by '{group_by}'; expected one of {list(AGGREGATION_GROUP_BY)}")
+    if scope == "devices":
+        if not device_ids:
+            raise ValueError("device_ids is required for scope 'devices'")
+        if len(device_ids) > settings.SENSOR_AGGREGATION_MAX_DEVICES:
+            raise ValueError(f"At most {settings.SENSOR_AGGREGATION_MAX_DEVICES} device_ids per request")
+    elif scope_id is None:
+        raise ValueError(f"scope_id is required for scope '{scope}'")
+    for metric in metrics:
+        if metric not in METRIC_KEYS:
+            raise ValueError(f"Unknown metric '{metric}'; expected one of {list(METRIC_KEYS)}")
+    for aggregate in aggregates:
+        if aggregate not in AGGREGATE_FUNCTIONS:
+            raise ValueError(f"Unknown aggregate '{aggregate}'; expected one of {list(AGGREGATE_FUNCTIONS)}")
+    if end <= start:
+        raise ValueError("end must be after start")
+    if bucket.total_seconds() <= 0:
+        raise ValueError("bucket must be positive")
+    buckets = bucket_count(start, end, bucket)
+    if buckets > settings.SENSOR_AGGREGATION_MAX_BUCKETS:
+        raise ValueError(f"{buckets} buckets requested; at most {settings.SENSOR_AGGREGATION_MAX_BUCKETS} "
+                         f"(use a larger bucket or a shorter range)")
+
+
+def build_aggregation_query(scope: str, scope_id: Optional[int], device_ids: Optional[List[str]], start: datetime,
+                            end: datetime, bucket: timedelta, metrics: List[str], aggregates: List[str], group_by: str):
+    """The grouped SELECT: series key, bucket index, reading_count and one column per metric/aggregate."""
+    # Inlined rather than bound, so the SELECT and GROUP BY expressions are textually identical
+    bucket_seconds = literal_column(repr(bucket.total_seconds()))
+    start_epoch = literal_column(repr((start - EPOCH).total_seconds()))
+    bucket_index = func.floor((extract("epoch", SensorReading.timestamp) - start_epoch) / bucket_seconds).label("bucket")
+
+    if group_by == "field":
+        series = Field.id
+    elif group_by == "device":
+        series = SensorReading.device_id
+    else:
+        series = literal(scope)
+    columns = [series.label("series"), bucket_index, func.count(SensorReading.id).label("reading_count")]
+    for metric in metrics:
+        for aggregate in aggregates:
+            columns.append(AGGREGATE_FUNCTIONS[aggregate](getattr(SensorReading, metric)).label(f"{metric}_{aggregate}"))
+
+    conditions = [SensorReading.timestamp >= start, SensorReading.timestamp < end]
+    if scope == "devices":
+        conditions.append(SensorReading.device_id.in_(device_ids))
+    elif scope == "field":
+        conditions.append(Field.id == scope_id)
+    else:
+        conditions.append(Field.farm_id == scope_id)
+
+    stmt = select(*columns).select_from(SensorReading)
+    if scope != "devices" or group_by == "field":
+        stmt = stmt.join(Field, device_in_field(Field.id))
+    # A constant series (group_by="scope") is left out of GROUP BY; Postgres rejects string constants there
+    group_columns = [bucket_index] if group_by == "scope" else [series, bucket_index]
+    return stmt.where(and_(*conditions)).group_by(*group_columns).order_by(*group_columns)
+
+
+def aggregate_sensor_readings(db: Session, scope: str, scope_id: Optional[int], device_ids: Optional[List[str]],
+                              start: datetime, end: datetime, bucket: timedelta, metrics: List[str],
+                              aggregates: List[str], group_by: str = "field") -> Dict[str, Any]:
+    """
+    Validates the request and runs the grouped query; see the module docstring for the result layout.
+    Raises ValueError for invalid requests.
+    """
+    metrics = list(dict.fromkeys(metrics))
+    aggregates = list(dict.fromkeys(aggregates))
+    start, end = _naive_utc(start), _naive_utc(end)
+    validate_aggregation(scope, scope_id, device_ids, start, end, bucket, metrics, aggregates, group_by)
+    stmt = build_aggregation_query(scope, scope_id, device_ids, start, end, bucket, metrics, aggregates, group_by)
+    value_keys = {f"{metric}_{aggregate}": int if aggregate == "count" else float
+                  for metric in metrics for aggregate in aggregates}
+
+    series: Dict[Any, Dict[str, Any]] = {}
+    for row in db.execute(stmt):
+        entry = series.get(row.series)
+        if entry is None:
+            entry = series[row.series] = {
+                "key": str(row.series),
+                "buckets": [],
+                "reading_count": [],
+                "values": {key: [] for key in value_keys},
+            }
+        entry["buckets"].append(int(row.bucket))
+        entry["reading_count"].append(row.reading_count)
+        for key, convert in value_keys.items():
+            value = getattr(row, key)
+            entry["values"][key].append(None if value is None else convert(value))
+
+    return {
+        "scope": scope,
+        "scope_id": scope_id,
+        "group_by": group_by,
+        "start": start,
+        "end": end,
+        "bucket_seconds": bucket.total_seconds(),
+        "bucket_count": bucket_count(start, end, bucket),
+        "series": list(series.values()),
+    }
@@ -0,0 +1,166 @@
+# tessyfarm_smartloop/backend_api/app/services/stage_profiler.py
+"""
+Opt-in stage profiling for the ML batch jobs (yield_model_trainer.py, batch_yield_predictor.py).
+
+Enabled with the scripts' --profile flag or PROFILE_ENV_VAR=1 (inherited by pool workers and by
+jobs run from job_scheduler.py). Each stage records calls, wall time, CPU time (this process and
+reaped child processes), rows and the process' peak RSS. Stages run in pool workers are returned
+with the worker's result and merged by name. At the end a JSON summary is written to
+settings.PROFILE_DIR, next to the registry.
+
+With --profile-sampling (or PROFILE_SAMPLING_ENV_VAR=1) the run is also sampled by pyinstrument,
+when installed, and its HTML report is written next to the summary. The sampler only sees the
+main process.
+
+When disabled, stage() only yields an empty record, so callers can leave it in place.
+"""
+import json
+import os
+import resource
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+try:
+    from pyinstrument import Profiler as SamplingProfiler # Optional: sampling-profiler report
+except ImportError:
+    SamplingProfiler = None
+
+from ..core.config import settings
+
+PROFILE_ENV_VAR = "TESSYFARM_PROFILE"
+PROFILE_SAMPLING_ENV_VAR = "TESSYFARM_PROFILE_SAMPLING"
+
+
+def _env_flag(name: str) -> bool:
+    return os.environ.get(name, "").strip().lower() in ("1", "true", "yes", "on")
+
+
+def _cpu_seconds() -> float:
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return time.process_time() + children.ru_utime + children.ru_stime
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def enable_profiling(sampling: bool = False):
+    """Turns profiling on for this process and the pool workers it starts (the CLI switches)."""
+    os.environ[PROFILE_ENV_VAR] = "1"
+    if sampling:
+        os.environ[PROFILE_SAMPLING_ENV_VAR] = "1"
+
+
+class StageProfiler:
+    """Per-stage wall/CPU time, rows and peak RSS for one job run."""
+
+    def __init__(self, job: str, enabled: Optional[bool] = None):
+        self.job = job
+        self.enabled = _env_flag(PROFILE_ENV_VAR) if enabled is None else enabled
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        self.context: Dict[str, Any] = {} # Extra fields for the summary, e.g. the model version
+        self._started_at = None
+        self._started = None
+        self._sampler = None
+
+    def start(self) -> "StageProfiler":
+        if not self.enabled:
+            return self
+        self._started_at = datetime.utcnow()
+        self._started = (time.perf_counter(), _cpu_seconds())
+        if _env_flag(PROFILE_SAMPLING_ENV_VAR):
+            if SamplingProfiler is None:
+                print("Sampling profiler requested but pyinstrument is not installed; stage timings only.")
+            else:
+                self._sampler = SamplingProfiler()
+                self._sampler.start()
+        return self
+
+    @contextmanager
+    def stage(self, name: str, rows: Optional[int] = None):
+        """
+        Times the block as stage `name`. Yields a dict; set record["rows"] inside the block
+        when the row count is only known there.
+        """
+        record = {"rows": rows}
+        if not self.enabled:
+            yield record
+            return
+        wall, cpu, rss = time.perf_counter(), _cpu_seconds(), _peak_rss_mb()
+        try:
+            yield record
+        finally:
+            peak = _peak_rss_mb()
+            self._add(name, {
+                "calls": 1,
+                "wall_seconds": time.perf_counter() - wall,
+                "cpu_seconds": _cpu_seconds() - cpu,
+                "rows": record["rows"],
+                "peak_rss_mb": peak,
+                "peak_rss_growth_mb": peak - rss,
+            })
+
+    def _add(self, name: str, entry: Dict[str, Any]):
+        total = self.stages.get(name)
+        if total is None:
+            self.stages[name] = dict(entry)
+            return
+        for key in ("calls", "wall_seconds", "cpu_seconds", "peak_rss_growth_mb"):
+            total[key] += entry[key]
+        if entry["rows"] is not None:
+            total["rows"] = (total["rows"] or 0) + entry["rows"]
+        total["peak_rss_mb"] = max(total["peak_rss_mb"], entry["peak_rss_mb"])
+
+    def merge(self, stages: Optional[Dict[str, Dict[str, Any]]]):
+        """Adds stages recorded by another process (e.g. a pool worker's self.stages)."""
+        for name, entry in (stages or {}).items():
+            self._add(name, entry)
+
+    def finish(self, profile_dir: Optional[str] = None) -> Optional[str]:
+        """Writes the run summary (and sampling report); returns the summary path, None when disabled."""
+        if not self.enabled or self._started is None:
+            return None
+        wall = time.perf_counter() - self._started[0]
+        cpu = _cpu_seconds() - self._started[1]
+        root = profile_dir or settings.PROFILE_DIR
+        os.makedirs(root, exist_ok=True)
+        name = f"{self.job}-{self._started_at.strftime('%Y%m%dT%H%M%S%f')}"
+
+        sampling_report = None
+        if self._sampler is not None:
+            self._sampler.stop()
+            sampling_report = os.path.join(root, f"{name}.html")
+            with open(sampling_report, "w") as f:
+                f.write(self._sampler.output_html())
+            self._sampler = None
+
+        summary = {
+            "job": self.job,
+            "started_at": self._started_at.isoformat(),
+            "finished_at": datetime.utcnow().isoformat(),
+            "pid": os.getpid(),
+            "wall_seconds": round(wall, 4),
+            "cpu_seconds": round(cpu, 4),
+            "peak_rss_mb": round(_peak_rss_mb(), 1),
+            **self.context,
+            "stages": {
+                stage: {key: round(value, 4) if isinstance(value, float) else value for key, value in entry.items()}
+                for stage, entry in self.stages.items()
+            },
+            "sampling_report": sampling_report,
+        }
+        path = os.path.join(root, f"{name}.json")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(summary, f, indent=2, default=str)
+        os.replace(tmp_path, path)
+        print(f"Stage profile written to {path}")
+        return path
+
+
+DISABLED_PROFILER = StageProfiler("disabled", enabled=False) # Default for functions taking an optional profiler
@@ -0,0 +1,159 @@
+# tessyfarm_smartloop/backend_api/app/services/training_snapshot.py
+"""
+Local columnar snapshot of the engineered training matrix (build_training_features output),
+so repeated trainer runs do not re-scan the database when nothing changed.
+
+Layout under settings.TRAINING_SNAPSHOT_DIR:
+    snapshot.json           # feature version, watermark, cycle ids considered, part files
+    part-<stamp>.parquet    # rows; later parts hold appended cycles
+
+The watermark is the latest cycle/field updated_at over completed cycles plus the highest
+sensor_readings.id. When both match, the parts are read as-is. Otherwise only these cycles
+go through build_training_features:
+- completed cycles not considered before (new harvests)
+- considered cycles edited since the snapshot
+- considered cycles with a reading newer than the snapshot's reading id in their window
+Cycles that are no longer completed are dropped. If nothing was replaced or dropped the new
+rows are written as an extra part, otherwise the parts are compacted into one.
+"""
+import json
+import os
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+import pandas as pd
+from sqlalchemy import select, func
+from sqlalchemy.orm import Session
+
+from ..core.config import settings
+from ..models.farm import SensorReading
+from .yield_features import FEATURE_VERSION, build_training_features, fetch_cycles, newest_readings_after
+
+SNAPSHOT_META_FILENAME = "snapshot.json"
+SNAPSHOT_FORMAT = 2 # Bump when build_training_features' columns change; older snapshots are rebuilt
+
+
+def _snapshot_dir(snapshot_dir: Optional[str]) -> str:
+    return snapshot_dir or settings.TRAINING_SNAPSHOT_DIR
+
+
+def _read_meta(root: str) -> Optional[Dict[str, Any]]:
+    path = os.path.join(root, SNAPSHOT_META_FILENAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def _write_meta(root: str, meta: Dict[str, Any]):
+    path = os.path.join(root, SNAPSHOT_META_FILENAME)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp_path, path) # Readers see the old or the new part list, never a mix
+
+
+def _write_part(root: str, df: pd.DataFrame) -> str:
+    name = f"part-{datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')}.parquet"
+    df.to_parquet(os.path.join(root, name), index=False)
+    return name
+
+
+def _read_parts(root: str, parts: list) -> pd.DataFrame:
+    frames = [pd.read_parquet(os.path.join(root, name)) for name in parts]
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True)
+
+
+def _current_watermark(db: Session, cycles_df: pd.DataFrame) -> Dict[str, Any]:
+    max_reading_id = db.execute(select(func.coalesce(func.max(SensorReading.id), 0))).scalar_one()
+    max_updated = cycles_df["source_updated_at"].max() if not cycles_df.empty else None
+    return {
+        "max_source_updated_at": None if pd.isna(max_updated) else pd.Timestamp(max_updated).isoformat(),
+        "max_reading_id": int(max_reading_id),
+    }
+
+
+def load_training_snapshot(db: Session, refresh: bool = False, snapshot_dir: Optional[str] = None,
+                           read_db: Optional[Session] = None) -> pd.DataFrame:
+    """
+    The training matrix, served from the snapshot and brought up to date incrementally.
+    refresh=True rebuilds it from scratch. read_db (e.g. a replica session) serves the reads.
+    """
+    reader = read_db or db
+
+    root = _snapshot_dir(snapshot_dir)
+    os.makedirs(root, exist_ok=True)
+    cycles_df = fetch_cycles(reader, completed=True)
+    # Taken before any features are built, so later readings move the next run's watermark
+    watermark = _current_watermark(reader, cycles_df)
+    current_ids = set(int(i) for i in cycles_df["crop_cycle_id"])
+
+    meta = None if refresh else _read_meta(root)
+    if meta is not None and (meta.get("feature_version"), meta.get("format")) != (FEATURE_VERSION, SNAPSHOT_FORMAT):
+        print(f"Training snapshot was built with feature version {meta.get('feature_version')}, "
+              f"format {meta.get('format')}; rebuilding.")
+        meta = None
+
+    if meta is not None and meta["watermark"] == watermark and set(meta["cycle_ids"]) == current_ids:
+        df = _read_parts(root, meta["parts"])
+        print(f"Training snapshot unchanged: {len(df)} rows from {len(meta['parts'])} part(s).")
+        return df
+
+    if meta is None:
+        df = build_training_features(db, cycle_ids=sorted(current_ids), read_db=read_db)
+        parts = [_write_part(root, df)] if not df.empty else []
+        old_parts = []
+        print(f"Training snapshot built: {len(df)} rows.")
+    else:
+        considered = set(meta["cycle_ids"])
+        removed = considered - current_ids
+        new_ids = current_ids - considered
+
+        edited_ids = set()
+        if meta["watermark"]["max_source_updated_at"] is not None:
+            known = cycles_df[cycles_df["crop_cycle_id"].isin(considered)]
+            cutoff = pd.Timestamp(meta["watermark"]["max_source_updated_at"])
+            edited_ids = set(int(i) for i in known.loc[known["source_updated_at"] > cutoff, "crop_cycle_id"])
+
+        late_ids = set()
+        still_considered = sorted(considered & current_ids)
+        if still_considered and watermark["max_reading_id"] > meta["watermark"]["max_reading_id"]:
+            newest_df = newest_readings_after(reader, True, datetime.utcnow(), still_considered,
+                                              meta["watermark"]["max_reading_id"])
+            late_ids = set(int(i) for i in newest_df["crop_cycle_id"])
+
+        replaced = (edited_ids | late_ids) - new_ids
+        rebuild_ids = sorted(new_ids | replaced)
+        print(f"Training snapshot: {len(new_ids)} new, {len(edited_ids)} edited, {len(late_ids)} with late readings, "
+              f"{len(removed)} removed cycles.")
+
+        fresh_df = build_training_features(db, cycle_ids=rebuild_ids, read_db=read_db) if rebuild_ids else pd.DataFrame()
+        old_parts = meta["parts"]
+        if not replaced and not removed:
+            # Pure append: existing parts stay as they are
+            parts = old_parts + ([_write_part(root, fresh_df)] if not fresh_df.empty else [])
+            old_parts = []
+            df = pd.concat([_read_parts(root, meta["parts"]), fresh_df], ignore_index=True)
+        else:
+            kept_df = _read_parts(root, old_parts)
+            if not kept_df.empty:
+                kept_df = kept_df[~kept_df["crop_cycle_id"].isin(replaced | removed)]
+            df = pd.concat([kept_df, fresh_df], ignore_index=True)
+            parts = [_write_part(root, df)] if not df.empty else []
+        df = df.sort_values("crop_cycle_id").reset_index(drop=True) if not df.empty else df
+
+    _write_meta(root, {
+        "feature_version": FEATURE_VERSION,
+        "format": SNAPSHOT_FORMAT,
+        "watermark": watermark,
+        "cycle_ids": sorted(current_ids),
+        "parts": parts,
+        "rows": int(len(df)),
+        "updated_at": datetime.utcnow().isoformat(),
+    })
+    for name in old_parts:
+        if name not in parts:
+            os.remove(os.path.join(root, name))
+    return df
@@ -0,0 +1,605 @@
+# tessyfarm_smartloop/backend_api/app/services/yield_features.py
+"""
+Feature engineering shared by the yield model trainer and the batch predictor.
+
+Per-cycle sensor aggregates (reading count, avg/min/max temperature, avg humidity and
+soil moisture, cumulative GDD) are computed in one grouped query and persisted in the
+`cycle_features` table, keyed by crop cycle and FEATURE_VERSION and tagged with a data
+watermark (the highest sensor_readings.id that existed at compute time). A stored row is
+reused until the cycle or its field is updated, or a reading newer than the watermark falls
+inside the cycle's window. Duration and gdd_approx depend on the window end (harvest date or
+"now"), so they are derived from the aggregates on every call rather than stored.
+
+Aggregates are built from per-day totals: the daily accumulators in `cycle_daily_weather`
+(appended by roll_up_daily_weather) for the days they cover, and raw readings grouped by day
+only after the last accumulated day. For an active cycle that is a sum over a few hundred
+rows plus today's readings instead of a scan of the whole cycle. Cycles without usable
+accumulators (never rolled up, edited since, or harvested) are aggregated from raw readings.
+gdd_cumulative is the true GDD: the sum of daily max(0, (min + max) / 2 - GDD_BASE_TEMP).
+
+Aggregates normally come from one GROUP BY in the database. With
+settings.FEATURE_AGGREGATION_STREAMING the readings after the accumulated days are instead
+streamed as a binary COPY (only the cycle id, day and the three numeric columns, parsed straight
+into NumPy by services/columnar.copy_columns), FEATURE_STREAM_CHUNK_SIZE rows at a time as
+float32, into running per-cycle aggregators. That
+keeps the database side to a plain join and bounds client memory by the chunk size plus one
+slot per cycle and day.
+"""
+from datetime import datetime, date
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select, delete, func, and_, case, cast, extract, literal, union_all, Integer, String, Date, DateTime, Float, REAL
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from ..core.config import settings
+from ..models.farm import CropCycle, Field, SensorReading, CycleFeature, CycleDailyWeather
+from .columnar import copy_columns
+
+# Bump whenever the aggregation or derivation logic changes; old store rows are then ignored.
+FEATURE_VERSION = "v3"
+
+# Model input columns, in the order the model is trained on.
+# Categorical encoded columns (crop_type_encoded, soil_type_encoded) would be added here later.
+FEATURE_COLUMNS = [
+    'avg_temp', 'min_temp', 'max_temp', 'avg_humidity', 'avg_soil_moisture',
+    'gdd_approx', 'gdd_cumulative', 'cycle_duration_days', 'field_area_hectares'
+]
+TARGET_COLUMN = 'actual_yield_tonnes_per_hectare'
+AGGREGATE_COLUMNS = ['reading_count', 'avg_temp', 'min_temp', 'max_temp', 'avg_humidity', 'avg_soil_moisture',
+                     'gdd_cumulative']
+# Per-day totals, as stored in cycle_daily_weather and as computed from raw readings for the days after them
+DAILY_COLUMNS = ['reading_count', 'temp_count', 'temp_sum', 'min_temp', 'max_temp', 'gdd',
+                 'humidity_count', 'humidity_sum', 'moisture_count', 'moisture_sum']
+GDD_BASE_TEMP = 10
+DAY_KEY_SPAN = 1 << 32 # Streaming: per-(cycle, day) key = cycle slot * DAY_KEY_SPAN + days since 1970-01-01
+
+STORE_WRITE_CHUNK_SIZE = 1000
+
+
+def _cycle_filter(completed: bool, field_ids: Optional[List[int]] = None, cycle_ids: Optional[List[int]] = None):
+    """Completed (harvested, with yield) or active cycles, optionally restricted to some fields or cycles."""
+    if completed:
+        condition = and_(CropCycle.actual_yield_tonnes.isnot(None), CropCycle.actual_harvest_date.isnot(None))
+    else:
+        condition = CropCycle.actual_harvest_date.is_(None)
+    if field_ids is not None:
+        condition = and_(condition, CropCycle.field_id.in_(field_ids))
+    if cycle_ids is not None:
+        condition = and_(condition, CropCycle.id.in_(cycle_ids))
+    return condition
+
+
+def device_in_field(field_id):
+    """
+    Whether a reading's device belongs to field_id (a column or an int), for joins and filters.
+    IMPORTANT: the device_id rule is a placeholder until devices are mapped to fields: a device
+    belongs to field N when its id contains "field_N" not followed by another digit, so field_1
+    does not claim field_10's devices. The IoT listener's alert rules (FIELD_ID_PATTERN) read
+    device ids the same way.
+    """
+    # "field_<id>" followed by a non-digit or the end of the id (PostgreSQL ~)
+    return SensorReading.device_id.regexp_match(literal("field_") + cast(field_id, String) + literal("($|[^0-9])"))
+
+
+def _readings_in_window(completed: bool, now: datetime):
+    """Join condition linking readings to a cycle: the field's devices (device_in_field) within the window."""
+    window_end = CropCycle.actual_harvest_date if completed else now
+    return and_(
+        device_in_field(CropCycle.field_id),
+        SensorReading.timestamp >= CropCycle.planting_date,
+        SensorReading.timestamp <= window_end,
+    )
+
+
+def _daily_reading_aggregates() -> list:
+    """Per-day totals of the grouped readings, labelled as DAILY_COLUMNS."""
+    day_min = func.min(SensorReading.temperature)
+    day_max = func.max(SensorReading.temperature)
+    return [
+        func.count(SensorReading.id).label("reading_count"),
+        func.count(SensorReading.temperature).label("temp_count"),
+        func.sum(SensorReading.temperature).label("temp_sum"),
+        day_min.label("min_temp"),
+        day_max.label("max_temp"),
+        case( # GREATEST ignores NULLs, so days without temperature stay NULL explicitly
+            (day_min.is_(None), None),
+            else_=func.greatest(0.0, (day_min + day_max) / 2 - GDD_BASE_TEMP),
+        ).label("gdd"),
+        func.count(SensorReading.humidity).label("humidity_count"),
+        func.sum(SensorReading.humidity).label("humidity_sum"),
+        func.count(SensorReading.soil_moisture).label("moisture_count"),
+        func.sum(SensorReading.soil_moisture).label("moisture_sum"),
+    ]
+
+
+def _covered_days(completed: bool, now: datetime, condition):
+    """
+    CTE: per cycle with usable daily accumulators, the first day they do not cover (next_day).
+    Only days before the window end count, and only if every row of the cycle was rolled up after
+    the cycle and its field were last updated (roll_up_daily_weather rebuilds edited active cycles).
+    """
+    window_end = CropCycle.actual_harvest_date if completed else now
+    return select(
+        CycleDailyWeather.crop_cycle_id,
+        (func.max(CycleDailyWeather.day) + 1).label("next_day"),
+    ).join(CropCycle, CycleDailyWeather.crop_cycle_id == CropCycle.id)\
+     .join(Field, CropCycle.field_id == Field.id)\
+     .filter(condition, CycleDailyWeather.day < cast(window_end, Date))\
+     .group_by(CycleDailyWeather.crop_cycle_id, CropCycle.updated_at, Field.updated_at)\
+     .having(func.min(CycleDailyWeather.created_at) >= func.greatest(CropCycle.updated_at, Field.updated_at))\
+     .cte("covered_days")
+
+
+def _accumulated_days(covered):
+    """The cycle_daily_weather rows of the covered days, as crop_cycle_id + DAILY_COLUMNS."""
+    return select(
+        CycleDailyWeather.crop_cycle_id,
+        *(getattr(CycleDailyWeather, col) for col in DAILY_COLUMNS),
+    ).join(covered, covered.c.crop_cycle_id == CycleDailyWeather.crop_cycle_id)\
+     .filter(CycleDailyWeather.day < covered.c.next_day)
+
+
+def _uncovered_readings(completed: bool, now: datetime, covered):
+    """Join condition: readings in the cycle's window after its covered days (covered must be outer-joined)."""
+    return and_(
+        _readings_in_window(completed, now),
+        SensorReading.timestamp >= func.coalesce(cast(covered.c.next_day, DateTime), CropCycle.planting_date),
+    )
+
+
+def fetch_cycles(db: Session, completed: bool, field_ids: Optional[List[int]] = None,
+                 cycle_ids: Optional[List[int]] = None) -> pd.DataFrame:
+    """Cycle and field attributes only (no readings). completed=True selects harvested cycles with a yield."""
+    stmt = select(
+        CropCycle.id.label("crop_cycle_id"),
+        CropCycle.field_id,
+        CropCycle.crop_type,
+        CropCycle.planting_date,
+        CropCycle.actual_harvest_date,
+        CropCycle.actual_yield_tonnes,
+        CropCycle.updated_at.label("cycle_updated_at"),
+        Field.area_hectares.label("field_area_hectares"),
+        Field.soil_type,
+        Field.updated_at.label("field_updated_at"),
+    ).join(Field, CropCycle.field_id == Field.id)\
+     .filter(_cycle_filter(completed, field_ids, cycle_ids))\
+     .order_by(CropCycle.id)
+
+    cycles_df = pd.read_sql(
+        stmt, db.bind,
+        parse_dates=["planting_date", "actual_harvest_date", "cycle_updated_at", "field_updated_at"],
+    )
+    cycles_df["field_area_hectares"] = cycles_df["field_area_hectares"].astype(float)
+    cycles_df["source_updated_at"] = cycles_df[["cycle_updated_at", "field_updated_at"]].max(axis=1)
+    return cycles_df
+
+
+class _RunningAggregates:
+    """
+    Per-cycle count/sum/min/max accumulators fed chunk by chunk (sums in float64), plus per-(cycle, day)
+    temperature min/max for the GDD of the streamed days. Accumulated days are folded in with add_days.
+    """
+
+    def __init__(self, cycle_ids: np.ndarray):
+        self.cycle_ids = cycle_ids # Sorted
+        n = len(cycle_ids)
+        self.reading_count = np.zeros(n, dtype=np.int64)
+        self.counts = np.zeros((3, n), dtype=np.int64) # temperature, humidity, soil moisture
+        self.sums = np.zeros((3, n), dtype=np.float64)
+        self.temp_min = np.full(n, np.inf, dtype=np.float32)
+        self.temp_max = np.full(n, -np.inf, dtype=np.float32)
+        self.gdd_sum = np.zeros(n, dtype=np.float64) # Accumulated days
+        self.gdd_days = np.zeros(n, dtype=np.int64)
+        self.day_keys = np.empty(0, dtype=np.int64) # Streamed days with a temperature, sorted
+        self.day_min = np.empty(0, dtype=np.float32)
+        self.day_max = np.empty(0, dtype=np.float32)
+
+    def add_days(self, days_df: pd.DataFrame):
+        """Folds in per-cycle totals of accumulated days (crop_cycle_id + DAILY_COLUMNS sums, min/max, gdd_days)."""
+        if days_df.empty:
+            return
+        slots = np.searchsorted(self.cycle_ids, days_df["crop_cycle_id"].to_numpy(dtype=np.int64))
+        totals = days_df.drop(columns="crop_cycle_id").astype(float).fillna({
+            col: 0.0 for col in DAILY_COLUMNS if col not in ("min_temp", "max_temp")})
+        self.reading_count[slots] += totals["reading_count"].to_numpy(dtype=np.int64)
+        for row, (count, total) in enumerate((("temp_count", "temp_sum"), ("humidity_count", "humidity_sum"),
+                                              ("moisture_count", "moisture_sum"))):
+            self.counts[row, slots] += totals[count].to_numpy(dtype=np.int64)
+            self.sums[row, slots] += totals[total].to_numpy()
+        has_temp = totals["min_temp"].notna().to_numpy()
+        self.temp_min[slots[has_temp]] = np.minimum(self.temp_min[slots[has_temp]], totals["min_temp"].to_numpy()[has_temp])
+        self.temp_max[slots[has_temp]] = np.maximum(self.temp_max[slots[has_temp]], totals["max_temp"].to_numpy()[has_temp])
+        self.gdd_sum[slots] += totals["gdd"].to_numpy()
+        self.gdd_days[slots] += totals["gdd_days"].to_numpy(dtype=np.int64)
+
+    def add(self, chunk_cycle_ids: np.ndarray, days: np.ndarray, values: np.ndarray):
+        """days: days since 1970-01-01 per reading; values: (rows, 3) float32 with NaN for NULL."""
+        n = len(self.cycle_ids)
+        slots = np.searchsorted(self.cycle_ids, chunk_cycle_ids)
+        self.reading_count += np.bincount(slots, minlength=n)
+        present = ~np.isnan(values)
+        for col in range(3):
+            mask = present[:, col]
+            self.counts[col] += np.bincount(slots[mask], minlength=n)
+            self.sums[col] += np.bincount(slots[mask], weights=values[mask, col].astype(np.float64), minlength=n)
+        mask = present[:, 0]
+        np.minimum.at(self.temp_min, slots[mask], values[mask, 0])
+        np.maximum.at(self.temp_max, slots[mask], values[mask, 0])
+
+        if not mask.any():
+            return
+        # Merge this chunk's per-day extremes into the running ones
+        keys = np.concatenate((self.day_keys, slots[mask] * DAY_KEY_SPAN + days[mask]))
+        order = np.argsort(keys, kind="stable")
+        self.day_keys, starts = np.unique(keys[order], return_index=True)
+        self.day_min = np.minimum.reduceat(np.concatenate((self.day_min, values[mask, 0]))[order], starts)
+        self.day_max = np.maximum.reduceat(np.concatenate((self.day_max, values[mask, 0]))[order], starts)
+
+    def to_frame(self) -> pd.DataFrame:
+        n = len(self.cycle_ids)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = np.where(self.counts > 0, self.sums / self.counts, np.nan)
+        has_temp = self.counts[0] > 0
+        day_gdd = np.maximum(0.0, (self.day_min.astype(np.float64) + self.day_max) / 2 - GDD_BASE_TEMP)
+        day_slots = self.day_keys // DAY_KEY_SPAN
+        gdd = self.gdd_sum + np.bincount(day_slots, weights=day_gdd, minlength=n)
+        gdd_days = self.gdd_days + np.bincount(day_slots, minlength=n)
+        return pd.DataFrame({
+            "crop_cycle_id": self.cycle_ids,
+            "reading_count": self.reading_count.astype(float),
+            "avg_temp": means[0],
+            "min_temp": np.where(has_temp, self.temp_min, np.nan).astype(float),
+            "max_temp": np.where(has_temp, self.temp_max, np.nan).astype(float),
+            "avg_humidity": means[1],
+            "avg_soil_moisture": means[2],
+            "gdd_cumulative": np.where(gdd_days > 0, gdd, np.nan),
+        })
+
+
+def stream_sensor_features(db: Session, completed: bool, now: datetime, cycle_ids: Optional[List[int]] = None,
+                           field_ids: Optional[List[int]] = None, chunk_size: Optional[int] = None) -> pd.DataFrame:
+    """
+    Same result as the grouped query in aggregate_sensor_features: accumulated days are summed per
+    cycle in the database, the readings after them are streamed in chunks and aggregated client-side.
+    Min/max are float32-exact; averages and GDD agree to float32 precision.
+    """
+    chunk_size = chunk_size or settings.FEATURE_STREAM_CHUNK_SIZE
+    condition = _cycle_filter(completed, field_ids, cycle_ids)
+    selected_ids = np.array(db.execute(select(CropCycle.id).filter(condition).order_by(CropCycle.id)).scalars().all(),
+                            dtype=np.int64)
+    aggregates = _RunningAggregates(selected_ids)
+    if len(selected_ids):
+        covered = _covered_days(completed, now, condition)
+        days = _accumulated_days(covered).subquery("accumulated_days")
+        days_stmt = select(
+            days.c.crop_cycle_id,
+            *(func.min(days.c[col]).label(col) if col == "min_temp" else
+              func.max(days.c[col]).label(col) if col == "max_temp" else
+              func.sum(days.c[col]).label(col) for col in DAILY_COLUMNS),
+            func.count(days.c.gdd).label("gdd_days"),
+        ).group_by(days.c.crop_cycle_id)
+        aggregates.add_days(pd.read_sql(days_stmt, db.bind))
+
+        metrics = ("temperature", "humidity", "soil_moisture")
+        stmt = select(
+            CropCycle.id.label("crop_cycle_id"),
+            cast(func.floor(extract("epoch", SensorReading.timestamp) / 86400), Integer).label("day"),
+            # Fixed-width and NOT NULL for the binary COPY: real, NULL -> NaN
+            *(cast(func.coalesce(getattr(SensorReading, metric), cast(literal("NaN"), Float)), REAL).label(metric) for metric in metrics),
+        ).select_from(CropCycle)\
+         .outerjoin(covered, covered.c.crop_cycle_id == CropCycle.id)\
+         .join(SensorReading, _uncovered_readings(completed, now, covered))\
+         .filter(condition)
+
+        def add_chunk(columns):
+            aggregates.add(columns["crop_cycle_id"], columns["day"], np.column_stack([columns[metric] for metric in metrics]))
+
+        copy_columns(db, stmt, [("crop_cycle_id", "i4"), ("day", "i4")] + [(metric, "f4") for metric in metrics],
+                     on_chunk=add_chunk, chunk_rows=chunk_size)
+
+    return aggregates.to_frame()
+
+
+def aggregate_sensor_features(db: Session, completed: bool, now: datetime, cycle_ids: Optional[List[int]] = None,
+                              field_ids: Optional[List[int]] = None) -> pd.DataFrame:
+    """
+    One grouped query: per-cycle reading count and sensor aggregates over each cycle's window, from the
+    accumulated days plus the readings after them grouped by day (see the module docstring).
+    """
+    if settings.FEATURE_AGGREGATION_STREAMING:
+        return stream_sensor_features(db, completed, now, cycle_ids=cycle_ids, field_ids=field_ids)
+
+    condition = _cycle_filter(completed, field_ids, cycle_ids)
+    covered = _covered_days(completed, now, condition)
+    recent_days = select(
+        CropCycle.id.label("crop_cycle_id"),
+        *_daily_reading_aggregates(),
+    ).select_from(CropCycle)\
+     .outerjoin(covered, covered.c.crop_cycle_id == CropCycle.id)\
+     .join(SensorReading, _uncovered_readings(completed, now, covered))\
+     .filter(condition)\
+     .group_by(CropCycle.id, cast(SensorReading.timestamp, Date))
+    days = union_all(_accumulated_days(covered), recent_days).subquery("days")
+
+    def mean(count, total):
+        return func.sum(days.c[total]) / func.nullif(func.sum(days.c[count]), 0)
+
+    totals = select(
+        days.c.crop_cycle_id,
+        func.sum(days.c.reading_count).label("reading_count"),
+        mean("temp_count", "temp_sum").label("avg_temp"),
+        func.min(days.c.min_temp).label("min_temp"),
+        func.max(days.c.max_temp).label("max_temp"),
+        mean("humidity_count", "humidity_sum").label("avg_humidity"),
+        mean("moisture_count", "moisture_sum").label("avg_soil_moisture"),
+        func.sum(days.c.gdd).label("gdd_cumulative"),
+    ).group_by(days.c.crop_cycle_id).subquery("totals")
+    stmt = select(
+        CropCycle.id.label("crop_cycle_id"),
+        func.coalesce(totals.c.reading_count, 0).label("reading_count"),
+        *(totals.c[col] for col in AGGREGATE_COLUMNS[1:]),
+    ).select_from(CropCycle)\
+     .outerjoin(totals, totals.c.crop_cycle_id == CropCycle.id)\
+     .filter(condition)\
+     .order_by(CropCycle.id)
+
+    agg_df = pd.read_sql(stmt, db.bind)
+    for col in AGGREGATE_COLUMNS:
+        agg_df[col] = agg_df[col].astype(float)
+    return agg_df
+
+
+def newest_readings_after(db: Session, completed: bool, now: datetime, cycle_ids: List[int], after_id: int) -> pd.DataFrame:
+    """
+    Per cycle, the newest reading id above after_id that falls inside the cycle's window
+    (cycles without one are omitted). The id predicate lets this scan only the newest
+    readings via the primary key.
+    """
+    stmt = select(
+        CropCycle.id.label("crop_cycle_id"),
+        func.max(SensorReading.id).label("newest_reading_id"),
+    ).select_from(CropCycle)\
+     .join(SensorReading, and_(_readings_in_window(completed, now), SensorReading.id > after_id))\
+     .filter(CropCycle.id.in_(cycle_ids))\
+     .group_by(CropCycle.id)
+    return pd.read_sql(stmt, db.bind)
+
+
+def _stale_cycle_ids(db: Session, cycles_df: pd.DataFrame, stored_df: pd.DataFrame, completed: bool, now: datetime) -> set:
+    """Cycles whose stored aggregates can no longer be trusted."""
+    stale = set(cycles_df["crop_cycle_id"]) - set(stored_df["crop_cycle_id"])
+
+    merged = cycles_df.merge(stored_df, on="crop_cycle_id", how="inner", suffixes=("", "_stored"))
+    if merged.empty:
+        return stale
+
+    # Cycle or field edited since the row was computed
+    edited = merged["source_updated_at"] > merged["source_updated_at_stored"]
+    stale.update(merged.loc[edited, "crop_cycle_id"])
+
+    # Readings that arrived after the watermark and fall inside a cycle's window
+    newest_df = newest_readings_after(db, completed, now, [int(i) for i in merged["crop_cycle_id"]],
+                                      int(merged["data_watermark"].min()))
+    if not newest_df.empty:
+        newest = merged[["crop_cycle_id", "data_watermark"]].merge(newest_df, on="crop_cycle_id")
+        stale.update(newest.loc[newest["newest_reading_id"] > newest["data_watermark"], "crop_cycle_id"])
+    return stale
+
+
+def _load_stored_features(db: Session, cycle_ids: List[int]):
+    """Returns (watermark/metadata frame, aggregate frame) for stored rows of the current FEATURE_VERSION."""
+    stmt = select(
+        CycleFeature.crop_cycle_id,
+        CycleFeature.data_watermark,
+        CycleFeature.source_updated_at.label("source_updated_at_stored"),
+        CycleFeature.features,
+    ).filter(CycleFeature.feature_version == FEATURE_VERSION)\
+     .filter(CycleFeature.crop_cycle_id.in_(cycle_ids))
+    rows = db.execute(stmt).all()
+    stored_df = pd.DataFrame(
+        [(r.crop_cycle_id, r.data_watermark, r.source_updated_at_stored) for r in rows],
+        columns=["crop_cycle_id", "data_watermark", "source_updated_at_stored"],
+    )
+    stored_df["source_updated_at_stored"] = pd.to_datetime(stored_df["source_updated_at_stored"])
+    features_df = pd.DataFrame([r.features for r in rows], columns=AGGREGATE_COLUMNS)
+    features_df.insert(0, "crop_cycle_id", stored_df["crop_cycle_id"])
+    return stored_df, features_df.astype({col: float for col in AGGREGATE_COLUMNS})
+
+
+def _store_features(db: Session, cycles_df: pd.DataFrame, agg_df: pd.DataFrame, watermark: int, completed: bool, now: datetime):
+    """Upserts freshly computed aggregates into cycle_features, in chunks."""
+    merged = agg_df.merge(cycles_df[["crop_cycle_id", "actual_harvest_date", "source_updated_at"]], on="crop_cycle_id")
+    window_end = merged["actual_harvest_date"] if completed else pd.Series(now, index=merged.index)
+    # NaN is not valid JSON; store it as null
+    features = merged[AGGREGATE_COLUMNS].astype(object).where(merged[AGGREGATE_COLUMNS].notna(), None)
+    rows = [
+        {
+            "crop_cycle_id": int(cycle_id),
+            "feature_version": FEATURE_VERSION,
+            "data_watermark": watermark,
+            "window_end": end.to_pydatetime(),
+            "source_updated_at": None if pd.isna(updated) else updated.to_pydatetime(),
+            "features": feature_row,
+            "computed_at": now,
+        }
+        for cycle_id, end, updated, feature_row in zip(
+            merged["crop_cycle_id"], pd.to_datetime(window_end), merged["source_updated_at"],
+            features.to_dict(orient="records"),
+        )
+    ]
+    for start in range(0, len(rows), STORE_WRITE_CHUNK_SIZE):
+        stmt = pg_insert(CycleFeature).values(rows[start:start + STORE_WRITE_CHUNK_SIZE])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["crop_cycle_id", "feature_version"],
+            set_={col: stmt.excluded[col] for col in
+                  ("data_watermark", "window_end", "source_updated_at", "features", "computed_at")},
+        )
+        db.execute(stmt)
+    db.commit()
+
+
+def load_cycle_aggregates(db: Session, completed: bool, now: Optional[datetime] = None, use_store: bool = True,
+                          field_ids: Optional[List[int]] = None, cycle_ids: Optional[List[int]] = None,
+                          read_db: Optional[Session] = None) -> pd.DataFrame:
+    """
+    Returns cycle attributes joined with sensor aggregates, one row per cycle.
+    With use_store, unchanged cycles are served from cycle_features and only stale ones
+    are recomputed from raw readings (and written back). field_ids/cycle_ids restrict the work.
+    read_db (e.g. a replica session) serves every read, watermark included; cycle_features
+    writes always go through db. A lagging replica only makes rows look stale, never fresh.
+    Note: for active cycles a reading that was already stored with a future timestamp when the
+    row was computed is only picked up once the cycle is recomputed for another reason.
+    """
+    now = now or datetime.utcnow()
+    reader = read_db or db
+    cycles_df = fetch_cycles(reader, completed, field_ids, cycle_ids)
+    if cycles_df.empty:
+        return cycles_df.assign(**{col: pd.Series(dtype=float) for col in AGGREGATE_COLUMNS})
+
+    if not use_store:
+        agg_df = aggregate_sensor_features(reader, completed, now, cycle_ids=cycle_ids, field_ids=field_ids)
+        return cycles_df.merge(agg_df, on="crop_cycle_id", how="left")
+
+    # Taken before aggregating, so readings inserted meanwhile are newer than the watermark
+    watermark = reader.execute(select(func.coalesce(func.max(SensorReading.id), 0))).scalar_one()
+
+    selected_ids = [int(i) for i in cycles_df["crop_cycle_id"]]
+    stored_df, stored_features_df = _load_stored_features(reader, selected_ids)
+    stale_ids = _stale_cycle_ids(reader, cycles_df, stored_df, completed, now)
+    print(f"Feature store: {len(selected_ids) - len(stale_ids)} cycles served from store, {len(stale_ids)} recomputed.")
+
+    fresh_df = pd.DataFrame(columns=["crop_cycle_id"] + AGGREGATE_COLUMNS)
+    if stale_ids:
+        # Recomputing everything is one plain GROUP BY; otherwise restrict to the stale subset
+        subset = cycle_ids if len(stale_ids) == len(selected_ids) else sorted(int(i) for i in stale_ids)
+        fresh_df = aggregate_sensor_features(reader, completed, now, cycle_ids=subset, field_ids=field_ids)
+        _store_features(db, cycles_df, fresh_df, watermark, completed, now)
+
+    reused_df = stored_features_df[~stored_features_df["crop_cycle_id"].isin(stale_ids)]
+    agg_df = pd.concat([reused_df, fresh_df], ignore_index=True).astype({col: float for col in AGGREGATE_COLUMNS})
+    agg_df["crop_cycle_id"] = agg_df["crop_cycle_id"].astype(int)
+    return cycles_df.merge(agg_df, on="crop_cycle_id", how="left")
+
+
+def _add_derived_features(df: pd.DataFrame, window_end: pd.Series) -> pd.DataFrame:
+    """cycle_duration_days and gdd_approx from the overall min/max temperature and the window length."""
+    duration = (window_end - df["planting_date"]).dt.days
+    df["cycle_duration_days"] = duration
+    avg_daily_temp_proxy = (df["max_temp"] + df["min_temp"]) / 2
+    gdd_available = df["max_temp"].notna() & df["min_temp"].notna() & (duration > 0)
+    df["gdd_approx"] = ((avg_daily_temp_proxy - GDD_BASE_TEMP).clip(lower=0) * duration).where(gdd_available)
+    return df
+
+
+def build_training_features(db: Session, use_store: bool = True, cycle_ids: Optional[List[int]] = None,
+                            read_db: Optional[Session] = None) -> pd.DataFrame:
+    """
+    Features and target for completed cycles (optionally only cycle_ids). Cycles without sensor
+    data, with a non-positive duration, or without a usable field area are skipped.
+    """
+    df = load_cycle_aggregates(db, completed=True, use_store=use_store, cycle_ids=cycle_ids, read_db=read_db)
+    print(f"Found {len(df)} completed crop cycles with yield data.")
+    if df.empty:
+        return pd.DataFrame()
+
+    df = df[df["reading_count"] > 0].copy()
+    df = _add_derived_features(df, df["actual_harvest_date"])
+    df = df[(df["cycle_duration_days"] > 0) & (df["field_area_hectares"] > 0)].copy()
+    df[TARGET_COLUMN] = df["actual_yield_tonnes"] / df["field_area_hectares"]
+    print(f"Engineered features for {len(df)} completed crop cycles.")
+    if df.empty:
+        return pd.DataFrame()
+
+    columns = ['crop_cycle_id', 'field_id', 'crop_type', 'soil_type', 'cycle_duration_days', 'avg_temp', 'min_temp', 'max_temp', 'avg_humidity',
+               'avg_soil_moisture', 'gdd_approx', 'gdd_cumulative', 'field_area_hectares', TARGET_COLUMN]
+    return df[columns].reset_index(drop=True)
+
+
+def build_prediction_features(db: Session, trained_feature_names: list, now: Optional[datetime] = None, use_store: bool = True,
+                              field_ids: Optional[List[int]] = None, cycle_ids: Optional[List[int]] = None,
+                              read_db: Optional[Session] = None) -> pd.DataFrame:
+    """
+    Features for active cycles, measured from planting to now, in trained_feature_names order
+    (unknown names filled with NaN) followed by crop_cycle_id, crop_type and soil_type (used to
+    route cycles to per-group models).
+    Cycles without sensor data keep NaN for every sensor-derived feature, including duration.
+    field_ids/cycle_ids limit the result (one batch-prediction shard, or only the cycles to re-score).
+    """
+    now = now or datetime.utcnow()
+    df = load_cycle_aggregates(db, completed=False, now=now, use_store=use_store, field_ids=field_ids, cycle_ids=cycle_ids,
+                               read_db=read_db)
+    print(f"Found {len(df)} active crop cycles.")
+    if df.empty:
+        return pd.DataFrame()
+
+    has_sensor_data = df["reading_count"] > 0
+    print(f"  {int((~has_sensor_data).sum())} active cycles have no sensor data. Using NaNs for their sensor features.")
+    df = _add_derived_features(df, pd.Series(now, index=df.index))
+    df["cycle_duration_days"] = df["cycle_duration_days"].clip(lower=0).where(has_sensor_data)
+
+    final_features_df = df.reindex(columns=list(trained_feature_names))
+    final_features_df['crop_cycle_id'] = df['crop_cycle_id']
+    final_features_df['crop_type'] = df['crop_type']
+    final_features_df['soil_type'] = df['soil_type']
+    print(f"Engineered features for {len(final_features_df)} active crop cycles.")
+    return final_features_df.reset_index(drop=True)
+
+
+def roll_up_daily_weather(db: Session, today: Optional[date] = None, lookback_days: Optional[int] = None) -> int:
+    """
+    Upserts one cycle_daily_weather row per active cycle and complete day, up to the end of yesterday.
+    Each cycle only scans readings from lookback_days before the day after its last stored day (or
+    from planting on the first run), so late readings for those days are picked up when their rows are
+    rolled up again; readings arriving later than that are not. Cycles whose cycle or field was updated
+    after their rows were rolled up are deleted first and rebuilt from planting.
+    One DELETE plus one INSERT ... SELECT ... ON CONFLICT DO UPDATE. Returns the number of rows written.
+    """
+    today = today or datetime.utcnow().date()
+    today_start = datetime.combine(today, datetime.min.time())
+    lookback_days = settings.WEATHER_ROLLUP_LOOKBACK_DAYS if lookback_days is None else lookback_days
+
+    edited = select(CycleDailyWeather.crop_cycle_id)\
+        .join(CropCycle, CycleDailyWeather.crop_cycle_id == CropCycle.id)\
+        .join(Field, CropCycle.field_id == Field.id)\
+        .filter(_cycle_filter(completed=False))\
+        .group_by(CycleDailyWeather.crop_cycle_id, CropCycle.updated_at, Field.updated_at)\
+        .having(func.min(CycleDailyWeather.created_at) < func.greatest(CropCycle.updated_at, Field.updated_at))
+    db.execute(delete(CycleDailyWeather).where(CycleDailyWeather.crop_cycle_id.in_(edited)))
+
+    last_stored = select(
+        CycleDailyWeather.crop_cycle_id,
+        func.max(CycleDailyWeather.day).label("last_day"),
+    ).group_by(CycleDailyWeather.crop_cycle_id).subquery()
+    window_start = func.greatest(
+        CropCycle.planting_date,
+        func.coalesce(cast(last_stored.c.last_day + (1 - lookback_days), DateTime), CropCycle.planting_date),
+    )
+
+    day = cast(SensorReading.timestamp, Date)
+    daily_stmt = select(
+        CropCycle.id,
+        day,
+        *_daily_reading_aggregates(),
+        func.avg(SensorReading.temperature),
+    ).select_from(CropCycle)\
+     .outerjoin(last_stored, last_stored.c.crop_cycle_id == CropCycle.id)\
+     .join(SensorReading, and_(
+         device_in_field(CropCycle.field_id),
+         SensorReading.timestamp >= window_start,
+         SensorReading.timestamp < today_start,
+     ))\
+     .filter(_cycle_filter(completed=False))\
+     .group_by(CropCycle.id, day)
+
+    value_columns = DAILY_COLUMNS + ["mean_temp"]
+    insert_stmt = pg_insert(CycleDailyWeather).from_select(["crop_cycle_id", "day"] + value_columns, daily_stmt)
+    insert_stmt = insert_stmt.on_conflict_do_update(
+        index_elements=["crop_cycle_id", "day"],
+        set_={col: insert_stmt.excluded[col] for col in value_columns},
+    )
+    result = db.execute(insert_stmt)
+    db.commit()
+    return result.rowcount
@@ -0,0 +1,136 @@
+# tessyfarm_smartloop/backend_api/app/services/yield_scenarios.py
+"""
+What-if simulation over the active yield model.
+
+A request lists feature perturbations, each with one or more levels, e.g. avg_soil_moisture
+scaled by [0.8, 0.9, 1.0]. The scenarios are the cartesian product of all levels. For every
+model that scores cycles in scope (global or per-group), the cycles' imputed feature rows are
+tiled once per scenario (plus an unperturbed baseline) into one matrix, the levels are applied
+column-wise, and the matrix is scored in a single call. Per-scenario distributions over the
+cycles are reduced with vectorized percentiles.
+
+Perturbations act on the engineered features (cycle-level averages from planting to now), so
+"soil moisture 10% lower" means the cycle's average soil moisture feature is 10% lower.
+"""
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from ..core.config import settings
+from ..models.farm import Field
+from .model_family import ModelFamily, feature_matrix
+from .yield_features import build_prediction_features
+
+SCENARIO_SCOPES = ("crop_cycle", "field", "farm", "all")
+PERTURBATION_MODES = ("scale", "shift", "set") # Multiply by, add, or replace with the level
+_PERCENTILES = [10, 50, 90]
+
+
+def scenario_levels(perturbations: List[Dict[str, Any]]) -> np.ndarray:
+    """(scenarios, perturbations) matrix of levels: the cartesian product of every perturbation's values."""
+    grids = np.meshgrid(*[np.asarray(p["values"], dtype=np.float64) for p in perturbations], indexing="ij")
+    return np.stack([grid.ravel() for grid in grids], axis=1)
+
+
+def validate_perturbations(perturbations: List[Dict[str, Any]], feature_names: List[str]):
+    """Raises ValueError for unknown features/modes, empty levels or a feature perturbed twice."""
+    seen = set()
+    for p in perturbations:
+        if p["feature"] not in feature_names:
+            raise ValueError(f"Unknown feature '{p['feature']}'; the active model uses {feature_names}")
+        if p["mode"] not in PERTURBATION_MODES:
+            raise ValueError(f"Unknown mode '{p['mode']}'; expected one of {list(PERTURBATION_MODES)}")
+        if not p["values"]:
+            raise ValueError(f"No values given for '{p['feature']}'")
+        if p["feature"] in seen:
+            raise ValueError(f"Feature '{p['feature']}' is perturbed more than once")
+        seen.add(p["feature"])
+
+
+def fetch_scope_features(db: Session, family: ModelFamily, scope: str, scope_id: Optional[int],
+                         now: Optional[datetime] = None, read_db: Optional[Session] = None) -> pd.DataFrame:
+    """Prediction features of the active cycles in scope (see SCENARIO_SCOPES); read_db as in load_cycle_aggregates."""
+    field_ids, cycle_ids = None, None
+    reader = read_db or db
+    if scope == "crop_cycle":
+        cycle_ids = [scope_id]
+    elif scope == "field":
+        field_ids = [scope_id]
+    elif scope == "farm":
+        field_ids = [int(i) for i in reader.execute(select(Field.id).where(Field.farm_id == scope_id)).scalars()]
+        if not field_ids:
+            return pd.DataFrame()
+    return build_prediction_features(db, family.feature_names, now=now, field_ids=field_ids, cycle_ids=cycle_ids,
+                                     read_db=read_db)
+
+
+def _apply_levels(X: np.ndarray, columns: List[int], modes: List[str], levels: np.ndarray, rows_per_scenario: int):
+    """Applies each scenario's levels in place to its block of rows (scenario-major layout)."""
+    for i, (column, mode) in enumerate(zip(columns, modes)):
+        level = np.repeat(levels[:, i], rows_per_scenario)
+        if mode == "scale":
+            X[:, column] *= level
+        elif mode == "shift":
+            X[:, column] += level
+        else:
+            X[:, column] = level
+
+
+def _summarise(predictions: np.ndarray) -> Dict[str, np.ndarray]:
+    """Per-row (scenario) statistics over the cycle axis."""
+    p10, p50, p90 = np.percentile(predictions, _PERCENTILES, axis=1)
+    return {
+        "mean": predictions.mean(axis=1),
+        "std": predictions.std(axis=1),
+        "min": predictions.min(axis=1),
+        "p10": p10,
+        "p50": p50,
+        "p90": p90,
+        "max": predictions.max(axis=1),
+    }
+
+
+def simulate_scenarios(family: ModelFamily, features_df: pd.DataFrame, perturbations: List[Dict[str, Any]],
+                       include_cycles: bool = False, max_rows: int = None) -> Dict[str, Any]:
+    """
+    Scores every scenario for every cycle in features_df (build_prediction_features output).
+    Returns the baseline and one entry per scenario with its levels and prediction distribution.
+    Raises ValueError for invalid perturbations or a grid larger than max_rows.
+    """
+    validate_perturbations(perturbations, family.feature_names)
+    levels = scenario_levels(perturbations)
+    n_cycles, n_scenarios = len(features_df), len(levels)
+    max_rows = max_rows or settings.SCENARIO_MAX_ROWS
+    if n_cycles * (n_scenarios + 1) > max_rows:
+        raise ValueError(f"{n_scenarios} scenarios x {n_cycles} cycles exceeds the limit of {max_rows} scored rows")
+
+    modes = [p["mode"] for p in perturbations]
+    # Row 0 is the unperturbed baseline, rows 1.. are the scenarios
+    predictions = np.empty((n_scenarios + 1, n_cycles), dtype=np.float64)
+    for bundle, mask in family.partition(features_df):
+        base = feature_matrix(features_df[mask], bundle.feature_names, bundle.scaler)
+        X = np.tile(base, (n_scenarios + 1, 1))
+        columns = [bundle.feature_names.index(p["feature"]) for p in perturbations]
+        _apply_levels(X[len(base):], columns, modes, levels, len(base))
+        predictions[:, mask] = bundle.predict(X).reshape(n_scenarios + 1, len(base))
+
+    stats = _summarise(predictions)
+    baseline_mean = stats["mean"][0]
+    features = [p["feature"] for p in perturbations]
+    distributions = []
+    for s in range(n_scenarios + 1):
+        distribution = {name: float(values[s]) for name, values in stats.items()}
+        distribution["mean_change"] = float(stats["mean"][s] - baseline_mean)
+        distribution["levels"] = {} if s == 0 else dict(zip(features, levels[s - 1].tolist()))
+        distribution["predictions"] = predictions[s].tolist() if include_cycles else None
+        distributions.append(distribution)
+    return {
+        "model_version": family.version,
+        "crop_cycle_ids": [int(i) for i in features_df["crop_cycle_id"]],
+        "baseline": distributions[0],
+        "scenarios": distributions[1:],
+    }
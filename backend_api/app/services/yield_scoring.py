@@ -0,0 +1,252 @@
+# tessyfarm_smartloop/backend_api/app/services/yield_scoring.py
+"""
+In-process yield scoring for the online prediction endpoints.
+
+- ModelHolder keeps the active version's ModelFamily (global model plus LRU of per-group
+  models) in memory and swaps it when the ACTIVE pointer changes (checked at most every
+  MODEL_RELOAD_CHECK_SECONDS).
+- PredictionBatcher coalesces concurrent requests into one matrix that is scored in a single
+  call (CompactForest when the version has one), off the event loop. The same pass yields
+  the per-tree prediction interval and confidence score.
+- Everything blocking before scoring (model loading, queries, feature building) runs in the
+  default executor too, so the event loop only waits for the batch window.
+- PredictionCache keeps results per crop cycle until a new reading arrives for it, the
+  cycle/field is edited, the model changes or the UTC day rolls over.
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select, func, and_, exists
+from sqlalchemy.orm import Session
+
+from ..core.config import settings
+from ..models.farm import SensorReading
+from .model_family import ModelFamily, feature_matrix
+from .model_registry import ACTIVE_POINTER_FILENAME, ModelBundle, confidence_scores, get_active_version
+from .yield_features import build_prediction_features, device_in_field, fetch_cycles
+
+
+class ModelHolder:
+    """The active model family, loaded once and hot-swapped when a new version is activated."""
+
+    def __init__(self, registry_dir: Optional[str] = None, check_interval: float = None):
+        self._registry_dir = registry_dir
+        self._check_interval = settings.MODEL_RELOAD_CHECK_SECONDS if check_interval is None else check_interval
+        self._family: Optional[ModelFamily] = None
+        self._pointer_mtime: Optional[float] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _pointer_path(self) -> str:
+        return os.path.join(self._registry_dir or settings.MODEL_REGISTRY_DIR, ACTIVE_POINTER_FILENAME)
+
+    def get(self) -> ModelFamily:
+        """Returns the active model family; raises ModelRegistryError if nothing has been activated."""
+        now = time.monotonic()
+        if self._family is not None and now - self._checked_at < self._check_interval:
+            return self._family
+
+        with self._lock:
+            self._checked_at = now
+            try:
+                mtime = os.stat(self._pointer_path()).st_mtime
+            except FileNotFoundError:
+                mtime = None
+            if self._family is None or mtime != self._pointer_mtime:
+                version = get_active_version(self._registry_dir)
+                if self._family is None or version != self._family.version:
+                    family = ModelFamily.load(version, registry_dir=self._registry_dir, mmap=True, compact=True)
+                    print(f"Online scoring: loaded model version {family.version} "
+                          f"({len(family.groups)} group models).")
+                    self._family = family # Swap by reference; in-flight batches keep the old bundles
+                self._pointer_mtime = mtime
+            return self._family
+
+
+class PredictionBatcher:
+    """
+    Collects single-row prediction requests for up to max_wait seconds (or max_batch_size rows)
+    and scores them together. Rows are grouped by the bundle (version and group model) that
+    built them, so a hot swap mid-batch never mixes feature layouts or models.
+    """
+
+    def __init__(self, max_batch_size: int = None, max_wait: float = None):
+        self.max_batch_size = max_batch_size or settings.ONLINE_PREDICTION_MAX_BATCH_SIZE
+        self.max_wait = settings.ONLINE_PREDICTION_MAX_WAIT_MS / 1000 if max_wait is None else max_wait
+        self._pending: List = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Future] = set() # The loop only keeps weak references to tasks
+
+    async def predict(self, bundle: ModelBundle, row: np.ndarray) -> tuple:
+        """(prediction, interval low, interval high) for one raw feature row; bounds may be None."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((bundle, row, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        by_bundle: Dict[tuple, List] = {}
+        for item in batch:
+            by_bundle.setdefault((item[0].version, item[0].group), []).append(item)
+        for items in by_bundle.values():
+            task = asyncio.ensure_future(self._score(items))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    @staticmethod
+    def _score_matrix(bundle: ModelBundle, X: np.ndarray) -> List[tuple]:
+        predictions, low, high = bundle.predict_interval(X)
+        if low is None:
+            return [(prediction, None, None) for prediction in predictions.tolist()]
+        return list(zip(predictions.tolist(), low.tolist(), high.tolist()))
+
+    async def _score(self, items: List):
+        bundle = items[0][0]
+        X = np.vstack([row for _, row, _ in items])
+        try:
+            predictions = await asyncio.get_running_loop().run_in_executor(None, self._score_matrix, bundle, X)
+        except Exception as e:
+            for _, _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, _, future), prediction in zip(items, predictions):
+            if not future.done():
+                future.set_result(prediction)
+
+
+class PredictionCache:
+    """Bounded LRU of online predictions, keyed by crop cycle."""
+
+    def __init__(self, max_entries: int = None):
+        self.max_entries = max_entries or settings.ONLINE_PREDICTION_CACHE_SIZE
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, crop_cycle_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(crop_cycle_id)
+            if entry is not None:
+                self._entries.move_to_end(crop_cycle_id)
+            return entry
+
+    def put(self, crop_cycle_id: int, entry: Dict[str, Any]):
+        with self._lock:
+            self._entries[crop_cycle_id] = entry
+            self._entries.move_to_end(crop_cycle_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+model_holder = ModelHolder()
+prediction_batcher = PredictionBatcher()
+prediction_cache = PredictionCache()
+
+
+def _has_new_readings(db: Session, cycle: pd.Series, watermark: int, now: datetime) -> bool:
+    """Whether a reading newer than watermark falls in the cycle's window (id range scan)."""
+    stmt = select(exists().where(and_(
+        SensorReading.id > watermark,
+        device_in_field(int(cycle["field_id"])),
+        SensorReading.timestamp >= cycle["planting_date"].to_pydatetime(),
+        SensorReading.timestamp <= now,
+    )))
+    return bool(db.execute(stmt).scalar())
+
+
+def _source_updated_at(cycle: pd.Series) -> Optional[datetime]:
+    return None if pd.isna(cycle["source_updated_at"]) else cycle["source_updated_at"].to_pydatetime()
+
+
+def _prepare_prediction(db: Session, crop_cycle_id: int, now: datetime) -> Optional[Dict[str, Any]]:
+    """
+    The blocking part of predict_crop_cycle, run in a worker thread: model lookup, cache check and
+    feature building. Returns None if the cycle is not active, {"cached": payload} on a cache hit,
+    and otherwise the bundle, cycle, feature frame and raw feature row to score.
+    """
+    family = model_holder.get()
+    cycles_df = fetch_cycles(db, completed=False, cycle_ids=[crop_cycle_id])
+    if cycles_df.empty:
+        return None
+    cycle = cycles_df.iloc[0]
+    bundle = family.bundle_for(cycle["crop_type"], cycle["soil_type"])
+    source_updated_at = _source_updated_at(cycle)
+
+    cached = prediction_cache.get(crop_cycle_id)
+    if cached is not None \
+            and cached["model_version"] == bundle.version \
+            and cached["model_group"] == bundle.group \
+            and cached["computed_at"].date() == now.date() \
+            and cached["source_updated_at"] == source_updated_at \
+            and not _has_new_readings(db, cycle, cached["input_watermark"], now):
+        return {"cached": cached["payload"]}
+
+    # Taken before reading inputs, so readings arriving meanwhile invalidate this entry
+    input_watermark = db.execute(select(func.coalesce(func.max(SensorReading.id), 0))).scalar_one()
+    features_df = build_prediction_features(db, bundle.feature_names, now=now, use_store=False, cycle_ids=[crop_cycle_id])
+    X = feature_matrix(features_df, bundle.feature_names, bundle.scaler)
+    return {
+        "bundle": bundle,
+        "cycle": cycle,
+        "source_updated_at": source_updated_at,
+        "input_watermark": input_watermark,
+        "features_df": features_df,
+        "row": X[0],
+    }
+
+
+async def predict_crop_cycle(db: Session, crop_cycle_id: int) -> Optional[Dict[str, Any]]:
+    """
+    Fresh prediction for one active crop cycle, or None if the cycle is not active.
+    Raises ModelRegistryError when no model has been activated.
+    """
+    now = datetime.utcnow()
+    prepared = await asyncio.get_running_loop().run_in_executor(None, _prepare_prediction, db, crop_cycle_id, now)
+    if prepared is None:
+        return None
+    if "cached" in prepared:
+        return {**prepared["cached"], "cached": True}
+
+    bundle, cycle, features_df = prepared["bundle"], prepared["cycle"], prepared["features_df"]
+    predicted_yield, interval_low, interval_high = await prediction_batcher.predict(bundle, prepared["row"])
+    confidence = None
+    if interval_low is not None:
+        confidence = float(confidence_scores(np.array([predicted_yield]), np.array([interval_low]), np.array([interval_high]))[0])
+
+    feature_values = features_df[bundle.feature_names].iloc[0]
+    payload = {
+        "crop_cycle_id": int(crop_cycle_id),
+        "field_id": int(cycle["field_id"]),
+        "model_version": bundle.version,
+        "model_group": bundle.group, # None when the global model scored it
+        "predicted_yield_tonnes": predicted_yield, # Per hectare, like the batch predictions
+        "prediction_interval_low": interval_low,
+        "prediction_interval_high": interval_high,
+        "confidence_score": confidence,
+        "input_features_summary": {k: (None if pd.isna(v) else float(v)) for k, v in feature_values.items()},
+        "computed_at": now,
+    }
+    prediction_cache.put(crop_cycle_id, {
+        "model_version": bundle.version,
+        "model_group": bundle.group,
+        "input_watermark": prepared["input_watermark"],
+        "source_updated_at": prepared["source_updated_at"],
+        "computed_at": now,
+        "payload": payload,
+    })
+    return {**payload, "cached": False}
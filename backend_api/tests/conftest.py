@@ -0,0 +1,64 @@
+# tessyfarm_smartloop/backend_api/tests/conftest.py
+"""
+Shared fixtures. Database tests run against a throwaway PostgreSQL database named by
+TEST_DATABASE_URL (e.g. postgresql+psycopg2://tessyfarm_user:pw@localhost:5432/tessyfarm_test)
+and are skipped when it is unset. The schema is built once per session by the alembic migrations
+(and downgraded again at the end), and every table is emptied after each test.
+Run from backend_api/: TEST_DATABASE_URL=... python -m pytest tests
+"""
+import os
+import sys
+
+# Same path setup as alembic/env.py, so tests import the app as `app`
+sys.path.insert(0, os.path.realpath(os.path.join(os.path.dirname(__file__), '..')))
+# app.core.config requires the connection settings; tests never use the default engine
+for key in ("POSTGRES_SERVER", "POSTGRES_USER", "POSTGRES_PASSWORD", "POSTGRES_DB"):
+    os.environ.setdefault(key, "test")
+
+import pytest
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from app.core.db import Base
+from app.models import farm # noqa: F401  (registers the models on Base.metadata)
+
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+ALEMBIC_INI = os.path.join(os.path.dirname(__file__), '..', 'alembic.ini')
+
+
+def run_migrations(engine, fn, revision: str):
+    """alembic.command.upgrade/downgrade against the test database rather than settings' URL."""
+    config = Config(ALEMBIC_INI)
+    config.attributes["configure_logger"] = False
+    with engine.connect() as connection:
+        config.attributes["connection"] = connection
+        fn(config, revision)
+
+
+@pytest.fixture(scope="session")
+def engine():
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    engine = create_engine(TEST_DATABASE_URL)
+    # Leftovers of an interrupted run
+    Base.metadata.drop_all(engine)
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS alembic_version"))
+    run_migrations(engine, command.upgrade, "head")
+    yield engine
+    run_migrations(engine, command.downgrade, "base")
+    engine.dispose()
+
+
+@pytest.fixture
+def db(engine):
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+        tables = ", ".join(table.name for table in Base.metadata.sorted_tables)
+        with engine.begin() as conn:
+            conn.execute(text(f"TRUNCATE {tables} RESTART IDENTITY CASCADE"))
@@ -0,0 +1,105 @@
+# tessyfarm_smartloop/backend_api/tests/test_alert_rules.py
+"""
+The IoT listener's alert rule engine (iot_listener/alert_rules.py): transitions, hysteresis,
+sustained windows, rate of change, late readings, evaluate()/apply() and rule reloads.
+Pure in-memory, so these tests need neither TEST_DATABASE_URL nor an MQTT broker.
+"""
+import os
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.realpath(os.path.join(os.path.dirname(__file__), '..', '..', 'iot_listener')))
+
+from alert_rules import Rule, RuleEngine, field_id_for_device # noqa: E402
+
+T0 = datetime(2024, 6, 1, 12, 0)
+DEVICE = "sensor_field_1"
+
+
+def moisture_rule(**overrides) -> Rule:
+    definition = dict(id=1, name="Dry soil", metric="soil_moisture", kind="threshold", operator="<",
+                      threshold=0.2, hysteresis=0.02, field_id=1)
+    definition.update(overrides)
+    return Rule(**definition)
+
+
+def feed(engine: RuleEngine, values, device_id: str = DEVICE, metric: str = "soil_moisture", step=timedelta(minutes=1)):
+    """Evaluates and applies one reading per value, step apart from T0; returns the statuses emitted per reading."""
+    statuses = []
+    for i, value in enumerate(values):
+        evaluation = engine.evaluate(device_id, {metric: value}, T0 + i * step)
+        engine.apply(evaluation)
+        statuses.append([event.status for event in evaluation.events])
+    return statuses
+
+
+def test_field_id_takes_every_digit():
+    assert field_id_for_device("sensor_field_10") == 10
+    assert field_id_for_device("sensor_field_1_a") == 1
+    assert field_id_for_device("sensor_7") is None
+    engine = RuleEngine([moisture_rule()])
+    assert feed(engine, [0.1], device_id="sensor_field_10") == [[]]
+
+
+def test_hysteresis_resolves_past_the_band_without_flapping_inside_it():
+    engine = RuleEngine([moisture_rule()])
+    statuses = feed(engine, [0.25, 0.19, 0.21, 0.18, 0.215, 0.22, 0.19])
+    assert statuses == [[], ["triggered"], [], [], [], ["resolved"], ["triggered"]]
+
+
+def test_sustained_window_starts_on_first_breach_and_resets_when_it_ends():
+    engine = RuleEngine([moisture_rule(kind="sustained", duration_seconds=180)])
+    # Breach at 0-2 min, back above at 3, breach again from 4: triggers 3 minutes after the second start
+    statuses = feed(engine, [0.1, 0.1, 0.1, 0.3, 0.1, 0.1, 0.1, 0.1])
+    assert statuses == [[], [], [], [], [], [], [], ["triggered"]]
+
+
+def test_rate_of_change_is_per_hour():
+    rule = Rule(id=2, name="Heating", metric="temperature", kind="rate_of_change", operator=">", threshold=6.0,
+                device_id=DEVICE)
+    engine = RuleEngine([rule])
+    # +1 degree per 15 minutes is 4/h, then +2 per 15 minutes is 8/h
+    statuses = feed(engine, [20.0, 21.0, 22.0, 24.0], metric="temperature", step=timedelta(minutes=15))
+    assert statuses == [[], [], [], ["triggered"]]
+    evaluation = engine.evaluate(DEVICE, {"temperature": 24.0}, T0 + timedelta(hours=1))
+    assert [event.value for event in evaluation.events] == [0.0]
+
+
+def test_late_readings_are_skipped():
+    engine = RuleEngine([moisture_rule()])
+    feed(engine, [0.3, 0.3])
+    evaluation = engine.evaluate(DEVICE, {"soil_moisture": 0.05}, T0 - timedelta(minutes=5))
+    assert evaluation.events == [] and evaluation.states == {} and evaluation.last == {}
+
+
+def test_evaluate_leaves_state_unchanged_until_apply():
+    engine = RuleEngine([moisture_rule()])
+    first = engine.evaluate(DEVICE, {"soil_moisture": 0.1}, T0)
+    # Not applied (e.g. the write failed): the same reading triggers again
+    retry = engine.evaluate(DEVICE, {"soil_moisture": 0.1}, T0)
+    assert [e.status for e in first.events] == [e.status for e in retry.events] == ["triggered"]
+
+    engine.apply(retry)
+    assert engine.evaluate(DEVICE, {"soil_moisture": 0.1}, T0 + timedelta(minutes=1)).events == []
+
+
+def test_load_keeps_state_of_unchanged_rules_and_drops_changed_ones():
+    other = moisture_rule(id=3, name="Very dry soil", threshold=0.15)
+    engine = RuleEngine([moisture_rule(), other])
+    assert feed(engine, [0.1]) == [["triggered", "triggered"]]
+
+    # Rule 1 unchanged keeps its active state; rule 3 redefined starts from scratch and triggers again
+    engine.load([moisture_rule(), moisture_rule(id=3, name="Very dry soil", threshold=0.12)])
+    evaluation = engine.evaluate(DEVICE, {"soil_moisture": 0.1}, T0 + timedelta(minutes=1))
+    assert [(event.rule.id, event.status) for event in evaluation.events] == [(3, "triggered")]
+
+
+def test_load_drops_last_readings_no_rule_matches():
+    rule = Rule(id=2, name="Heating", metric="temperature", kind="rate_of_change", operator=">", threshold=6.0,
+                device_id=DEVICE)
+    engine = RuleEngine([rule])
+    feed(engine, [20.0], metric="temperature")
+    engine.load([])
+    engine.load([rule])
+    # No baseline survived the gap, so the jump is not a rate of change
+    assert feed(engine, [40.0], metric="temperature") == [[]]
@@ -0,0 +1,115 @@
+# tessyfarm_smartloop/backend_api/tests/test_columnar.py
+"""Columnar sensor reads: binary COPY straight into NumPy, against the same rows fetched as tuples, and Accept negotiation."""
+from datetime import datetime, timedelta
+
+import numpy as np
+import pyarrow as pa
+import pytest
+from sqlalchemy import select
+from starlette.requests import Request
+
+from app.models.farm import SensorReading
+from app.services.columnar import (
+    ARROW_STREAM_MEDIA_TYPE, COLUMNAR_JSON_MEDIA_TYPE, METRIC_KEYS, copy_columns, fetch_sensor_columns, split_columns_by_device,
+    preferred_columnar_format, _arrow_stream,
+)
+
+START = datetime(2024, 6, 1)
+DEVICES = {"sensor_field_2": 40, "sensor_field_1": 25, "field_1'; --": 3} # Quotes must survive the COPY rendering
+
+
+def seed(db):
+    rng = np.random.default_rng(27)
+    for device_id, readings in DEVICES.items():
+        for i in range(readings):
+            db.add(SensorReading(
+                device_id=device_id,
+                temperature=None if i % 4 == 0 else float(rng.uniform(-5, 40)),
+                humidity=None if i % 3 == 0 else float(rng.uniform(20, 95)),
+                soil_moisture=float(rng.uniform(0, 1)),
+                timestamp=START + timedelta(minutes=float(rng.uniform(0, 10000)), microseconds=int(rng.integers(0, 999999))),
+            ))
+    db.commit()
+
+
+def expected_columns(db, *filters, by_device=False):
+    order = (SensorReading.device_id,) if by_device else ()
+    rows = db.execute(select(SensorReading.device_id, SensorReading.timestamp, *(getattr(SensorReading, key) for key in METRIC_KEYS))
+                      .where(*filters).order_by(*order, SensorReading.timestamp.desc())).all()
+    columns = {"timestamps": np.array([row[1] for row in rows], dtype="datetime64[ms]").astype(np.int64)}
+    for i, key in enumerate(METRIC_KEYS):
+        columns[key] = np.array([row[2 + i] for row in rows], dtype=np.float64)
+    return columns, [row[0] for row in rows]
+
+
+def assert_columns_equal(actual, expected):
+    assert list(actual) == ["timestamps", *METRIC_KEYS]
+    assert actual["timestamps"].dtype == np.int64
+    for name, values in expected.items():
+        np.testing.assert_array_equal(actual[name], values)
+
+
+def test_single_device_columns_match_tuple_fetch(db):
+    seed(db)
+    for device_id in DEVICES:
+        columns, device_ids, device_counts = fetch_sensor_columns(
+            db, filters=[SensorReading.device_id == device_id], order_by=[SensorReading.timestamp.desc()])
+        assert device_ids is None and device_counts is None
+        assert_columns_equal(columns, expected_columns(db, SensorReading.device_id == device_id)[0])
+
+
+def test_columns_by_device(db):
+    seed(db)
+    columns, device_ids, device_counts = fetch_sensor_columns(db, order_by=[SensorReading.timestamp.desc()], by_device=True)
+    expected, expected_device_ids = expected_columns(db, by_device=True)
+    assert_columns_equal(columns, expected)
+    assert np.repeat(device_ids, device_counts).tolist() == expected_device_ids
+    assert dict(zip(device_ids, device_counts.tolist())) == DEVICES
+
+    blocks = split_columns_by_device(columns, device_ids, device_counts)
+    assert list(blocks) == device_ids
+    for device_id, block in blocks.items():
+        assert_columns_equal(block, expected_columns(db, SensorReading.device_id == device_id)[0])
+
+    table = pa.ipc.open_stream(_arrow_stream(columns, device_ids, device_counts)).read_all()
+    assert table.column("device_id").to_pylist() == expected_device_ids
+    assert table.column("temperature").null_count == int(np.isnan(expected["temperature"]).sum())
+
+
+def test_no_rows(db):
+    columns, device_ids, device_counts = fetch_sensor_columns(db, by_device=True)
+    assert device_ids == [] and len(device_counts) == 0
+    assert all(len(values) == 0 for values in columns.values())
+    assert split_columns_by_device(columns, device_ids, device_counts) == {}
+
+
+def test_chunks_and_null_rejection(db):
+    seed(db)
+    stmt = select(SensorReading.id, SensorReading.soil_moisture).order_by(SensorReading.id)
+    chunks = []
+    copy_columns(db, stmt, [("id", "i4"), ("soil_moisture", "f8")], on_chunk=chunks.append, chunk_rows=10)
+    assert len(chunks) > 1
+    ids = np.concatenate([chunk["id"] for chunk in chunks])
+    assert ids.tolist() == list(range(1, sum(DEVICES.values()) + 1))
+
+    # NULLs break the fixed-width layout and must be reported, not misparsed
+    with pytest.raises(ValueError):
+        copy_columns(db, select(SensorReading.id, SensorReading.temperature), [("id", "i4"), ("temperature", "f8")])
+
+
+@pytest.mark.parametrize("accept, expected", [
+    ("", None),
+    ("*/*", None),
+    ("application/json", None),
+    (ARROW_STREAM_MEDIA_TYPE, ARROW_STREAM_MEDIA_TYPE),
+    (f"{COLUMNAR_JSON_MEDIA_TYPE}, {ARROW_STREAM_MEDIA_TYPE}", ARROW_STREAM_MEDIA_TYPE), # Tie: Arrow
+    (f"{ARROW_STREAM_MEDIA_TYPE};q=0.5, {COLUMNAR_JSON_MEDIA_TYPE}", COLUMNAR_JSON_MEDIA_TYPE),
+    (f"{ARROW_STREAM_MEDIA_TYPE};q=0, {COLUMNAR_JSON_MEDIA_TYPE};q=0.1", COLUMNAR_JSON_MEDIA_TYPE),
+    (f"{ARROW_STREAM_MEDIA_TYPE}; q=0", None), # Refused, not requested
+    (f"{COLUMNAR_JSON_MEDIA_TYPE}; charset=utf-8; q=0", None),
+    (f"application/json, {ARROW_STREAM_MEDIA_TYPE};q=0.8", None),
+    (f"application/json;q=0.5, {ARROW_STREAM_MEDIA_TYPE};q=0.8", ARROW_STREAM_MEDIA_TYPE),
+])
+def test_preferred_columnar_format_honours_quality(accept, expected):
+    request = Request({"type": "http", "headers": [(b"accept", accept.encode())]})
+    assert preferred_columnar_format(request) == expected
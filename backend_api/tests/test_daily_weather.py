@@ -0,0 +1,129 @@
+# tessyfarm_smartloop/backend_api/tests/test_daily_weather.py
+"""cycle_daily_weather accumulators: rollup upserts, and aggregates built from them equal the raw scan."""
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.core.config import settings
+from app.models.farm import Farm, Field, CropCycle, SensorReading, CycleDailyWeather
+from app.services.yield_features import aggregate_sensor_features, device_in_field, roll_up_daily_weather, AGGREGATE_COLUMNS, GDD_BASE_TEMP
+
+NOW = datetime(2024, 6, 1, 12, 0)
+
+
+def seed(db):
+    rng = np.random.default_rng(30)
+    db.add(Farm(id=1, name="Test farm"))
+    for field_id in (1, 2, 3):
+        db.add(Field(id=field_id, farm_id=1, name=f"Field {field_id}", area_hectares=2.0))
+    db.add(CropCycle(id=1, field_id=1, crop_type="Maize", planting_date=NOW - timedelta(days=30, hours=7)))
+    db.add(CropCycle(id=2, field_id=2, crop_type="Maize", planting_date=NOW - timedelta(days=12)))
+    db.add(CropCycle(id=3, field_id=3, crop_type="Maize", planting_date=NOW - timedelta(days=5))) # No readings
+    db.flush()
+    for field_id in (1, 2):
+        for i in range(400):
+            db.add(SensorReading(
+                device_id=f"sensor_field_{field_id}",
+                temperature=None if i % 9 == 0 else float(rng.uniform(0, 35)),
+                humidity=None if i % 4 == 0 else float(rng.uniform(30, 90)),
+                soil_moisture=float(rng.uniform(0, 1)),
+                timestamp=NOW - timedelta(hours=float(rng.uniform(-24, 24 * 35))),
+            ))
+    db.commit()
+
+
+def raw_daily_gdd(db, cycle_id: int) -> float:
+    """Reference: sum of daily max(0, (min + max) / 2 - base) over the cycle's window, in pandas."""
+    cycle = db.get(CropCycle, cycle_id)
+    readings = pd.read_sql(db.query(SensorReading.timestamp, SensorReading.temperature)
+                           .filter(device_in_field(cycle.field_id))
+                           .filter(SensorReading.timestamp >= cycle.planting_date, SensorReading.timestamp <= NOW)
+                           .statement, db.bind).dropna()
+    daily = readings.groupby(readings["timestamp"].dt.date)["temperature"].agg(["min", "max"])
+    return float(((daily["min"] + daily["max"]) / 2 - GDD_BASE_TEMP).clip(lower=0).sum())
+
+
+def raw_aggregates(db) -> pd.DataFrame:
+    db.query(CycleDailyWeather).delete()
+    db.commit()
+    return aggregate_sensor_features(db, completed=False, now=NOW)
+
+
+@pytest.fixture(params=[False, True], ids=["grouped", "streaming"])
+def streaming(request, monkeypatch):
+    monkeypatch.setattr(settings, "FEATURE_AGGREGATION_STREAMING", request.param)
+    return request.param
+
+
+def assert_aggregates_equal(actual, expected, streaming):
+    # Streaming keeps readings as float32
+    pd.testing.assert_frame_equal(actual[["crop_cycle_id"] + AGGREGATE_COLUMNS], expected[["crop_cycle_id"] + AGGREGATE_COLUMNS],
+                                  check_exact=False, rtol=1e-5 if streaming else 1e-9)
+
+
+def test_accumulated_aggregates_match_raw_readings(db, streaming):
+    seed(db)
+    assert roll_up_daily_weather(db, today=NOW.date()) > 0
+    # Rows stop at the end of yesterday; today's readings come from the raw tail
+    assert db.query(CycleDailyWeather).filter(CycleDailyWeather.day >= NOW.date()).count() == 0
+
+    accumulated = aggregate_sensor_features(db, completed=False, now=NOW)
+    expected = raw_aggregates(db)
+    assert_aggregates_equal(accumulated, expected, streaming)
+    assert expected.loc[expected["crop_cycle_id"] == 1, "gdd_cumulative"].item() == pytest.approx(raw_daily_gdd(db, 1), rel=1e-5)
+    assert np.isnan(expected.loc[expected["crop_cycle_id"] == 3, "gdd_cumulative"].item())
+
+
+def test_rollup_updates_recent_days_with_late_readings(db):
+    seed(db)
+    roll_up_daily_weather(db, today=NOW.date())
+    yesterday = (NOW - timedelta(days=1)).date()
+    row = db.query(CycleDailyWeather).filter_by(crop_cycle_id=1, day=yesterday).one()
+    count_before = row.reading_count
+
+    db.add(SensorReading(device_id="sensor_field_1", temperature=50.0, humidity=None, soil_moisture=None,
+                         timestamp=datetime.combine(yesterday, datetime.min.time()) + timedelta(hours=3)))
+    db.commit()
+    roll_up_daily_weather(db, today=NOW.date())
+    db.expire_all()
+    row = db.query(CycleDailyWeather).filter_by(crop_cycle_id=1, day=yesterday).one()
+    assert row.reading_count == count_before + 1
+    assert row.max_temp == 50.0
+
+
+def test_edited_cycles_fall_back_to_raw_readings_until_rebuilt(db):
+    seed(db)
+    roll_up_daily_weather(db, today=NOW.date())
+    cycle = db.get(CropCycle, 1)
+    cycle.planting_date = NOW - timedelta(days=10)
+    db.commit()
+
+    # Stale accumulators are ignored before the next rollup and rebuilt by it
+    before_rollup = aggregate_sensor_features(db, completed=False, now=NOW)
+    roll_up_daily_weather(db, today=NOW.date())
+    assert db.query(CycleDailyWeather).filter(CycleDailyWeather.crop_cycle_id == 1,
+                                              CycleDailyWeather.day < cycle.planting_date.date()).count() == 0
+    after_rollup = aggregate_sensor_features(db, completed=False, now=NOW)
+    expected = raw_aggregates(db)
+    assert_aggregates_equal(before_rollup, expected, streaming=False)
+    assert_aggregates_equal(after_rollup, expected, streaming=False)
+
+
+def test_devices_of_field_10_are_not_counted_for_field_1(db, streaming):
+    seed(db)
+    db.add(Field(id=10, farm_id=1, name="Field 10", area_hectares=2.0))
+    db.add(CropCycle(id=10, field_id=10, crop_type="Maize", planting_date=NOW - timedelta(days=30)))
+    for hours in (3, 27, 51):
+        db.add(SensorReading(device_id="sensor_field_10", temperature=99.0, humidity=None, soil_moisture=None,
+                             timestamp=NOW - timedelta(hours=hours)))
+    db.commit()
+
+    raw = raw_aggregates(db).set_index("crop_cycle_id")
+    roll_up_daily_weather(db, today=NOW.date())
+    accumulated = aggregate_sensor_features(db, completed=False, now=NOW).set_index("crop_cycle_id")
+    for aggregates in (raw, accumulated):
+        assert aggregates.loc[1, "max_temp"] < 99.0
+        assert aggregates.loc[10, "reading_count"] == 3
+        assert aggregates.loc[10, "max_temp"] == 99.0
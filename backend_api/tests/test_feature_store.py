@@ -0,0 +1,64 @@
+# tessyfarm_smartloop/backend_api/tests/test_feature_store.py
+"""cycle_features store: rows are reused until the cycle, its field or its readings change."""
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from app.models.farm import Farm, Field, CropCycle, SensorReading, CycleFeature
+from app.services.yield_features import load_cycle_aggregates, AGGREGATE_COLUMNS, FEATURE_VERSION
+
+NOW = datetime(2024, 6, 1, 12, 0)
+
+
+def seed(db):
+    db.add(Farm(id=1, name="Test farm"))
+    for field_id in (1, 2, 3):
+        db.add(Field(id=field_id, farm_id=1, name=f"Field {field_id}", area_hectares=2.0))
+    for cycle_id in (1, 2, 3):
+        db.add(CropCycle(id=cycle_id, field_id=cycle_id, crop_type="Maize", planting_date=NOW - timedelta(days=20)))
+    db.flush()
+    for field_id in (1, 2):
+        for day in range(20):
+            db.add(SensorReading(device_id=f"sensor_field_{field_id}", temperature=10.0 + day, humidity=None,
+                                 soil_moisture=0.1 * field_id, timestamp=NOW - timedelta(days=day, hours=1)))
+    db.commit()
+
+
+def stored_rows(db) -> dict:
+    db.expire_all()
+    return {row.crop_cycle_id: (row.data_watermark, row.features)
+            for row in db.query(CycleFeature).filter(CycleFeature.feature_version == FEATURE_VERSION)}
+
+
+def assert_matches_raw(db, df):
+    raw = load_cycle_aggregates(db, completed=False, now=NOW, use_store=False)
+    pd.testing.assert_frame_equal(df[["crop_cycle_id"] + AGGREGATE_COLUMNS], raw[["crop_cycle_id"] + AGGREGATE_COLUMNS],
+                                  check_exact=False, rtol=1e-9)
+
+
+def test_store_serves_unchanged_cycles_and_recomputes_stale_ones(db):
+    seed(db)
+    first = load_cycle_aggregates(db, completed=False, now=NOW)
+    assert_matches_raw(db, first)
+    stored = stored_rows(db)
+    assert sorted(stored) == [1, 2, 3]
+    assert stored[3][1]["reading_count"] == 0 and stored[3][1]["avg_temp"] is None # NaN is stored as null
+
+    # A new reading in cycle 1's window moves only cycle 1 past its watermark
+    db.add(SensorReading(device_id="sensor_field_1", temperature=35.0, humidity=50.0, soil_moisture=0.9,
+                         timestamp=NOW - timedelta(hours=2)))
+    db.commit()
+    second = load_cycle_aggregates(db, completed=False, now=NOW)
+    assert_matches_raw(db, second)
+    restored = stored_rows(db)
+    assert restored[1][0] > stored[1][0]
+    assert restored[1][1]["reading_count"] == stored[1][1]["reading_count"] + 1
+    assert restored[2] == stored[2] and restored[3] == stored[3]
+
+    # Editing a cycle invalidates its row even without new readings
+    cycle = db.get(CropCycle, 2)
+    cycle.planting_date = NOW - timedelta(days=5)
+    db.commit()
+    third = load_cycle_aggregates(db, completed=False, now=NOW)
+    assert_matches_raw(db, third)
+    assert stored_rows(db)[2][1]["reading_count"] < stored[2][1]["reading_count"]
@@ -0,0 +1,44 @@
+# tessyfarm_smartloop/backend_api/tests/test_migrations.py
+"""The alembic revisions build exactly the schema the models describe, and downgrade cleanly."""
+from alembic import command
+from alembic.autogenerate import compare_metadata
+from alembic.migration import MigrationContext
+from sqlalchemy import inspect, text
+
+from app.core.db import Base
+from conftest import run_migrations
+
+
+def schema_diff(engine) -> list:
+    with engine.connect() as connection:
+        return compare_metadata(MigrationContext.configure(connection), Base.metadata)
+
+
+def test_migrated_schema_matches_models(engine):
+    assert schema_diff(engine) == []
+
+
+def test_downgrade_to_baseline_and_back(engine):
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO farms (id, name) VALUES (1, 'Farm')"))
+        conn.execute(text("INSERT INTO fields (id, farm_id, name) VALUES (1, 1, 'Field')"))
+        conn.execute(text("INSERT INTO crop_cycles (id, field_id, crop_type, planting_date) VALUES (1, 1, 'Maize', '2024-05-01')"))
+        conn.execute(text("""
+            INSERT INTO yield_predictions (crop_cycle_id, model_version, prediction_date, predicted_yield_tonnes)
+            VALUES (1, 'v1', '2024-06-01', 4.0), (1, 'v2', '2024-06-02', 5.0)
+        """))
+    run_migrations(engine, command.downgrade, "9c1e4a7d2b60")
+    try:
+        tables = set(inspect(engine).get_table_names())
+        assert {"sensor_readings", "farms", "fields", "crop_cycles", "yield_predictions"} <= tables
+        assert not tables & {"cycle_features", "cycle_daily_weather", "job_runs", "alert_rules", "sensor_alerts"}
+        unique = inspect(engine).get_unique_constraints("yield_predictions")
+        assert [c["column_names"] for c in unique] == [["crop_cycle_id"]]
+        # One prediction per cycle fits the baseline constraint: the newest is kept
+        with engine.connect() as conn:
+            assert conn.execute(text("SELECT model_version FROM yield_predictions")).scalars().all() == ["v2"]
+    finally:
+        run_migrations(engine, command.upgrade, "head")
+        with engine.begin() as conn:
+            conn.execute(text("TRUNCATE yield_predictions, crop_cycles, fields, farms RESTART IDENTITY CASCADE"))
+    assert schema_diff(engine) == []
@@ -0,0 +1,104 @@
+# tessyfarm_smartloop/backend_api/tests/test_read_replica.py
+"""
+Read routing (core/db.py): get_read_db uses the replica unless the client's read-your-writes
+cookie is still valid, and the cookie is only set after a request committed an ORM write.
+The primary and the "replica" are two SQLite files holding different rows, standing in for
+replication lag, so these tests do not need TEST_DATABASE_URL.
+"""
+import time
+
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app.core import db as core_db
+from app.core.db import READ_YOUR_WRITES_COOKIE, ReadYourWritesMiddleware, get_db, get_read_db
+from app.models.farm import Farm
+
+WINDOW_SECONDS = 60
+
+
+@pytest.fixture
+def databases(tmp_path):
+    """Binds SessionLocal and ReadSessionLocal to two SQLite files: the primary has one farm, the replica none."""
+    primary = create_engine(f"sqlite:///{tmp_path / 'primary.db'}")
+    replica = create_engine(f"sqlite:///{tmp_path / 'replica.db'}")
+    for engine in (primary, replica):
+        Farm.__table__.create(engine)
+    with primary.begin() as conn:
+        conn.execute(Farm.__table__.insert().values(name="Written to the primary"))
+
+    binds = core_db.SessionLocal.kw["bind"], core_db.ReadSessionLocal.kw["bind"]
+    core_db.SessionLocal.configure(bind=primary)
+    core_db.ReadSessionLocal.configure(bind=replica)
+    yield
+    core_db.SessionLocal.configure(bind=binds[0])
+    core_db.ReadSessionLocal.configure(bind=binds[1])
+    primary.dispose()
+    replica.dispose()
+
+
+@pytest.fixture
+def client(databases):
+    app = FastAPI()
+    app.add_middleware(ReadYourWritesMiddleware, window_seconds=WINDOW_SECONDS)
+
+    @app.get("/farms")
+    def list_farms(db: Session = Depends(get_read_db)):
+        return [farm.name for farm in db.query(Farm).order_by(Farm.id)]
+
+    @app.post("/farms")
+    def create_farm(name: str, db: Session = Depends(get_db)):
+        db.add(Farm(name=name))
+        db.commit()
+        return {"ok": True}
+
+    @app.post("/farms/rolled-back")
+    def create_farm_rolled_back(name: str, db: Session = Depends(get_db)):
+        db.add(Farm(name=name))
+        db.flush()
+        db.rollback()
+        return {"ok": True}
+
+    @app.post("/farms/read-only")
+    def read_through_primary(db: Session = Depends(get_db)):
+        db.query(Farm).count()
+        db.commit()
+        return {"ok": True}
+
+    with TestClient(app) as client:
+        yield client
+
+
+def test_reads_go_to_the_replica_without_a_recent_write(client):
+    assert client.get("/farms").json() == []
+
+
+def test_commit_pins_the_client_to_the_primary(client):
+    response = client.post("/farms", params={"name": "New farm"})
+    assert READ_YOUR_WRITES_COOKIE in response.cookies
+    primary_until = float(response.cookies[READ_YOUR_WRITES_COOKIE])
+    assert time.time() < primary_until <= time.time() + WINDOW_SECONDS
+
+    # The client sends the cookie back: its reads see its own write
+    assert client.get("/farms").json() == ["Written to the primary", "New farm"]
+    # Other clients keep reading from the replica
+    client.cookies.clear()
+    assert client.get("/farms").json() == []
+
+
+def test_expired_cookie_reads_from_the_replica(client):
+    client.cookies.set(READ_YOUR_WRITES_COOKIE, f"{time.time() - 1:.3f}")
+    assert client.get("/farms").json() == []
+    client.cookies.set(READ_YOUR_WRITES_COOKIE, "not-a-timestamp")
+    assert client.get("/farms").json() == []
+
+
+@pytest.mark.parametrize("path", ["/farms/rolled-back", "/farms/read-only"])
+def test_no_cookie_without_a_committed_write(client, path):
+    response = client.post(path, params={"name": "Never stored"})
+    assert response.status_code == 200
+    assert READ_YOUR_WRITES_COOKIE not in response.cookies
+    assert client.get("/farms").json() == []
@@ -0,0 +1,46 @@
+# tessyfarm_smartloop/backend_api/tests/test_sensor_aggregation.py
+"""Cross-device aggregation: device-to-field matching with field ids sharing a prefix (1 and 10)."""
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models.farm import Farm, Field, SensorReading
+from app.services.sensor_aggregation import aggregate_sensor_readings
+
+START = datetime(2024, 6, 1)
+DEVICE_READINGS = { # device_id -> (field id, readings)
+    "field_1": (1, 3),
+    "sensor_field_1_north": (1, 4),
+    "sensor_field_10": (10, 5),
+    "sensor_field_10_south": (10, 6),
+    "sensor_field_11": (None, 7), # Field 11 belongs to another farm
+}
+
+
+@pytest.fixture
+def farm_with_fields_1_and_10(db):
+    db.add_all([Farm(id=1, name="Farm one"), Farm(id=2, name="Farm two")])
+    db.add_all([Field(id=1, farm_id=1, name="Field 1"), Field(id=10, farm_id=1, name="Field 10"),
+                Field(id=11, farm_id=2, name="Field 11")])
+    db.flush()
+    for device_id, (_, readings) in DEVICE_READINGS.items():
+        for i in range(readings):
+            db.add(SensorReading(device_id=device_id, temperature=20.0 + i, timestamp=START + timedelta(minutes=10 * i)))
+    db.commit()
+
+
+def aggregate(db, group_by, scope="farm", scope_id=1):
+    result = aggregate_sensor_readings(db, scope, scope_id, None, START, START + timedelta(days=1), timedelta(days=1),
+                                       ["temperature"], ["count"], group_by=group_by)
+    return {series["key"]: sum(series["reading_count"]) for series in result["series"]}
+
+
+def test_farm_scope_counts_each_reading_once(db, farm_with_fields_1_and_10):
+    assert aggregate(db, "scope") == {"farm": 3 + 4 + 5 + 6}
+
+
+def test_readings_are_attributed_to_their_own_field(db, farm_with_fields_1_and_10):
+    assert aggregate(db, "field") == {"1": 3 + 4, "10": 5 + 6}
+    assert aggregate(db, "device", scope="field", scope_id=1) == {"field_1": 3, "sensor_field_1_north": 4}
+    assert aggregate(db, "device") == {device_id: readings for device_id, (field_id, readings) in DEVICE_READINGS.items()
+                                       if field_id in (1, 10)}
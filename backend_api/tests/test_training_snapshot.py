@@ -0,0 +1,105 @@
+# tessyfarm_smartloop/backend_api/tests/test_training_snapshot.py
+"""Trainer snapshot: incremental refresh by append, by replacing edited or late-reading cycles, and by removal."""
+import json
+import os
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from app.models.farm import Farm, Field, CropCycle, SensorReading
+from app.services.training_snapshot import SNAPSHOT_META_FILENAME, load_training_snapshot
+from app.services.yield_features import build_training_features
+
+HARVEST = datetime(2024, 5, 1)
+
+
+def add_completed_cycle(db, cycle_id: int, yield_tonnes: float = 10.0):
+    """A harvested cycle on field cycle_id with 30 daily readings from its own device."""
+    db.add(Field(id=cycle_id, farm_id=1, name=f"Field {cycle_id}", area_hectares=2.0))
+    db.add(CropCycle(id=cycle_id, field_id=cycle_id, crop_type="Maize", planting_date=HARVEST - timedelta(days=30),
+                     actual_harvest_date=HARVEST, actual_yield_tonnes=yield_tonnes))
+    db.flush()
+    for day in range(30):
+        db.add(SensorReading(device_id=f"sensor_field_{cycle_id}", temperature=12.0 + day % 7 + cycle_id,
+                             humidity=60.0, soil_moisture=0.3, timestamp=HARVEST - timedelta(days=day, hours=2)))
+    db.commit()
+
+
+def seed(db):
+    db.add(Farm(id=1, name="Test farm"))
+    db.flush()
+    for cycle_id in (1, 2):
+        add_completed_cycle(db, cycle_id)
+
+
+def read_meta(root) -> dict:
+    with open(os.path.join(root, SNAPSHOT_META_FILENAME)) as f:
+        return json.load(f)
+
+
+def assert_matches_rebuild(db, df):
+    expected = build_training_features(db, use_store=False)
+    assert sorted(df["crop_cycle_id"]) == sorted(expected["crop_cycle_id"])
+    pd.testing.assert_frame_equal(df.sort_values("crop_cycle_id").reset_index(drop=True),
+                                  expected.sort_values("crop_cycle_id").reset_index(drop=True),
+                                  check_exact=False, rtol=1e-9)
+
+
+def test_unchanged_snapshot_is_served_from_its_parts(db, tmp_path):
+    seed(db)
+    first = load_training_snapshot(db, snapshot_dir=str(tmp_path))
+    meta = read_meta(tmp_path)
+    assert len(meta["parts"]) == 1 and meta["cycle_ids"] == [1, 2]
+
+    second = load_training_snapshot(db, snapshot_dir=str(tmp_path))
+    assert read_meta(tmp_path)["parts"] == meta["parts"]
+    pd.testing.assert_frame_equal(second, first)
+
+
+def test_new_harvests_are_appended_as_a_part(db, tmp_path):
+    seed(db)
+    load_training_snapshot(db, snapshot_dir=str(tmp_path))
+    parts_before = read_meta(tmp_path)["parts"]
+
+    add_completed_cycle(db, 3)
+    df = load_training_snapshot(db, snapshot_dir=str(tmp_path))
+    parts = read_meta(tmp_path)["parts"]
+    assert parts[:-1] == parts_before and len(parts) == 2
+    assert_matches_rebuild(db, df)
+
+
+def test_edited_and_late_reading_cycles_are_replaced(db, tmp_path):
+    seed(db)
+    add_completed_cycle(db, 3)
+    before = load_training_snapshot(db, snapshot_dir=str(tmp_path)).set_index("crop_cycle_id")
+    old_parts = read_meta(tmp_path)["parts"]
+
+    db.get(CropCycle, 1).actual_yield_tonnes = 14.0
+    # Arrives after the snapshot but falls inside cycle 2's (closed) window
+    db.add(SensorReading(device_id="sensor_field_2", temperature=40.0, humidity=60.0, soil_moisture=0.3,
+                         timestamp=HARVEST - timedelta(days=3)))
+    db.commit()
+    df = load_training_snapshot(db, snapshot_dir=str(tmp_path))
+    after = df.set_index("crop_cycle_id")
+
+    parts = read_meta(tmp_path)["parts"]
+    assert len(parts) == 1 and parts != old_parts
+    assert sorted(os.listdir(tmp_path)) == sorted(parts + [SNAPSHOT_META_FILENAME])
+    assert after.loc[1, "actual_yield_tonnes_per_hectare"] == 7.0
+    assert after.loc[2, "max_temp"] == 40.0 and before.loc[2, "max_temp"] < 40.0
+    pd.testing.assert_series_equal(after.loc[3], before.loc[3])
+    assert_matches_rebuild(db, df)
+
+
+def test_cycles_no_longer_completed_are_removed(db, tmp_path):
+    seed(db)
+    add_completed_cycle(db, 3)
+    load_training_snapshot(db, snapshot_dir=str(tmp_path))
+
+    cycle = db.get(CropCycle, 3)
+    cycle.actual_harvest_date, cycle.actual_yield_tonnes = None, None
+    db.commit()
+    df = load_training_snapshot(db, snapshot_dir=str(tmp_path))
+    assert read_meta(tmp_path)["cycle_ids"] == [1, 2]
+    assert sorted(df["crop_cycle_id"]) == [1, 2]
+    assert_matches_rebuild(db, df)
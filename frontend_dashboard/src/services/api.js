@@ -26,6 +26,17 @@ export const updateField = (fieldId, fieldData) => apiClient.put(`/fields/${fiel
 // --- Sensor Data Endpoints ---
 // ... (placeholder for getSensorDataForField) ...
 
+// Columnar format: { timestamps: [epoch ms...], temperature: [...], humidity: [...], soil_moisture: [...] }
+// Missing values are null. Arrays can be passed straight to a chart as x/y series.
+export const COLUMNAR_SENSOR_MEDIA_TYPE = 'application/vnd.tessyfarm.columnar+json';
+export const getSensorDataColumnar = (deviceId) =>
+  apiClient.get(`/farm-data/sensor-data/${deviceId}`, {
+    headers: { Accept: COLUMNAR_SENSOR_MEDIA_TYPE },
+  });
+// Turns one metric column into [{ x: Date, y: value }] points for charts that expect point objects.
+export const columnarToPoints = (columns, metric) =>
+  columns.timestamps.map((ts, i) => ({ x: new Date(ts), y: columns[metric][i] }));
+
 export default apiClient;
 
 // frontend_dashboard/src/services/api.js
@@ -0,0 +1,235 @@
+# tessyfarm_smartloop/iot_listener/alert_rules.py
+"""
+Streaming alert rules, evaluated by listener.on_message on every incoming reading.
+
+Rules (the alert_rules table, see backend_api/app/models/farm.py) target one device or every
+device of a field, and one metric:
+- threshold:       the reading is below/above the threshold
+- rate_of_change:  the change since the device's previous reading, per hour, is below/above it
+- sustained:       every reading for at least duration_seconds is below/above it
+
+RuleEngine.load() compiles the rules into dicts keyed by device id and by field id, each holding
+the rules per metric, so a reading only touches the rules that target its device or field;
+the cost per message does not grow with the total number of rules.
+
+State is kept per (rule, device). An alert is emitted on each transition only: "triggered"
+when the condition starts to hold, "resolved" once the value is back past the threshold by
+the rule's hysteresis margin (e.g. "< 0.2" with hysteresis 0.02 resolves at >= 0.22). Values
+inside the band keep the current state, which suppresses flapping around the threshold.
+
+Field membership uses the placeholder rule of the feature engineering (backend_api's
+yield_features.device_in_field): a device belongs to field N when its id contains "field_N" not
+followed by another digit. FIELD_ID_PATTERN takes every digit after "field_", so
+"sensor_field_10" is in field 10 only, never field 1. State lives in memory, so a restart starts
+every sustained window and rate-of-change baseline afresh. Readings older than the device's latest
+reading for a metric are not evaluated.
+
+evaluate() does not change any state: it returns the alerts together with the state the reading
+leads to, and the caller apply()s that once the reading and its alerts are committed. A failed
+write thus leaves the engine as if the reading had never arrived. Only states that differ from
+the default (active, or inside a sustained breach) are kept, and load() drops the state and last
+readings that no remaining rule can use, so memory is bounded by the devices the rules target.
+"""
+import re
+from dataclasses import dataclass, field, replace
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+METRICS = ("temperature", "humidity", "soil_moisture")
+RULE_KINDS = ("threshold", "rate_of_change", "sustained")
+OPERATORS = ("<", ">")
+FIELD_ID_PATTERN = re.compile(r"field_(\d+)")
+
+
+def field_id_for_device(device_id: str) -> Optional[int]:
+    match = FIELD_ID_PATTERN.search(device_id)
+    return int(match.group(1)) if match else None
+
+
+@dataclass(frozen=True)
+class Rule:
+    id: int
+    name: str
+    metric: str
+    kind: str
+    operator: str
+    threshold: float
+    hysteresis: float = 0.0
+    duration_seconds: Optional[float] = None
+    severity: str = "warning"
+    device_id: Optional[str] = None
+    field_id: Optional[int] = None
+
+    @classmethod
+    def from_row(cls, row) -> "Rule":
+        """From an alert_rules row; raises ValueError for an unusable definition."""
+        rule = cls(
+            id=row.id, name=row.name, metric=row.metric, kind=row.kind, operator=row.operator,
+            threshold=row.threshold, hysteresis=row.hysteresis or 0.0, duration_seconds=row.duration_seconds,
+            severity=row.severity or "warning", device_id=row.device_id, field_id=row.field_id,
+        )
+        if rule.metric not in METRICS or rule.kind not in RULE_KINDS or rule.operator not in OPERATORS:
+            raise ValueError(f"rule {rule.id}: unknown metric, kind or operator")
+        if (rule.device_id is None) == (rule.field_id is None):
+            raise ValueError(f"rule {rule.id}: exactly one of device_id and field_id must be set")
+        if rule.kind == "sustained" and not rule.duration_seconds:
+            raise ValueError(f"rule {rule.id}: sustained rules need duration_seconds")
+        return rule
+
+    def breached(self, value: float) -> bool:
+        return value < self.threshold if self.operator == "<" else value > self.threshold
+
+    def cleared(self, value: float) -> bool:
+        if self.operator == "<":
+            return value >= self.threshold + self.hysteresis
+        return value <= self.threshold - self.hysteresis
+
+
+@dataclass
+class RuleState:
+    active: bool = False
+    breach_started_at: Optional[datetime] = None # sustained: first reading of the current breach
+
+
+DEFAULT_STATE = RuleState()
+
+
+@dataclass
+class AlertEvent:
+    rule: Rule
+    device_id: str
+    field_id: Optional[int]
+    status: str # triggered or resolved
+    value: float
+    timestamp: datetime
+
+    @property
+    def message(self) -> str:
+        what = f"{self.rule.metric} change per hour" if self.rule.kind == "rate_of_change" else self.rule.metric
+        if self.status == "resolved":
+            return f"{self.rule.name} resolved on {self.device_id}: {what} {self.value:.4g}"
+        condition = f"{what} {self.value:.4g} {self.rule.operator} {self.rule.threshold:g}"
+        if self.rule.kind == "sustained":
+            condition += f" for {self.rule.duration_seconds:g}s"
+        return f"{self.rule.name} triggered on {self.device_id}: {condition}"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "rule_id": self.rule.id,
+            "rule_name": self.rule.name,
+            "device_id": self.device_id,
+            "field_id": self.field_id,
+            "metric": self.rule.metric,
+            "kind": self.rule.kind,
+            "status": self.status,
+            "severity": self.rule.severity,
+            "value": self.value,
+            "threshold": self.rule.threshold,
+            "reading_timestamp": self.timestamp.isoformat(),
+            "message": self.message,
+        }
+
+
+@dataclass
+class Evaluation:
+    """Result of RuleEngine.evaluate(): the alerts, and the state to apply() once they are stored."""
+    events: List[AlertEvent] = field(default_factory=list)
+    states: Dict[Tuple[int, str], RuleState] = field(default_factory=dict)
+    last: Dict[Tuple[str, str], Tuple[datetime, float]] = field(default_factory=dict)
+
+
+class RuleEngine:
+    """Indexed rule lookup plus per-(rule, device) alert state and per-(device, metric) last reading."""
+
+    def __init__(self, rules: Iterable[Rule] = ()):
+        self.rules: Dict[int, Rule] = {}
+        self._by_device: Dict[str, Dict[str, List[Rule]]] = {}
+        self._by_field: Dict[int, Dict[str, List[Rule]]] = {}
+        self._states: Dict[Tuple[int, str], RuleState] = {}
+        self._last: Dict[Tuple[str, str], Tuple[datetime, float]] = {}
+        self.load(rules)
+
+    def load(self, rules: Iterable[Rule]):
+        """
+        Replaces the rule set; state is kept for rules whose definition did not change, and last
+        readings only for (device, metric) pairs some rule still matches.
+        """
+        rules = {rule.id: rule for rule in rules}
+        by_device: Dict[str, Dict[str, List[Rule]]] = {}
+        by_field: Dict[int, Dict[str, List[Rule]]] = {}
+        for rule in rules.values():
+            index, key = (by_device, rule.device_id) if rule.device_id is not None else (by_field, rule.field_id)
+            index.setdefault(key, {}).setdefault(rule.metric, []).append(rule)
+        self._states = {key: state for key, state in self._states.items() if rules.get(key[0]) == self.rules.get(key[0])}
+        self.rules, self._by_device, self._by_field = rules, by_device, by_field
+        self._last = {(device_id, metric): last for (device_id, metric), last in self._last.items()
+                      if metric in self._matching(device_id, field_id_for_device(device_id))}
+
+    def _matching(self, device_id: str, field_id: Optional[int]) -> Dict[str, List[Rule]]:
+        device_rules = self._by_device.get(device_id)
+        field_rules = self._by_field.get(field_id) if field_id is not None else None
+        if not field_rules:
+            return device_rules or {}
+        if not device_rules:
+            return field_rules
+        return {metric: device_rules.get(metric, []) + field_rules.get(metric, [])
+                for metric in device_rules.keys() | field_rules.keys()}
+
+    def evaluate(self, device_id: str, values: Dict[str, Optional[float]], timestamp: datetime) -> Evaluation:
+        """
+        Alert transitions caused by one reading (values: metric -> value, None when absent).
+        Leaves the engine unchanged; pass the result to apply() once the reading is stored.
+        """
+        if timestamp.tzinfo is not None: # Devices may send offsets; state is kept in naive UTC
+            timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+        field_id = field_id_for_device(device_id)
+        evaluation = Evaluation()
+        for metric, rules in self._matching(device_id, field_id).items():
+            value = values.get(metric)
+            if value is None:
+                continue
+            last = self._last.get((device_id, metric))
+            if last is not None and timestamp < last[0]:
+                continue # Late reading; state has moved past it
+            evaluation.last[(device_id, metric)] = (timestamp, value)
+            for rule in rules:
+                state = replace(self._states.get((rule.id, device_id), DEFAULT_STATE))
+                event = self._evaluate_rule(rule, state, device_id, field_id, value, last, timestamp)
+                evaluation.states[(rule.id, device_id)] = state
+                if event is not None:
+                    evaluation.events.append(event)
+        return evaluation
+
+    def apply(self, evaluation: Evaluation):
+        """Makes the state of an evaluate() result current; call it after the reading and alerts are committed."""
+        self._last.update(evaluation.last)
+        for key, state in evaluation.states.items():
+            if state == DEFAULT_STATE or key[0] not in self.rules:
+                self._states.pop(key, None)
+            else:
+                self._states[key] = state
+
+    def _evaluate_rule(self, rule: Rule, state: RuleState, device_id: str, field_id: Optional[int], value: float,
+                       last: Optional[Tuple[datetime, float]], timestamp: datetime) -> Optional[AlertEvent]:
+        """Updates state (a copy owned by the caller) for one reading and returns the transition, if any."""
+        if rule.kind == "rate_of_change":
+            if last is None or timestamp <= last[0]:
+                return None
+            value = (value - last[1]) / ((timestamp - last[0]).total_seconds() / 3600)
+
+        if state.active:
+            if rule.cleared(value):
+                state.active, state.breach_started_at = False, None
+                return AlertEvent(rule, device_id, field_id, "resolved", value, timestamp)
+            return None
+
+        if not rule.breached(value):
+            state.breach_started_at = None
+            return None
+        if rule.kind == "sustained":
+            if state.breach_started_at is None:
+                state.breach_started_at = timestamp
+            if (timestamp - state.breach_started_at).total_seconds() < rule.duration_seconds:
+                return None
+        state.active = True
+        return AlertEvent(rule, device_id, field_id, "triggered", value, timestamp)
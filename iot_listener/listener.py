@@ -3,16 +3,20 @@ import os
 import json
 import logging
 import time
+import socket
 from datetime import datetime
+from typing import Any, Optional
 
 import paho.mqtt.client as mqtt
 from pydantic import BaseModel, Field, ValidationError # For data validation from MQTT
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, JSON
+from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, JSON, Boolean, ForeignKey
 from sqlalchemy.orm import sessionmaker, declarative_base
 from sqlalchemy.sql import func
 
+from alert_rules import Evaluation, Rule, RuleEngine, METRICS
+
 # --- Configuration ---
 # Similar to backend_api/app/core/config.py for Pydantic settings
 class ListenerSettings(BaseSettings):
@@ -29,6 +33,11 @@ class ListenerSettings(BaseSettings):
     MQTT_CLIENT_ID: str = "tessyfarm_iot_listener"
     MQTT_TOPIC_PREFIX: str = "tessyfarm/data/" # e.g., tessyfarm/data/device_id
 
+    # Alert rules evaluated on each reading (see alert_rules.py)
+    ALERTS_ENABLED: bool = True
+    ALERT_TOPIC_PREFIX: str = "tessyfarm/alerts/" # Alerts are published to <prefix><device_id>
+    ALERT_RULES_RELOAD_SECONDS: float = 30.0 # How often rule changes in alert_rules are picked up
+
     model_config = SettingsConfigDict(env_file=".env", extra="ignore")
 
     @property
@@ -61,6 +70,40 @@ class SensorReadingDB(Base): # Renamed to avoid potential import confusion if ev
     timestamp = Column(DateTime, nullable=False, default=datetime.utcnow)
     received_at = Column(DateTime, default=func.now())
 
+# --- Alert tables (identical to backend_api/app/models/farm.py AlertRule, SensorAlert) ---
+class AlertRuleDB(Base):
+    __tablename__ = "alert_rules"
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, nullable=False)
+    enabled = Column(Boolean, nullable=False, default=True)
+    device_id = Column(String, nullable=True, index=True)
+    field_id = Column(Integer, nullable=True, index=True) # FK to fields.id in the backend model
+    metric = Column(String, nullable=False)
+    kind = Column(String, nullable=False)
+    operator = Column(String, nullable=False)
+    threshold = Column(Float, nullable=False)
+    duration_seconds = Column(Float, nullable=True)
+    hysteresis = Column(Float, nullable=False, default=0.0)
+    severity = Column(String, nullable=False, default="warning")
+    created_at = Column(DateTime, default=func.now())
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+class SensorAlertDB(Base):
+    __tablename__ = "sensor_alerts"
+    id = Column(Integer, primary_key=True, index=True)
+    rule_id = Column(Integer, ForeignKey("alert_rules.id", ondelete="SET NULL"), nullable=True, index=True)
+    rule_name = Column(String, nullable=False)
+    device_id = Column(String, nullable=False, index=True)
+    field_id = Column(Integer, nullable=True, index=True)
+    metric = Column(String, nullable=False)
+    status = Column(String, nullable=False)
+    severity = Column(String, nullable=False)
+    value = Column(Float, nullable=True)
+    threshold = Column(Float, nullable=False)
+    reading_timestamp = Column(DateTime, nullable=False)
+    message = Column(String, nullable=True)
+    created_at = Column(DateTime, default=func.now(), index=True)
+
 # Create tables if they don't exist (Alembic in backend_api handles this, but good for standalone robustness)
 # In a production setup, migrations should be the sole source of truth for schema.
 # This line is mostly for ensuring the table exists if the listener starts before migrations run or in isolated tests.
@@ -77,6 +120,39 @@ class MQTTSensorData(BaseModel):
     timestamp: datetime = Field(default_factory=datetime.utcnow) # Expect ISO format string, Pydantic converts
 
 
+# --- Alert Rules ---
+rule_engine = RuleEngine()
+_rules_loaded_at = None # time.monotonic() of the last successful load
+
+def refresh_alert_rules(force: bool = False):
+    """Reloads the enabled rules every ALERT_RULES_RELOAD_SECONDS; keeps the previous set if the load fails."""
+    global _rules_loaded_at
+    now = time.monotonic()
+    if not force and _rules_loaded_at is not None and now - _rules_loaded_at < settings.ALERT_RULES_RELOAD_SECONDS:
+        return
+    _rules_loaded_at = now # Also throttles retries after a failed load
+    db = SessionLocal()
+    try:
+        rules = []
+        for row in db.query(AlertRuleDB).filter(AlertRuleDB.enabled.is_(True)).all():
+            try:
+                rules.append(Rule.from_row(row))
+            except ValueError as e:
+                logger.warning(f"Skipping alert rule: {e}")
+        if set(rules) != set(rule_engine.rules.values()):
+            logger.info(f"Loaded {len(rules)} alert rules.")
+        rule_engine.load(rules)
+    except Exception as e:
+        logger.error(f"Could not load alert rules, keeping the previous {len(rule_engine.rules)}: {e}")
+    finally:
+        db.close()
+
+def publish_alerts(client, events):
+    for event in events:
+        payload = json.dumps(event.to_dict())
+        client.publish(f"{settings.ALERT_TOPIC_PREFIX}{event.device_id}", payload, qos=1)
+        logger.warning(f"Alert: {event.message}")
+
 # --- MQTT Callbacks ---
 def on_connect(client, userdata, flags, rc):
     if rc == 0:
@@ -112,6 +188,14 @@ def on_message(client, userdata, msg):
             logger.error(f"Data validation error for device {device_id_str} on topic {topic}: {e}. Payload: {payload_str}")
             return
 
+        # Evaluate alert rules in-stream; alerts are stored with the reading, and the rule state
+        # only advances (and alerts are only published) once that is committed
+        evaluation = Evaluation()
+        if settings.ALERTS_ENABLED:
+            refresh_alert_rules()
+            values = {metric: getattr(mqtt_data, metric) for metric in METRICS}
+            evaluation = rule_engine.evaluate(device_id_str, values, mqtt_data.timestamp)
+
         # Store in database
         db = SessionLocal()
         try:
@@ -124,8 +208,24 @@ def on_message(client, userdata, msg):
                 timestamp=mqtt_data.timestamp
             )
             db.add(db_sensor_reading)
+            for event in evaluation.events:
+                db.add(SensorAlertDB(
+                    rule_id=event.rule.id,
+                    rule_name=event.rule.name,
+                    device_id=event.device_id,
+                    field_id=event.field_id,
+                    metric=event.rule.metric,
+                    status=event.status,
+                    severity=event.rule.severity,
+                    value=event.value,
+                    threshold=event.rule.threshold,
+                    reading_timestamp=event.timestamp,
+                    message=event.message,
+                ))
             db.commit()
+            rule_engine.apply(evaluation)
             logger.info(f"Successfully stored data for device {device_id_str} from topic {topic} to database.")
+            publish_alerts(client, evaluation.events)
         except Exception as e:
             db.rollback()
             logger.error(f"Database error while storing data for device {device_id_str} from topic {topic}: {e}")
@@ -3,9 +3,12 @@ import os
 import sys
 import pandas as pd
 import numpy as np
-from datetime import datetime
+from datetime import datetime, timedelta
 import joblib
 import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 # --- Path Setup for Module Imports ---
 CONTAINER_BACKEND_API_ROOT = "/app"
@@ -14,10 +17,15 @@ if CONTAINER_BACKEND_API_ROOT not in sys.path:
 
 # --- Database and Configuration Imports ---
 try:
-    from sqlalchemy import create_engine
+    from sqlalchemy import create_engine, select, func, and_, or_, exists
+    from sqlalchemy.dialects.postgresql import insert as pg_insert
     from sqlalchemy.orm import sessionmaker, Session
     from app.core.config import settings as app_settings
-    from app.models.farm import CropCycle, SensorReading, Field, YieldPrediction # Import YieldPrediction
+    from app.models.farm import CropCycle, Field, SensorReading, YieldPrediction # Import YieldPrediction
+    from app.services.yield_features import build_prediction_features, device_in_field, FEATURE_VERSION # Shared with yield_model_trainer.py
+    from app.services.model_registry import load_bundle, ModelRegistryError, ModelBundle, confidence_scores, get_active_version
+    from app.services.model_family import ModelFamily
+    from app.services.stage_profiler import StageProfiler, DISABLED_PROFILER, enable_profiling
 except ImportError as e:
     print(f"Error importing backend modules: {e}")
     print(f"Ensure backend_api is mounted at /app in Docker and PYTHONPATH is effectively /app.")
@@ -27,248 +35,472 @@ except ImportError as e:
 # --- Constants for Model Artifact Paths ---
 BASE_ML_MODELS_PATH_IN_CONTAINER = "/app/ml_models"
 MODEL_DIR = os.path.join(BASE_ML_MODELS_PATH_IN_CONTAINER, "saved_models")
-MODEL_FILENAME = "yield_prediction_model_v1.joblib"
-SCALER_FILENAME = "yield_feature_scaler_v1.joblib"
-FEATURE_NAMES_FILENAME = "yield_model_feature_names_v1.json"
-MODEL_VERSION = "v1" # Version of your model logic/features
-
-MODEL_PATH = os.path.join(MODEL_DIR, MODEL_FILENAME)
-SCALER_PATH = os.path.join(MODEL_DIR, SCALER_FILENAME)
-FEATURE_NAMES_PATH = os.path.join(MODEL_DIR, FEATURE_NAMES_FILENAME)
+# Models are loaded from the registry (app/services/model_registry.py). The loose _v1 files
+# written by older trainer versions are only used when no version has been activated yet.
+LEGACY_MODEL_PATH = os.path.join(MODEL_DIR, "yield_prediction_model_v1.joblib")
+LEGACY_SCALER_PATH = os.path.join(MODEL_DIR, "yield_feature_scaler_v1.joblib")
+LEGACY_FEATURE_NAMES_PATH = os.path.join(MODEL_DIR, "yield_model_feature_names_v1.json")
+LEGACY_MODEL_VERSION = "v1"
+MODEL_VERSION = None # Registry version id of the loaded model, set by load_model_artifacts()
+PREDICTION_UPSERT_CHUNK_SIZE = 1000 # Rows per INSERT ... ON CONFLICT statement
+PREDICTION_RUNS_DIR = os.path.join(MODEL_DIR, "prediction_runs") # Per-run shard status, used by --resume
 
 # --- Database Setup ---
 db_url = app_settings.ASSEMBLED_DATABASE_URL
 engine = create_engine(db_url)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Feature queries read from the replica when one is configured (see app/core/db.py); writes stay on engine
+read_engine = create_engine(app_settings.REPLICA_DATABASE_URL) if app_settings.REPLICA_DATABASE_URL else engine
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
 
 def load_model_artifacts():
-    """Loads the model, scaler, and feature names."""
+    """
+    Loads the model, scaler, and feature names of the active registry version (memory-mapped),
+    falling back to the legacy _v1 files. Sets MODEL_VERSION to the version that was loaded.
+    Registry versions are returned as a ModelFamily (compact forests where available, per-group
+    models through an LRU cache) in place of the model; it imputes and scales per group itself.
+    """
+    global MODEL_VERSION
     print("Loading model artifacts...")
-    if not all([os.path.exists(MODEL_PATH), os.path.exists(SCALER_PATH), os.path.exists(FEATURE_NAMES_PATH)]):
+    try:
+        family = ModelFamily.load(mmap=True, compact=True)
+        MODEL_VERSION = family.version
+        print(f"Model version {family.version} loaded from registry"
+              f"{' (compact forest)' if family.global_bundle.forest is not None else ''}, "
+              f"{len(family.groups)} group models{' by ' + '/'.join(family.group_by) if family.group_by else ''}.")
+        return family, family.global_bundle.scaler, family.feature_names
+    except ModelRegistryError as e:
+        print(f"{e}. Falling back to legacy artifacts.")
+
+    if not all([os.path.exists(LEGACY_MODEL_PATH), os.path.exists(LEGACY_SCALER_PATH), os.path.exists(LEGACY_FEATURE_NAMES_PATH)]):
         print("Error: One or more model artifacts (model, scaler, feature_names) not found.")
-        print(f"Checked paths: \n  Model: {MODEL_PATH}\n  Scaler: {SCALER_PATH}\n  Features: {FEATURE_NAMES_PATH}")
+        print(f"Checked paths: \n  Model: {LEGACY_MODEL_PATH}\n  Scaler: {LEGACY_SCALER_PATH}\n  Features: {LEGACY_FEATURE_NAMES_PATH}")
         return None, None, None
-    
-    model = joblib.load(MODEL_PATH)
-    scaler = joblib.load(SCALER_PATH)
-    with open(FEATURE_NAMES_PATH, 'r') as f:
+
+    model = joblib.load(LEGACY_MODEL_PATH, mmap_mode='r')
+    scaler = joblib.load(LEGACY_SCALER_PATH)
+    with open(LEGACY_FEATURE_NAMES_PATH, 'r') as f:
         feature_names = json.load(f)
-    
+    MODEL_VERSION = LEGACY_MODEL_VERSION
+
     print("Model, scaler, and feature names loaded successfully.")
     return model, scaler, feature_names
 
-def fetch_and_engineer_prediction_features(db: Session, trained_feature_names: list) -> pd.DataFrame:
+def fetch_and_engineer_prediction_features(db: Session, trained_feature_names: list, field_ids: list = None,
+                                           cycle_ids: list = None, read_db: Session = None) -> pd.DataFrame:
     """
     Fetches active crop cycles and engineers features for prediction.
-    The feature engineering logic MUST MATCH the training script.
+    The logic lives in app/services/yield_features.py and is shared with the training script;
+    cycles whose inputs have not changed are served from the cycle_features store.
+    field_ids restricts the work to one shard of fields, cycle_ids to the cycles being re-scored.
+    read_db (the replica session, if any) serves the reads; cycle_features writes go through db.
+    """
+    print("Fetching active crop cycles and engineering features for prediction...")
+    return build_prediction_features(db, trained_feature_names, field_ids=field_ids, cycle_ids=cycle_ids, read_db=read_db)
+
+
+def store_predictions(db: Session, predictions_data: list) -> int:
+    """
+    Stores or updates yield predictions in the database.
+    Rows are upserted set-based (INSERT ... ON CONFLICT on crop_cycle_id + model_version),
+    PREDICTION_UPSERT_CHUNK_SIZE rows per statement, each chunk committed on its own so a
+    failure only loses the current chunk; re-running is safe because the upsert is idempotent.
+    Returns the number of rows written; errors are re-raised after rollback.
+    """
+    if not predictions_data:
+        return 0
+
+    prediction_date = datetime.utcnow()
+    rows = [
+        {
+            'crop_cycle_id': pred_data['crop_cycle_id'],
+            'model_version': MODEL_VERSION,
+            'prediction_date': prediction_date,
+            'predicted_yield_tonnes': pred_data['predicted_yield_tonnes'],
+            'input_features_summary': pred_data['input_features_summary'],
+            'confidence_score': pred_data.get('confidence_score'),
+            'prediction_interval_low': pred_data.get('prediction_interval_low'),
+            'prediction_interval_high': pred_data.get('prediction_interval_high'),
+            'feature_version': pred_data.get('feature_version'),
+            'input_watermark': pred_data.get('input_watermark'),
+            'source_updated_at': pred_data.get('source_updated_at'),
+        }
+        for pred_data in predictions_data
+    ]
+
+    stored = 0
+    try:
+        for start in range(0, len(rows), PREDICTION_UPSERT_CHUNK_SIZE):
+            chunk = rows[start:start + PREDICTION_UPSERT_CHUNK_SIZE]
+            stmt = pg_insert(YieldPrediction).values(chunk)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['crop_cycle_id', 'model_version'],
+                set_={
+                    'predicted_yield_tonnes': stmt.excluded.predicted_yield_tonnes,
+                    'prediction_date': stmt.excluded.prediction_date,
+                    'input_features_summary': stmt.excluded.input_features_summary,
+                    'confidence_score': stmt.excluded.confidence_score,
+                    'prediction_interval_low': stmt.excluded.prediction_interval_low,
+                    'prediction_interval_high': stmt.excluded.prediction_interval_high,
+                    'feature_version': stmt.excluded.feature_version,
+                    'input_watermark': stmt.excluded.input_watermark,
+                    'source_updated_at': stmt.excluded.source_updated_at,
+                },
+            )
+            db.execute(stmt)
+            db.commit()
+            stored += len(chunk)
+    except Exception as e:
+        db.rollback()
+        print(f"Error storing predictions after {stored} rows: {e}")
+        raise
+    print(f"Successfully stored/updated {stored} predictions with model {MODEL_VERSION}.")
+    return stored
+
+
+def _predict_legacy(features_for_prediction_df: pd.DataFrame, model, scaler, trained_feature_names: list,
+                    profiler: StageProfiler = DISABLED_PROFILER) -> tuple:
+    """Scores with the loose _v1 model and scaler files; returns (predictions, interval low, interval high)."""
+    with profiler.stage("imputation", rows=len(features_for_prediction_df)):
+        # Select only the trained feature columns in the correct order and handle potential NaNs
+        # This reordering/selection MUST happen BEFORE scaling
+        X_predict = features_for_prediction_df[trained_feature_names].astype(float)
+
+        # Handle NaNs before scaling: StandardScaler will error on NaNs.
+        # Impute with the training-set means the scaler was fitted on, so a cycle's prediction
+        # does not depend on which other cycles (or which shard) it is scored with.
+        missing = X_predict.isnull()
+        if missing.any().any():
+            training_means = pd.Series(scaler.mean_, index=trained_feature_names)
+            X_predict = X_predict.fillna(training_means)
+            for col in missing.columns[missing.any()]:
+                print(f"Imputed {int(missing[col].sum())} NaNs in column '{col}' with training mean {training_means[col]:.2f}")
+
+    # Scale the features using the loaded scaler, then predict (yield per hectare) with per-tree intervals
+    bundle = ModelBundle(version=MODEL_VERSION, model=model, scaler=scaler, feature_names=list(trained_feature_names))
+    return bundle.predict_interval(X_predict.to_numpy(), profiler=profiler)
+
+
+def predict_for_features(features_for_prediction_df: pd.DataFrame, model, scaler, trained_feature_names: list,
+                         profiler: StageProfiler = DISABLED_PROFILER) -> list:
+    """
+    Imputes, scales and scores engineered features; returns rows ready for store_predictions.
+    A ModelFamily routes each cycle to its crop-type model and imputes with that model's means.
+    Prediction intervals and confidence come from the per-tree predictions of the same pass.
+    profiler records the imputation, scaling and predict stages.
+    """
+    crop_cycle_ids = features_for_prediction_df['crop_cycle_id']
+    if isinstance(model, ModelFamily):
+        raw_predictions, interval_low, interval_high = model.predict_interval(features_for_prediction_df, profiler=profiler)
+    else:
+        raw_predictions, interval_low, interval_high = _predict_legacy(features_for_prediction_df, model, scaler,
+                                                                       trained_feature_names, profiler=profiler)
+    if interval_low is None:
+        interval_low = interval_high = np.full(len(raw_predictions), np.nan)
+    confidence = confidence_scores(raw_predictions, interval_low, interval_high)
+    # NaN (no interval for this model) is stored as NULL
+    interval_columns = pd.DataFrame({'low': interval_low, 'high': interval_high, 'confidence': confidence})
+    interval_rows = interval_columns.astype(object).where(interval_columns.notna(), None).to_dict(orient='records')
+
+    # Original (unscaled) features used for each prediction, built for all rows at once.
+    # NaN is not valid JSON, so missing features are stored as null.
+    feature_values = features_for_prediction_df[trained_feature_names]
+    input_features_summaries = feature_values.astype(object).where(feature_values.notna(), None).to_dict(orient='records')
+
+    # Assuming model predicts yield_tonnes_per_hectare; stored as per-hectare values.
+    # Total yield would be predicted_yield_per_hectare * field_area_hectares (optional).
+    predictions = [
+        {
+            'crop_cycle_id': crop_cycle_id,
+            'predicted_yield_tonnes': predicted_yield_per_hectare, # Storing per hectare prediction
+            'prediction_interval_low': interval['low'],
+            'prediction_interval_high': interval['high'],
+            'confidence_score': interval['confidence'],
+            'input_features_summary': input_features_summary,
+        }
+        for crop_cycle_id, predicted_yield_per_hectare, interval, input_features_summary in zip(
+            crop_cycle_ids.astype(int).tolist(), raw_predictions.tolist(), interval_rows, input_features_summaries
+        )
+    ]
+    print(f"Predicted yield per hectare for {len(predictions)} crop cycles "
+          f"(mean {raw_predictions.mean():.2f} tonnes/ha).")
+    return predictions
+
+
+# --- Incremental selection ---
+# A stored prediction records the inputs it was based on: the feature version, the highest
+# sensor_readings.id that existed when its inputs were read (ids rather than timestamps, so
+# late-arriving readings still count) and the latest cycle/field updated_at. A cycle is
+# re-scored only if one of those moved or the model version changed. Separately from that
+# change detection, PREDICTION_MAX_AGE_HOURS (24 by default) also re-scores predictions older
+# than the given age, so the time-dependent features of cycles without new readings (a quiet or
+# failed sensor) stay at most that old rather than waiting for the weekly --full run.
+
+def select_cycles_to_score(db: Session, field_ids: list = None, full: bool = False,
+                           max_age_hours: float = None) -> pd.DataFrame:
     """
-    print("Fetching active crop cycles for prediction...")
-    # Query active crop cycles (actual_harvest_date is NULL)
-    query = db.query(
+    Active cycles that need a (new) prediction, with the cycle/field updated_at they are based on.
+    max_age_hours defaults to settings.PREDICTION_MAX_AGE_HOURS; 0 means age alone never re-scores,
+    so a cycle without new readings keeps its prediction until the weekly --full run.
+    """
+    now = datetime.utcnow()
+    max_age_hours = app_settings.PREDICTION_MAX_AGE_HOURS if max_age_hours is None else max_age_hours
+    stmt = select(
         CropCycle.id.label("crop_cycle_id"),
         CropCycle.field_id,
-        CropCycle.crop_type,
-        CropCycle.planting_date,
-        Field.area_hectares.label("field_area_hectares"),
-        Field.soil_type
+        Field.farm_id,
+        CropCycle.updated_at.label("cycle_updated_at"),
+        Field.updated_at.label("field_updated_at"),
     ).join(Field, CropCycle.field_id == Field.id)\
-     .filter(CropCycle.actual_harvest_date.is_(None)) # Active cycles
-    
-    active_cycles_df = pd.read_sql(query.statement, db.bind)
-    print(f"Found {len(active_cycles_df)} active crop cycles.")
-    if active_cycles_df.empty:
-        return pd.DataFrame()
-
-    all_features_for_prediction_list = []
-    for index, cycle in active_cycles_df.iterrows():
-        print(f"Processing active crop cycle ID: {cycle['crop_cycle_id']} (Field ID: {cycle['field_id']})")
-        
-        # Fetch sensor data from planting_date to NOW
-        sensor_query = db.query(SensorReading)\
-            .filter(SensorReading.timestamp >= cycle['planting_date'])\
-            .filter(SensorReading.timestamp <= datetime.utcnow()) \
-            .filter(SensorReading.device_id.contains(f"field_{cycle['field_id']}"))
-
-        sensor_df = pd.read_sql(sensor_query.statement, db.bind)
-        
-        if sensor_df.empty:
-            print(f"  No sensor data found for active cycle {cycle['crop_cycle_id']}. Using NaNs for sensor features.")
-            # Create a features dict with NaNs for sensor-derived features
-            # This allows prediction even with missing sensor data if model handles NaNs (after scaling)
-            # or if imputation is done. For now, NaNs will propagate.
-            current_features = {"crop_cycle_id": cycle['crop_cycle_id']}
-            sensor_feature_names = ['avg_temp', 'min_temp', 'max_temp', 'avg_humidity', 'avg_soil_moisture', 'gdd_approx']
-            for feat_name in sensor_feature_names:
-                current_features[feat_name] = np.nan
+     .filter(CropCycle.actual_harvest_date.is_(None))\
+     .order_by(CropCycle.id)
+    if field_ids is not None:
+        stmt = stmt.filter(CropCycle.field_id.in_(field_ids))
+
+    if not full:
+        # Prediction for the current model version; a new model leaves this NULL for every cycle
+        stmt = stmt.outerjoin(YieldPrediction, and_(
+            YieldPrediction.crop_cycle_id == CropCycle.id,
+            YieldPrediction.model_version == MODEL_VERSION,
+        ))
+        # Same device/window rule as the feature engineering; id > watermark scans only new readings
+        new_readings = exists().where(and_(
+            SensorReading.id > YieldPrediction.input_watermark,
+            device_in_field(CropCycle.field_id),
+            SensorReading.timestamp >= CropCycle.planting_date,
+            SensorReading.timestamp <= now,
+        ))
+        inputs_changed = or_(
+            YieldPrediction.id.is_(None),
+            YieldPrediction.feature_version.is_(None),
+            YieldPrediction.feature_version != FEATURE_VERSION,
+            YieldPrediction.input_watermark.is_(None),
+            YieldPrediction.source_updated_at.is_(None),
+            CropCycle.updated_at > YieldPrediction.source_updated_at,
+            Field.updated_at > YieldPrediction.source_updated_at,
+            new_readings,
+        )
+        if max_age_hours > 0:
+            expired = YieldPrediction.prediction_date < now - timedelta(hours=max_age_hours)
+            stmt = stmt.filter(or_(inputs_changed, expired))
         else:
-            current_features = {"crop_cycle_id": cycle['crop_cycle_id']}
-            current_features['avg_temp'] = sensor_df['temperature'].mean() if 'temperature' in sensor_df else np.nan
-            current_features['min_temp'] = sensor_df['temperature'].min() if 'temperature' in sensor_df else np.nan
-            current_features['max_temp'] = sensor_df['temperature'].max() if 'temperature' in sensor_df else np.nan
-            current_features['avg_humidity'] = sensor_df['humidity'].mean() if 'humidity' in sensor_df else np.nan
-            current_features['avg_soil_moisture'] = sensor_df['soil_moisture'].mean() if 'soil_moisture' in sensor_df else np.nan
-            
-            t_base = 10
-            # Cycle duration for prediction is from planting to now
-            cycle_duration_days_so_far = (datetime.utcnow() - cycle['planting_date']).days
-            current_features['cycle_duration_days'] = cycle_duration_days_so_far if cycle_duration_days_so_far > 0 else 0
-
-            if pd.notna(current_features['max_temp']) and pd.notna(current_features['min_temp']) and cycle_duration_days_so_far > 0:
-                avg_daily_temp_proxy = (current_features['max_temp'] + current_features['min_temp']) / 2
-                current_features['gdd_approx'] = max(0, avg_daily_temp_proxy - t_base) * cycle_duration_days_so_far
-            else:
-                current_features['gdd_approx'] = np.nan
-        
-        # Static features
-        current_features['field_area_hectares'] = cycle['field_area_hectares']
-        # Add encoded categorical features here if they were used in training
-        # current_features['crop_type_encoded'] = encode_crop_type(cycle['crop_type'])
-        # current_features['soil_type_encoded'] = encode_soil_type(cycle['soil_type'])
-        
-        all_features_for_prediction_list.append(current_features)
-        print(f"  Engineered features for prediction for crop cycle {cycle['crop_cycle_id']}.")
-
-    if not all_features_for_prediction_list:
-        return pd.DataFrame()
-        
-    features_df = pd.DataFrame(all_features_for_prediction_list)
-    
-    # Ensure all columns expected by the model are present, even if all NaN, and in correct order
-    # This is crucial if some active cycles had no sensor data, leading to missing columns.
-    # Or if some categorical features are not present in the current batch.
-    final_features_df = pd.DataFrame(columns=trained_feature_names)
-    for crop_cycle_id, group in features_df.groupby('crop_cycle_id'):
-        row_dict = {'crop_cycle_id': crop_cycle_id}
-        for col in trained_feature_names: # Iterate through the order of features model was trained on
-            if col in group.columns:
-                row_dict[col] = group[col].iloc[0] # Assumes one row per crop_cycle_id after this stage
-            else:
-                row_dict[col] = np.nan # Add NaN if feature couldn't be engineered (e.g. no sensor data)
-        final_features_df = pd.concat([final_features_df, pd.DataFrame([row_dict])], ignore_index=True)
+            stmt = stmt.filter(inputs_changed)
 
-    return final_features_df
+    targets_df = pd.read_sql(stmt, db.bind, parse_dates=["cycle_updated_at", "field_updated_at"])
+    targets_df["source_updated_at"] = targets_df[["cycle_updated_at", "field_updated_at"]].max(axis=1)
+    return targets_df
 
 
-def store_predictions(db: Session, predictions_data: list):
-    """Stores or updates yield predictions in the database."""
-    if not predictions_data:
-        return
+# --- Sharding ---
+# Cycles to score are split into shards of whole fields (or whole farms), as contiguous id ranges
+# balanced by cycle count. Each shard is engineered, scored and committed independently, and the
+# per-shard status is recorded in a run file so failed shards can be retried with --resume.
 
-    for pred_data in predictions_data:
-        crop_cycle_id = pred_data['crop_cycle_id']
-        predicted_yield = pred_data['predicted_yield_tonnes']
-        input_features = pred_data['input_features_summary']
-
-        # Check if a prediction for this cycle and model version already exists
-        existing_prediction = db.query(YieldPrediction)\
-            .filter(YieldPrediction.crop_cycle_id == crop_cycle_id)\
-            .filter(YieldPrediction.model_version == MODEL_VERSION)\
-            .first()
-
-        if existing_prediction:
-            print(f"Updating existing prediction for crop_cycle_id {crop_cycle_id} with model {MODEL_VERSION}.")
-            existing_prediction.predicted_yield_tonnes = predicted_yield
-            existing_prediction.prediction_date = datetime.utcnow()
-            existing_prediction.input_features_summary = input_features
-        else:
-            print(f"Creating new prediction for crop_cycle_id {crop_cycle_id} with model {MODEL_VERSION}.")
-            db_prediction = YieldPrediction(
-                crop_cycle_id=crop_cycle_id,
-                model_version=MODEL_VERSION,
-                prediction_date=datetime.utcnow(),
-                predicted_yield_tonnes=predicted_yield,
-                input_features_summary=input_features
-                # confidence_score can be added if model provides it
-            )
-            db.add(db_prediction)
-    
-    try:
-        db.commit()
-        print(f"Successfully stored/updated {len(predictions_data)} predictions.")
-    except Exception as e:
-        db.rollback()
-        print(f"Error storing predictions: {e}")
+def plan_shards(targets_df: pd.DataFrame, shard_by: str, num_shards: int) -> list:
+    """Returns a list of field-id lists, one per shard."""
+    if targets_df.empty:
+        return []
+    key = "farm_id" if shard_by == "farm" else "field_id"
+    per_field = targets_df.groupby("field_id", sort=True)\
+        .agg(shard_key=(key, "first"), cycles=("crop_cycle_id", "size")).reset_index()
 
+    per_key = per_field.groupby("shard_key", sort=True).agg(fields=("field_id", list), cycles=("cycles", "sum"))
+    # Cut the cumulative cycle count into num_shards roughly equal contiguous ranges
+    target = per_key["cycles"].sum() / max(1, num_shards)
+    shard_index = np.minimum((per_key["cycles"].cumsum() - per_key["cycles"]) // target, num_shards - 1).astype(int)
+    return [
+        sorted(int(f) for fields in group["fields"] for f in fields)
+        for _, group in per_key.groupby(shard_index.to_numpy(), sort=True)
+    ]
 
-def run_batch_predictions():
-    print("Starting batch yield prediction process...")
-    model, scaler, trained_feature_names = load_model_artifacts()
 
-    if not model or not scaler or not trained_feature_names:
-        print("Could not load all necessary model artifacts. Exiting.")
-        return
+def _run_state_path(run_id: str) -> str:
+    return os.path.join(PREDICTION_RUNS_DIR, f"{run_id}.json")
+
+
+def _save_run_state(state: dict):
+    os.makedirs(PREDICTION_RUNS_DIR, exist_ok=True)
+    tmp_path = _run_state_path(state['run_id']) + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, _run_state_path(state['run_id']))
+
+
+# Per-process state for pool workers, filled once by _init_worker
+_worker_artifacts = None
 
+def _init_worker():
+    """
+    Pool initializer: drop DB connections inherited from the parent. Forked workers inherit
+    the parent's memory-mapped artifacts; others (spawn) load them once here.
+    """
+    global _worker_artifacts
+    engine.dispose(close=False)
+    read_engine.dispose(close=False)
+    if _worker_artifacts is None:
+        _worker_artifacts = load_model_artifacts()
+
+
+def predict_shard(shard_id: int, field_ids: list, full: bool = False) -> dict:
+    """
+    Feature engineering, scoring and chunked commits for one shard. Raises on failure.
+    The cycles to score are re-selected here, so a retried shard skips cycles already stored.
+    With profiling enabled the shard's stage timings are returned under 'profile'.
+    """
+    model, scaler, trained_feature_names = _worker_artifacts
+    profiler = StageProfiler("batch_yield_predictor")
+    started = time.monotonic()
     db = SessionLocal()
+    read_db = ReadSessionLocal() if read_engine is not engine else db
     try:
-        # Fetch and engineer features for active crop cycles
-        # The returned DataFrame should only contain the feature columns expected by the model,
-        # plus 'crop_cycle_id'.
-        features_for_prediction_df = fetch_and_engineer_prediction_features(db, trained_feature_names)
-
-        if features_for_prediction_df.empty:
-            print("No active crop cycles or features to make predictions on. Exiting.")
-            return
-
-        # Separate crop_cycle_ids before scaling and ensure correct feature order
-        crop_cycle_ids = features_for_prediction_df['crop_cycle_id']
-        
-        # Select only the trained feature columns in the correct order and handle potential NaNs
-        # This reordering/selection MUST happen BEFORE scaling
-        X_predict = features_for_prediction_df[trained_feature_names].copy()
-        
-        # Handle NaNs before scaling: Impute if necessary, or ensure model can handle them.
-        # For now, StandardScaler will error on NaNs. Let's try simple mean imputation.
-        # This imputation should ideally mirror what was done (or would be done) in training for missing values.
-        for col in X_predict.columns:
-            if X_predict[col].isnull().any():
-                mean_val = X_predict[col].mean() # Calculate mean from current batch, could use training set mean
-                X_predict[col].fillna(mean_val, inplace=True)
-                print(f"Imputed NaNs in column '{col}' with mean {mean_val:.2f}")
-
-        # If after imputation, there are still NaNs (e.g., a column was all NaN),
-        # then prediction for those rows might be problematic.
-        if X_predict.isnull().any().any():
-            print("Warning: Features for prediction still contain NaNs after imputation. Predictions may be unreliable or fail.")
-            # Optionally, drop rows that still have NaNs or handle them based on model capabilities
-            # X_predict.dropna(inplace=True) # This would remove rows and misalign with crop_cycle_ids if not careful
-
-
-        # Scale the features using the loaded scaler
-        X_predict_scaled = scaler.transform(X_predict)
-
-        # Make predictions
-        raw_predictions = model.predict(X_predict_scaled) # Yield per hectare
-
-        predictions_to_store = []
-        for i, crop_cycle_id in enumerate(crop_cycle_ids):
-            # Get the original (unscaled) features used for this prediction for storage
-            input_features_summary = features_for_prediction_df.loc[
-                features_for_prediction_df['crop_cycle_id'] == crop_cycle_id, trained_feature_names
-            ].iloc[0].to_dict()
-
-            # Convert predicted yield per hectare back to total yield if needed, or store as per_hectare
-            # Assuming model predicts yield_tonnes_per_hectare
-            predicted_yield_per_hectare = raw_predictions[i]
-            
-            # Find field_area_hectares for this crop_cycle_id to calculate total yield (optional)
-            # cycle_info = features_for_prediction_df.loc[features_for_prediction_df['crop_cycle_id'] == crop_cycle_id].iloc[0]
-            # total_predicted_yield = predicted_yield_per_hectare * cycle_info['field_area_hectares']
-
-            print(f"Predicted yield per hectare for crop_cycle_id {crop_cycle_id}: {predicted_yield_per_hectare:.2f} tonnes/ha")
-            
-            predictions_to_store.append({
-                'crop_cycle_id': crop_cycle_id,
-                'predicted_yield_tonnes': predicted_yield_per_hectare, # Storing per hectare prediction
-                'input_features_summary': input_features_summary
-            })
-        
-        store_predictions(db, predictions_to_store)
-
-    except Exception as e:
-        print(f"An error occurred during the batch prediction process: {e}")
+        with profiler.stage("cycle_query") as record:
+            # Taken before reading any inputs, so readings arriving meanwhile trigger the next run.
+            # Watermark, targets and features all come from the same (possibly replica) session.
+            input_watermark = read_db.execute(select(func.coalesce(func.max(SensorReading.id), 0))).scalar_one()
+            targets_df = select_cycles_to_score(read_db, field_ids=field_ids, full=full)
+            record["rows"] = len(targets_df)
+        stored = 0
+        if not targets_df.empty:
+            cycle_ids = [int(i) for i in targets_df["crop_cycle_id"]]
+            with profiler.stage("feature_engineering") as record:
+                features_df = fetch_and_engineer_prediction_features(db, trained_feature_names, field_ids=field_ids,
+                                                                     cycle_ids=cycle_ids, read_db=read_db)
+                record["rows"] = len(features_df)
+            if not features_df.empty:
+                predictions = predict_for_features(features_df, model, scaler, trained_feature_names, profiler=profiler)
+                source_updated = dict(zip(cycle_ids, targets_df["source_updated_at"]))
+                for pred in predictions:
+                    updated_at = source_updated.get(pred['crop_cycle_id'])
+                    pred['feature_version'] = FEATURE_VERSION
+                    pred['input_watermark'] = input_watermark
+                    pred['source_updated_at'] = None if pd.isna(updated_at) else updated_at.to_pydatetime()
+                with profiler.stage("store", rows=len(predictions)):
+                    stored = store_predictions(db, predictions)
     finally:
+        if read_db is not db:
+            read_db.close()
         db.close()
+    return {'shard_id': shard_id, 'cycles': stored, 'seconds': round(time.monotonic() - started, 3),
+            'profile': profiler.stages if profiler.enabled else None}
+
+
+def _execute_shards(pending: list, workers: int, full: bool):
+    """Yields (shard, result, error) as shards finish, in-process for a single worker."""
+    if workers <= 1:
+        for shard in pending:
+            try:
+                yield shard, predict_shard(shard['shard_id'], shard['field_ids'], full), None
+            except Exception as e:
+                yield shard, None, e
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        futures = {pool.submit(predict_shard, shard['shard_id'], shard['field_ids'], full): shard for shard in pending}
+        for future in as_completed(futures):
+            error = future.exception()
+            yield futures[future], (None if error else future.result()), error
+
+
+def run_batch_predictions(workers: int = None, shard_by: str = "field", num_shards: int = None,
+                          resume_run_id: str = None, max_attempts: int = 2, full: bool = False) -> dict:
+    """
+    Scores active crop cycles, sharded across a process pool. By default only cycles whose
+    inputs changed since their last prediction are scored; full=True re-scores every cycle.
+    With resume_run_id, only the shards of that run that did not finish are executed again.
+    Returns the run state (also written to PREDICTION_RUNS_DIR/<run_id>.json).
+    With profiling enabled (--profile), a stage summary is written to settings.PROFILE_DIR.
+    """
+    profiler = StageProfiler("batch_yield_predictor").start()
+    try:
+        state = _run_batch_predictions(profiler, workers, shard_by, num_shards, resume_run_id, max_attempts, full)
+        profiler.context.update({
+            'run_id': state.get('run_id'),
+            'model_version': MODEL_VERSION,
+            'full': full,
+            'shards': len(state.get('shards', [])),
+            'cycles': sum(shard['cycles'] for shard in state.get('shards', [])),
+        })
+        return state
+    finally:
+        profiler.finish()
+
+
+def _run_batch_predictions(profiler: StageProfiler, workers: int, shard_by: str, num_shards: int,
+                           resume_run_id: str, max_attempts: int, full: bool) -> dict:
+    global _worker_artifacts
+    print("Starting batch yield prediction process...")
+    workers = workers or int(os.environ.get("PREDICTOR_WORKERS", os.cpu_count() or 1))
+
+    # Loaded before planning: MODEL_VERSION decides which cycles need scoring,
+    # and pool workers forked afterwards share these artifacts. A resident caller
+    # (job_scheduler.py) keeps them across runs while the active version is unchanged.
+    if _worker_artifacts is None or not all(_worker_artifacts) or get_active_version() != MODEL_VERSION:
+        with profiler.stage("artifact_load"):
+            _worker_artifacts = load_model_artifacts()
+    if not all(_worker_artifacts):
+        print("Could not load all necessary model artifacts. Exiting.")
+        return {}
+
+    if resume_run_id:
+        with open(_run_state_path(resume_run_id), 'r') as f:
+            state = json.load(f)
+        print(f"Resuming run {resume_run_id}.")
+    else:
+        db = ReadSessionLocal()
+        try:
+            with profiler.stage("cycle_query") as record:
+                targets_df = select_cycles_to_score(db, full=full)
+                record["rows"] = len(targets_df)
+        finally:
+            db.close()
+        print(f"{len(targets_df)} active crop cycles to score ({'full run' if full else 'changed inputs only'}).")
+        shards = plan_shards(targets_df, shard_by, num_shards or workers * 4)
+        state = {
+            'run_id': datetime.utcnow().strftime("%Y%m%dT%H%M%S"),
+            'model_version': MODEL_VERSION,
+            'full': full,
+            'shard_by': shard_by,
+            'shards': [
+                {'shard_id': i, 'field_ids': field_ids, 'status': 'pending', 'attempts': 0, 'cycles': 0, 'error': None}
+                for i, field_ids in enumerate(shards)
+            ],
+        }
+    state['started_at'] = datetime.utcnow().isoformat()
+
+    if not state['shards']:
+        print("No active crop cycles need new predictions. Exiting.")
+        return state
+
+    print(f"Run {state['run_id']}: {len(state['shards'])} shards by {state['shard_by']} across {workers} worker(s).")
+    for attempt in range(max_attempts):
+        pending = [shard for shard in state['shards'] if shard['status'] != 'done']
+        if not pending:
+            break
+        if attempt:
+            print(f"Retrying {len(pending)} failed shard(s) (attempt {attempt + 1} of {max_attempts})...")
+        finished = len(state['shards']) - len(pending)
+        for shard, result, error in _execute_shards(pending, workers, state.get('full', False)):
+            shard['attempts'] += 1
+            finished += 1 if error is None else 0
+            if error is None:
+                shard.update(status='done', cycles=result['cycles'], error=None)
+                profiler.merge(result.get('profile'))
+                print(f"[{finished}/{len(state['shards'])}] Shard {shard['shard_id']} done: "
+                      f"{result['cycles']} cycles in {result['seconds']}s.")
+            else:
+                shard.update(status='failed', error=str(error))
+                print(f"Shard {shard['shard_id']} failed: {error}")
+            _save_run_state(state)
+
+    failed = [shard['shard_id'] for shard in state['shards'] if shard['status'] != 'done']
+    total_cycles = sum(shard['cycles'] for shard in state['shards'])
+    state['finished_at'] = datetime.utcnow().isoformat()
+    _save_run_state(state)
+    print(f"Stored predictions for {total_cycles} crop cycles.")
+    if failed:
+        print(f"{len(failed)} shard(s) failed: {failed}. Retry them with --resume {state['run_id']}.")
     print("Batch yield prediction process finished.")
+    return state
 
 if __name__ == "__main__":
     # This script would be run on a schedule.
@@ -276,5 +508,17 @@ if __name__ == "__main__":
     # 1. A trained model, scaler, and feature_names list in ml_models/saved_models/.
     # 2. Active crop cycles in your database (actual_harvest_date is NULL).
     # 3. Sensor data for these active crop cycles.
-    run_batch_predictions()
-
+    parser = argparse.ArgumentParser(description="Batch yield predictions for active crop cycles.")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: $PREDICTOR_WORKERS or CPU count).")
+    parser.add_argument("--shard-by", choices=["field", "farm"], default="field", help="Unit kept together in one shard.")
+    parser.add_argument("--shards", type=int, default=None, help="Number of shards (default: 4 per worker).")
+    parser.add_argument("--resume", metavar="RUN_ID", default=None, help="Re-run only the unfinished shards of a previous run.")
+    parser.add_argument("--max-attempts", type=int, default=2, help="Attempts per shard within this run.")
+    parser.add_argument("--full", action="store_true", help="Re-score every active cycle, not only those whose inputs changed.")
+    parser.add_argument("--profile", action="store_true", help="Record per-stage wall/CPU time, rows and peak RSS to a JSON summary in PROFILE_DIR.")
+    parser.add_argument("--profile-sampling", action="store_true", help="With --profile, also write a pyinstrument sampling report (if installed).")
+    args = parser.parse_args()
+    if args.profile or args.profile_sampling:
+        enable_profiling(sampling=args.profile_sampling)
+    run_batch_predictions(workers=args.workers, shard_by=args.shard_by, num_shards=args.shards,
+                          resume_run_id=args.resume, max_attempts=args.max_attempts, full=args.full)
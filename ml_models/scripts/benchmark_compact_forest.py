@@ -0,0 +1,122 @@
+# tessyfarm_smartloop/ml_models/scripts/benchmark_compact_forest.py
+import os
+import sys
+import time
+import pickle
+import argparse
+import tempfile
+import numpy as np
+import joblib
+
+# --- Path Setup for Module Imports ---
+CONTAINER_BACKEND_API_ROOT = "/app"
+if CONTAINER_BACKEND_API_ROOT not in sys.path:
+    sys.path.insert(0, CONTAINER_BACKEND_API_ROOT)
+
+try:
+    from app.services.compact_forest import CompactForest
+    from app.services.model_registry import (
+        load_bundle, ModelRegistryError, MODEL_FILENAME, SCALER_FILENAME, FOREST_DIRNAME,
+    )
+    from app.core.config import settings as app_settings
+except ImportError as e:
+    print(f"Error importing backend modules: {e}")
+    print(f"Ensure backend_api is mounted at /app in Docker and PYTHONPATH is effectively /app.")
+    sys.exit(1)
+
+# Compares the pickled sklearn RandomForest + StandardScaler with the CompactForest
+# (app/services/compact_forest.py): load time, size, scoring latency and agreement.
+# Uses the active registry version, or a synthetic forest with the trainer's hyperparameters.
+
+BATCH_SIZES = [1, 64, 1000, 10000]
+N_FEATURES = 8
+
+
+def _synthetic_artifacts(directory: str):
+    """Trains a forest shaped like yield_model_trainer.py's on random data and saves it like the registry."""
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.preprocessing import StandardScaler
+    rng = np.random.default_rng(42)
+    X = rng.normal(size=(5000, N_FEATURES)) * 10 + 20
+    y = X[:, 0] * 0.1 + np.sin(X[:, 1]) + rng.normal(size=len(X)) * 0.2
+    scaler = StandardScaler().fit(X)
+    model = RandomForestRegressor(n_estimators=100, random_state=42, max_depth=10, min_samples_split=5)
+    model.fit(scaler.transform(X), y)
+    joblib.dump(model, os.path.join(directory, MODEL_FILENAME))
+    joblib.dump(scaler, os.path.join(directory, SCALER_FILENAME))
+    CompactForest.from_sklearn(model, scaler).save(os.path.join(directory, FOREST_DIRNAME))
+    return scaler
+
+
+def _time(fn, repeat: int):
+    """Best of `repeat` runs, in milliseconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def _dir_size(path: str) -> int:
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def run_benchmark(synthetic: bool = False, repeat: int = 5):
+    if synthetic:
+        version_dir = tempfile.mkdtemp(prefix="compact-forest-bench-")
+        scaler = _synthetic_artifacts(version_dir)
+        print(f"Benchmarking a synthetic forest in {version_dir}")
+    else:
+        try:
+            bundle = load_bundle(mmap=False)
+        except ModelRegistryError as e:
+            print(f"{e}. Use --synthetic to benchmark without a registered model.")
+            return
+        version_dir = os.path.join(app_settings.MODEL_REGISTRY_DIR, bundle.version)
+        scaler = bundle.scaler
+        if not CompactForest.exists(os.path.join(version_dir, FOREST_DIRNAME)):
+            print(f"Version {bundle.version} has no compact forest; exporting one for the benchmark.")
+            CompactForest.from_sklearn(bundle.model, bundle.scaler).save(os.path.join(version_dir, FOREST_DIRNAME))
+        print(f"Benchmarking model version {bundle.version}")
+
+    model_path = os.path.join(version_dir, MODEL_FILENAME)
+    forest_dir = os.path.join(version_dir, FOREST_DIRNAME)
+    model = joblib.load(model_path)
+    forest = CompactForest.load(forest_dir, mmap=False)
+
+    print("\n--- Load ---")
+    print(f"sklearn joblib.load:           {_time(lambda: joblib.load(model_path), repeat):9.2f} ms")
+    print(f"sklearn joblib.load (mmap):    {_time(lambda: joblib.load(model_path, mmap_mode='r'), repeat):9.2f} ms")
+    print(f"CompactForest.load:            {_time(lambda: CompactForest.load(forest_dir, mmap=False), repeat):9.2f} ms")
+    print(f"CompactForest.load (mmap):     {_time(lambda: CompactForest.load(forest_dir, mmap=True), repeat):9.2f} ms")
+
+    print("\n--- Size ---")
+    print(f"sklearn on disk:               {_dir_size(model_path) / 1e6:9.2f} MB")
+    print(f"sklearn pickled in memory:     {len(pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL)) / 1e6:9.2f} MB")
+    print(f"CompactForest on disk:         {_dir_size(forest_dir) / 1e6:9.2f} MB")
+    print(f"CompactForest arrays:          {forest.nbytes / 1e6:9.2f} MB ({forest.n_trees} trees, {forest.n_nodes} nodes, depth {forest.max_depth})")
+
+    print("\n--- Scoring (best of runs) ---")
+    rng = np.random.default_rng(7)
+    mean = np.asarray(scaler.mean_)
+    scale = np.asarray(scaler.scale_)
+    for batch_size in BATCH_SIZES:
+        X = rng.normal(size=(batch_size, forest.n_features)) * scale + mean # Raw features around the training distribution
+        sklearn_ms = _time(lambda: model.predict(scaler.transform(X)), repeat)
+        compact_ms = _time(lambda: forest.predict(X), repeat)
+        expected = model.predict(scaler.transform(X))
+        actual = forest.predict(X)
+        print(f"batch {batch_size:6d}: sklearn {sklearn_ms:9.3f} ms | compact {compact_ms:9.3f} ms | "
+              f"speedup {sklearn_ms / compact_ms:5.1f}x | identical: {np.array_equal(expected, actual)} "
+              f"(max abs diff {np.abs(expected - actual).max():.3g})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the CompactForest against the sklearn model.")
+    parser.add_argument("--synthetic", action="store_true", help="Benchmark a synthetic forest instead of the active registry version.")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per measurement (best is reported).")
+    args = parser.parse_args()
+    run_benchmark(synthetic=args.synthetic, repeat=args.repeat)
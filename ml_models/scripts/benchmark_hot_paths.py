@@ -0,0 +1,428 @@
+# tessyfarm_smartloop/ml_models/scripts/benchmark_hot_paths.py
+import io
+import os
+import sys
+import json
+import time
+import types
+import socket
+import asyncio
+import logging
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+import contextlib
+import importlib.util
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+# --- Path Setup for Module Imports ---
+CONTAINER_BACKEND_API_ROOT = "/app"
+if CONTAINER_BACKEND_API_ROOT not in sys.path:
+    sys.path.insert(0, CONTAINER_BACKEND_API_ROOT)
+
+try:
+    from sqlalchemy import create_engine, insert, delete, select, func, text
+    from sqlalchemy.engine import make_url
+    from sqlalchemy.orm import sessionmaker
+    from starlette.requests import Request
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.preprocessing import StandardScaler
+    from app.core.config import settings as app_settings
+    from app.core.db import Base
+    from app.models.farm import Farm, Field, CropCycle, SensorReading, YieldPrediction, CycleFeature
+    from app.services.columnar import COLUMNAR_JSON_MEDIA_TYPE
+    from app.services.yield_features import build_training_features, FEATURE_COLUMNS, TARGET_COLUMN, FEATURE_VERSION
+    from app.services.model_registry import register_model, load_bundle
+    from app.services.model_family import ModelFamily
+    from app.apis.version1.endpoints.farm_data import get_sensor_data_for_device, get_all_sensor_data
+    import batch_yield_predictor # Lives next to this script
+except ImportError as e:
+    print(f"Error importing backend modules: {e}")
+    print(f"Ensure backend_api is mounted at /app in Docker and PYTHONPATH is effectively /app.")
+    sys.exit(1)
+
+# Times the hot paths against a synthetic dataset at several scales and emits the results as JSON:
+# MQTT message handling (iot_listener/listener.py on_message), the sensor-data read endpoints,
+# prediction feature engineering, prediction upserts and model load/predict.
+# The dataset is generated from a fixed seed into a separate benchmark database
+# (default: <POSTGRES_DB>_benchmark on the same server, created if missing), which is
+# truncated before each scale. It never runs against the application database.
+# Pass --baseline with an earlier run's JSON to flag cases that got slower.
+
+SCALES = {
+    # farms, fields per farm, sensor readings
+    "small": {"farms": 5, "fields_per_farm": 4, "readings": 100_000},
+    "medium": {"farms": 20, "fields_per_farm": 10, "readings": 1_000_000},
+    "large": {"farms": 50, "fields_per_farm": 20, "readings": 5_000_000},
+}
+DEFAULT_SCALES = ["small", "medium"]
+DEVICES_PER_FIELD = 2
+READING_HISTORY_DAYS = 365
+COPY_CHUNK_SIZE = 500_000 # Readings per COPY batch while generating
+CROP_TYPES = ["Maize GDD120", "Tomato Roma", "Cassava TME419"]
+SOIL_TYPES = ["Loamy", "Clay", "Sandy"]
+LISTENER_MESSAGES = 500 # Messages per listener timing run
+MAX_ALL_ROWS = 2_000_000 # get_all_sensor_data is skipped above this many readings (it materializes every row)
+DEFAULT_LISTENER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "iot_listener", "listener.py")
+
+
+def _log(message: str):
+    # Progress goes to stderr so stdout can carry the JSON report
+    print(message, file=sys.stderr, flush=True)
+
+
+def _benchmark_database_url(url: str = None) -> str:
+    url = make_url(url or os.environ.get("BENCHMARK_DATABASE_URL")
+                   or make_url(app_settings.ASSEMBLED_DATABASE_URL).set(database=f"{app_settings.POSTGRES_DB}_benchmark"))
+    if url.database == app_settings.POSTGRES_DB:
+        raise SystemExit("Refusing to benchmark against the application database (its tables are truncated).")
+    return url.render_as_string(hide_password=False)
+
+
+def _ensure_database(url: str):
+    """Creates the benchmark database through the application server if it does not exist yet."""
+    name = make_url(url).database
+    admin_engine = create_engine(app_settings.ASSEMBLED_DATABASE_URL, isolation_level="AUTOCOMMIT")
+    try:
+        with admin_engine.connect() as conn:
+            exists = conn.execute(text("SELECT 1 FROM pg_database WHERE datname = :name"), {"name": name}).first()
+            if not exists:
+                conn.execute(text(f'CREATE DATABASE "{name}"'))
+                _log(f"Created benchmark database {name}.")
+    finally:
+        admin_engine.dispose()
+
+
+# --- Synthetic data ---
+
+def generate_dataset(engine, SessionLocal, scale: dict, seed: int, now: datetime) -> dict:
+    """
+    Truncates the farm tables and fills them deterministically: each field gets one completed
+    feature join (yield_features.device_in_field: "field_<id>" not followed by a digit) picks them up. Readings are spread over
+    feature join (device_id containing "field_<id>") picks them up. Readings are spread over
+    the last READING_HISTORY_DAYS and loaded with COPY.
+    """
+    rng = np.random.default_rng(seed)
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        tables = ", ".join(table.name for table in Base.metadata.sorted_tables)
+        conn.execute(text(f"TRUNCATE {tables} RESTART IDENTITY CASCADE"))
+
+    n_fields = scale["farms"] * scale["fields_per_farm"]
+    with SessionLocal() as db:
+        farm_ids = db.execute(insert(Farm).returning(Farm.id, sort_by_parameter_order=True), [
+            {"name": f"bench_farm_{i}", "location_text": "synthetic", "total_area_hectares": None}
+            for i in range(scale["farms"])
+        ]).scalars().all()
+        areas = rng.uniform(1.0, 20.0, n_fields)
+        field_ids = db.execute(insert(Field).returning(Field.id, sort_by_parameter_order=True), [
+            {"farm_id": farm_ids[i // scale["fields_per_farm"]], "name": f"bench_field_{i}",
+             "area_hectares": float(areas[i]), "soil_type": SOIL_TYPES[i % len(SOIL_TYPES)]}
+            for i in range(n_fields)
+        ]).scalars().all()
+        cycles = []
+        for i, field_id in enumerate(field_ids):
+            crop_type = CROP_TYPES[int(rng.integers(len(CROP_TYPES)))]
+            planted = now - timedelta(days=int(rng.integers(280, 330)))
+            harvested = planted + timedelta(days=int(rng.integers(100, 140)))
+            cycles.append({"field_id": field_id, "crop_type": crop_type, "planting_date": planted,
+                           "expected_harvest_date": harvested, "actual_harvest_date": harvested,
+                           "actual_yield_tonnes": float(areas[i] * rng.uniform(2.0, 8.0))})
+            active_planted = now - timedelta(days=int(rng.integers(30, 150)))
+            cycles.append({"field_id": field_id, "crop_type": crop_type, "planting_date": active_planted,
+                           "expected_harvest_date": active_planted + timedelta(days=120),
+                           "actual_harvest_date": None, "actual_yield_tonnes": None})
+        db.execute(insert(CropCycle), cycles)
+        db.commit()
+
+    devices = np.array([f"field_{field_id}_sensor_{k}" for field_id in field_ids for k in range(DEVICES_PER_FIELD)], dtype=object)
+    history_seconds = READING_HISTORY_DAYS * 86400
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        for start in range(0, scale["readings"], COPY_CHUNK_SIZE):
+            n = min(COPY_CHUNK_SIZE, scale["readings"] - start)
+            offsets = rng.integers(0, history_seconds, n)
+            chunk = pd.DataFrame({
+                "device_id": devices[rng.integers(len(devices), size=n)],
+                "temperature": np.round(rng.normal(26.0, 5.0, n), 2),
+                "humidity": np.round(np.clip(rng.normal(65.0, 12.0, n), 0, 100), 2),
+                "soil_moisture": np.round(np.clip(rng.normal(0.35, 0.1, n), 0, 1), 3),
+                "timestamp": pd.Timestamp(now) - pd.to_timedelta(offsets, unit="s"),
+            })
+            chunk["received_at"] = chunk["timestamp"]
+            buffer = io.StringIO()
+            chunk.to_csv(buffer, header=False, index=False)
+            buffer.seek(0)
+            cursor.copy_expert(
+                "COPY sensor_readings (device_id, temperature, humidity, soil_moisture, timestamp, received_at) "
+                "FROM STDIN WITH (FORMAT csv)", buffer)
+        raw.commit()
+    finally:
+        raw.close()
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("ANALYZE"))
+
+    return {
+        "farms": scale["farms"],
+        "fields": n_fields,
+        "crop_cycles": len(cycles),
+        "devices": len(devices),
+        "sensor_readings": scale["readings"],
+        "generate_seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+# --- Timing ---
+
+def _time(fn, repeat: int, setup=None, per: int = 1) -> dict:
+    """
+    Runs fn `repeat` times (setup, if given, runs untimed before each) with stdout silenced.
+    Times are per call in milliseconds, divided by `per` when fn handles several items.
+    """
+    timings = []
+    result = None
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            if setup is not None:
+                setup()
+            started = time.perf_counter()
+            result = fn()
+            timings.append((time.perf_counter() - started) * 1000 / per)
+    return {
+        "runs": repeat,
+        "min_ms": round(min(timings), 4),
+        "median_ms": round(statistics.median(timings), 4),
+        "mean_ms": round(statistics.fmean(timings), 4),
+        "result": result,
+    }
+
+
+def _request(accept: str = "application/json") -> Request:
+    """A bare request with the headers the read endpoints negotiate on (no compression)."""
+    return Request({"type": "http", "method": "GET", "path": "/", "query_string": b"",
+                    "headers": [(b"accept", accept.encode()), (b"accept-encoding", b"identity")]})
+
+
+def _load_listener(path: str, engine):
+    """
+    Imports iot_listener/listener.py from its file and points its session factory at the
+    benchmark database. Raises ImportError when the file or its dependencies (paho-mqtt) are
+    not available, e.g. inside the backend image.
+    """
+    if not os.path.exists(path):
+        raise ImportError(f"{path} not found")
+    os.environ.setdefault("MQTT_BROKER_HOST", "localhost") # Required settings; no broker connection is made
+    os.environ.setdefault("MQTT_BROKER_PORT", "1883")
+    listener_dir = os.path.dirname(os.path.abspath(path))
+    if listener_dir not in sys.path:
+        sys.path.insert(0, listener_dir) # Sibling modules (alert_rules.py) are imported by name
+    spec = importlib.util.spec_from_file_location("benchmark_iot_listener", path)
+    listener = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(listener)
+    listener.engine.dispose()
+    listener.engine = engine
+    listener.SessionLocal.configure(bind=engine)
+    # Per-message INFO logging would dominate the timing and flood the output
+    listener.logger.setLevel(logging.WARNING)
+    return listener
+
+
+def _train_model(db, registry_dir: str) -> str:
+    """Trains a forest with the trainer's hyperparameters on the synthetic completed cycles and registers it."""
+    train_df = build_training_features(db, use_store=False)
+    X = train_df[FEATURE_COLUMNS].astype(float)
+    X = X.fillna(X.mean())
+    scaler = StandardScaler().fit(X)
+    model = RandomForestRegressor(n_estimators=100, random_state=42, max_depth=10, min_samples_split=5, n_jobs=-1)
+    model.fit(scaler.transform(X), train_df[TARGET_COLUMN])
+    return register_model(model, scaler, FEATURE_COLUMNS, feature_version=FEATURE_VERSION,
+                          params={"benchmark": True}, registry_dir=registry_dir)
+
+
+def run_scale(name: str, engine, SessionLocal, repeat: int, seed: int, listener_path: str) -> dict:
+    scale = SCALES[name]
+    now = datetime.utcnow().replace(microsecond=0)
+    _log(f"\n=== Scale '{name}': generating {scale['readings']:,} readings ===")
+    dataset = generate_dataset(engine, SessionLocal, scale, seed, now)
+    _log(f"Generated in {dataset['generate_seconds']}s.")
+    results = {}
+
+    def record(case: str, timing: dict, **extra):
+        timing.pop("result", None)
+        timing.update(extra)
+        results[case] = timing
+        _log(f"{case:48s} median {timing['median_ms']:10.3f} ms | min {timing['min_ms']:10.3f} ms")
+
+    registry_dir = tempfile.mkdtemp(prefix="hot-path-bench-registry-")
+    loop = asyncio.new_event_loop()
+    db = SessionLocal()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            version = _train_model(db, registry_dir)
+
+        # --- Model load / predict ---
+        record("model_load_compact_mmap", _time(lambda: ModelFamily.load(version, registry_dir=registry_dir), repeat))
+        record("model_load_sklearn", _time(lambda: load_bundle(version, mmap=False, registry_dir=registry_dir), repeat))
+        family = ModelFamily.load(version, registry_dir=registry_dir)
+        batch_yield_predictor.MODEL_VERSION = version
+        names = family.feature_names
+
+        # --- Prediction features (cold: cycle_features store emptied first) ---
+        def clear_feature_store():
+            db.execute(delete(CycleFeature))
+            db.commit()
+
+        cold = _time(lambda: batch_yield_predictor.fetch_and_engineer_prediction_features(db, names), repeat,
+                     setup=clear_feature_store)
+        record("fetch_and_engineer_prediction_features_cold", cold, rows=len(cold["result"]))
+        warm = _time(lambda: batch_yield_predictor.fetch_and_engineer_prediction_features(db, names), repeat)
+        features_df = warm["result"]
+        record("fetch_and_engineer_prediction_features_warm", warm, rows=len(features_df))
+
+        predicted = _time(lambda: batch_yield_predictor.predict_for_features(features_df, family, family.global_bundle.scaler, names), repeat)
+        predictions = predicted["result"]
+        record("predict_for_features", predicted, rows=len(predictions))
+
+        # --- Prediction upserts (insert: table emptied first; update: rows already present) ---
+        def clear_predictions():
+            db.execute(delete(YieldPrediction))
+            db.commit()
+
+        record("store_predictions_insert", _time(lambda: batch_yield_predictor.store_predictions(db, predictions), repeat,
+                                                 setup=clear_predictions), rows=len(predictions))
+        record("store_predictions_update", _time(lambda: batch_yield_predictor.store_predictions(db, predictions), repeat),
+               rows=len(predictions))
+
+        # --- Read endpoints, called directly (no HTTP stack) ---
+        device_id = db.execute(select(SensorReading.device_id).order_by(SensorReading.id).limit(1)).scalar_one()
+        device_rows = db.execute(select(func.count()).where(SensorReading.device_id == device_id)).scalar_one()
+        for case, accept in (("get_sensor_data_for_device_json", "application/json"),
+                             ("get_sensor_data_for_device_columnar", COLUMNAR_JSON_MEDIA_TYPE)):
+            timing = _time(lambda: loop.run_until_complete(get_sensor_data_for_device(device_id, _request(accept), db)), repeat)
+            record(case, timing, rows=device_rows, response_bytes=len(timing["result"].body))
+        if scale["readings"] <= MAX_ALL_ROWS:
+            timing = _time(lambda: loop.run_until_complete(get_all_sensor_data(_request(), db)), repeat)
+            record("get_all_sensor_data_json", timing, rows=scale["readings"], response_bytes=len(timing["result"].body))
+        else:
+            results["get_all_sensor_data_json"] = {"skipped": f"more than {MAX_ALL_ROWS} readings"}
+
+        # --- Listener message handling (last: it adds readings) ---
+        try:
+            listener = _load_listener(listener_path, engine)
+        except ImportError as e:
+            listener = None
+            results["listener_on_message"] = {"skipped": str(e)}
+            _log(f"Skipping listener_on_message: {e}")
+        if listener is not None:
+            payload = json.dumps({"temperature": 27.4, "humidity": 61.0, "soil_moisture": 0.38,
+                                  "timestamp": now.isoformat()}).encode()
+            message = types.SimpleNamespace(topic=f"{listener.settings.MQTT_TOPIC_PREFIX}{device_id}", payload=payload)
+
+            def handle_messages():
+                for _ in range(LISTENER_MESSAGES):
+                    listener.on_message(None, None, message)
+
+            timing = _time(handle_messages, repeat, per=LISTENER_MESSAGES)
+            record("listener_on_message", timing, messages_per_run=LISTENER_MESSAGES,
+                   messages_per_second=round(1000 / timing["median_ms"], 1))
+    finally:
+        db.close()
+        loop.close()
+
+    return {"dataset": dataset, "model_version": version, "results": results}
+
+
+def compare_to_baseline(report: dict, baseline: dict, threshold: float) -> list:
+    """Cases whose median is more than `threshold` (relative) slower than in the baseline report."""
+    regressions = []
+    for scale_name, scale in report["scales"].items():
+        baseline_results = baseline.get("scales", {}).get(scale_name, {}).get("results", {})
+        for case, timing in scale["results"].items():
+            before = baseline_results.get(case, {}).get("median_ms")
+            if before is None or "median_ms" not in timing:
+                continue
+            change = timing["median_ms"] / before - 1
+            if change > threshold:
+                regressions.append({"scale": scale_name, "case": case, "baseline_ms": before,
+                                    "median_ms": timing["median_ms"], "change": round(change, 3)})
+    return regressions
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(scales: list, repeat: int = 5, seed: int = 42, database_url: str = None,
+                   listener_path: str = DEFAULT_LISTENER_PATH) -> dict:
+    url = _benchmark_database_url(database_url)
+    _ensure_database(url)
+    engine = create_engine(url)
+    Base.metadata.create_all(bind=engine)
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    report = {
+        "benchmark": "hot_paths",
+        "started_at": datetime.utcnow().isoformat(),
+        "git_commit": _git_commit(),
+        "host": socket.gethostname(),
+        "python": platform.python_version(),
+        "database": make_url(url).render_as_string(hide_password=True),
+        "seed": seed,
+        "repeat": repeat,
+        "scales": {},
+    }
+    try:
+        for name in scales:
+            report["scales"][name] = run_scale(name, engine, SessionLocal, repeat, seed, listener_path)
+    finally:
+        engine.dispose()
+    report["finished_at"] = datetime.utcnow().isoformat()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the ingestion, read, feature and prediction hot paths on synthetic data.")
+    parser.add_argument("--scales", default=",".join(DEFAULT_SCALES),
+                        help=f"Comma-separated data scales to run, from {list(SCALES)}.")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per measurement.")
+    parser.add_argument("--seed", type=int, default=42, help="Seed for the synthetic dataset.")
+    parser.add_argument("--database-url", help="Benchmark database (default: $BENCHMARK_DATABASE_URL or <POSTGRES_DB>_benchmark).")
+    parser.add_argument("--listener-path", default=DEFAULT_LISTENER_PATH, help="Path to iot_listener/listener.py.")
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout.")
+    parser.add_argument("--baseline", help="Earlier JSON report to compare against; exits with status 1 on regressions.")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Relative slowdown of a median that counts as a regression.")
+    args = parser.parse_args()
+
+    scale_names = [name.strip() for name in args.scales.split(",") if name.strip()]
+    unknown = [name for name in scale_names if name not in SCALES]
+    if unknown:
+        parser.error(f"Unknown scale(s) {unknown}; choose from {list(SCALES)}")
+
+    report = run_benchmarks(scale_names, repeat=args.repeat, seed=args.seed,
+                            database_url=args.database_url, listener_path=args.listener_path)
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            regressions = compare_to_baseline(report, json.load(f), args.threshold)
+        report["regressions"] = regressions
+        for regression in regressions:
+            _log(f"REGRESSION {regression['scale']}/{regression['case']}: {regression['baseline_ms']} ms -> "
+                 f"{regression['median_ms']} ms ({regression['change']:+.0%})")
+
+    output = json.dumps(report, indent=2, default=str)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+        _log(f"Report written to {args.output}")
+    else:
+        print(output)
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,47 @@
+# tessyfarm_smartloop/ml_models/scripts/daily_weather_rollup.py
+import sys
+from datetime import datetime
+
+# --- Path Setup for Module Imports ---
+CONTAINER_BACKEND_API_ROOT = "/app"
+if CONTAINER_BACKEND_API_ROOT not in sys.path:
+    sys.path.insert(0, CONTAINER_BACKEND_API_ROOT)
+
+# --- Database and Configuration Imports ---
+try:
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from app.core.config import settings as app_settings
+    from app.services.yield_features import roll_up_daily_weather
+except ImportError as e:
+    print(f"Error importing backend modules: {e}")
+    print(f"Ensure backend_api is mounted at /app in Docker and PYTHONPATH is effectively /app.")
+    print(f"Current sys.path: {sys.path}")
+    sys.exit(1)
+
+# --- Database Setup ---
+db_url = app_settings.ASSEMBLED_DATABASE_URL
+engine = create_engine(db_url)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def run_daily_rollup():
+    """Upserts the newest complete days (and re-rolls the lookback days) in cycle_daily_weather for every active crop cycle."""
+    print(f"Starting daily weather rollup at {datetime.utcnow().isoformat()}...")
+    db = SessionLocal()
+    try:
+        rows_written = roll_up_daily_weather(db)
+        print(f"Wrote {rows_written} daily accumulator rows.")
+    except Exception as e:
+        db.rollback()
+        print(f"An error occurred during the daily weather rollup: {e}")
+    finally:
+        db.close()
+    print("Daily weather rollup finished.")
+
+
+if __name__ == "__main__":
+    # Run once a day, shortly after midnight (UTC), before the batch predictor.
+    # The first run for a cycle backfills from its planting date; later runs only add new days and
+    # recompute the last WEATHER_ROLLUP_LOOKBACK_DAYS of them.
+    run_daily_rollup()
@@ -0,0 +1,315 @@
+# tessyfarm_smartloop/ml_models/scripts/job_scheduler.py
+import os
+import sys
+import time
+import zlib
+import signal
+import socket
+import argparse
+import traceback
+from datetime import datetime, timedelta
+
+# --- Path Setup for Module Imports ---
+CONTAINER_BACKEND_API_ROOT = "/app"
+if CONTAINER_BACKEND_API_ROOT not in sys.path:
+    sys.path.insert(0, CONTAINER_BACKEND_API_ROOT)
+
+# --- Database and Configuration Imports ---
+try:
+    from sqlalchemy import text, select
+    from app.core.config import settings as app_settings
+    from app.core.db import engine, SessionLocal
+    from app.models.farm import JobRun
+    from app.services.model_registry import get_active_version, read_manifest
+    from app.services.model_family import GROUP_BY_OPTIONS
+    from app.services.yield_features import roll_up_daily_weather
+    from app.services.retention import apply_retention
+    # The job scripts live next to this one; importing them once keeps pandas/sklearn,
+    # their engines and the predictor's model artifacts warm between runs
+    import batch_yield_predictor
+    import yield_model_trainer
+except ImportError as e:
+    print(f"Error importing backend modules: {e}")
+    print(f"Ensure backend_api is mounted at /app in Docker and PYTHONPATH is effectively /app.")
+    print(f"Current sys.path: {sys.path}")
+    sys.exit(1)
+
+# Resident replacement for the docker-exec crontab. Jobs run one at a time in this process
+# (the predictor and trainer fork process pools, which must not happen while other threads
+# run). Runs missed while another job was busy are coalesced into one run afterwards.
+# Each run holds a Postgres advisory lock named after its lock group, so a second scheduler
+# or a manual --run-now never overlaps it, and is recorded in job_runs.
+# Schedules are cron expressions in the container's local time (TZ).
+
+
+class CronSchedule:
+    """Five-field cron expression (minute hour day-of-month month day-of-week) with *, a-b, lists and /step."""
+
+    _RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Expected 5 cron fields, got '{expression}'")
+        self.expression = expression
+        parsed = [self._parse_field(spec, low, high) for spec, (low, high) in zip(fields, self._RANGES)]
+        self.minutes, self.hours, self.days, self.months, weekdays = parsed
+        self.weekdays = {d % 7 for d in weekdays} # 0 and 7 are both Sunday
+        self._any_day = fields[2] == "*"
+        self._any_weekday = fields[4] == "*"
+
+    @staticmethod
+    def _parse_field(spec: str, low: int, high: int) -> set:
+        values = set()
+        for part in spec.split(","):
+            step = 1
+            if "/" in part:
+                part, step_text = part.split("/")
+                step = int(step_text)
+            if part == "*":
+                start, end = low, high
+            elif "-" in part:
+                start, end = (int(v) for v in part.split("-"))
+            else:
+                start = int(part)
+                end = high if step > 1 else start
+            if not (low <= start <= end <= high) or step < 1:
+                raise ValueError(f"Invalid cron field '{spec}'")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def matches(self, t: datetime) -> bool:
+        if t.minute not in self.minutes or t.hour not in self.hours or t.month not in self.months:
+            return False
+        day_ok = t.day in self.days
+        weekday_ok = (t.weekday() + 1) % 7 in self.weekdays # cron counts from Sunday
+        if self._any_day or self._any_weekday:
+            return day_ok and weekday_ok
+        return day_ok or weekday_ok # Both restricted: either one matches, as in cron
+
+    def due_between(self, after: datetime, until: datetime) -> bool:
+        """Whether a scheduled minute falls in (after, until]."""
+        t = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        while t <= until:
+            if self.matches(t):
+                return True
+            t += timedelta(minutes=1)
+        return False
+
+
+# --- Jobs ---
+# Each returns {'rows': int, 'details': dict} and optionally 'error' for a partial failure.
+
+def _job_batch_predictor(full: bool = False) -> dict:
+    state = batch_yield_predictor.run_batch_predictions(full=full)
+    if not state:
+        return {'rows': 0, 'details': {}, 'error': "Model artifacts could not be loaded"}
+    shards = state.get('shards', [])
+    failed = [shard['shard_id'] for shard in shards if shard['status'] != 'done']
+    result = {
+        'rows': sum(shard['cycles'] for shard in shards),
+        'details': {'run_id': state['run_id'], 'model_version': state.get('model_version'),
+                    'shards': len(shards), 'failed_shards': failed},
+    }
+    if failed:
+        result['error'] = f"{len(failed)} shard(s) failed; resume with batch_yield_predictor.py --resume {state['run_id']}"
+    return result
+
+
+def _job_trainer() -> dict:
+    """Incremental update of the active model (full build on drift), keeping its per-group layout."""
+    before = get_active_version()
+    group_by = None
+    if before:
+        active_group_by = read_manifest(before).get('group_by')
+        group_by = next((name for name, columns in GROUP_BY_OPTIONS.items() if columns == active_group_by), None)
+    yield_model_trainer.train_yield_model(incremental=True, group_by=group_by)
+    after = get_active_version()
+    if after == before:
+        return {'rows': 0, 'details': {'model_version': after, 'registered': False}}
+    metrics = read_manifest(after).get('metrics', {})
+    return {
+        'rows': metrics.get('training_rows') or 0,
+        'details': {'model_version': after, 'previous_version': before, 'registered': True,
+                    'incremental_from': metrics.get('incremental_from'), 'group_by': group_by},
+    }
+
+
+def _job_weather_rollup() -> dict:
+    db = SessionLocal()
+    try:
+        return {'rows': roll_up_daily_weather(db), 'details': {}}
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def _prune_prediction_run_states() -> int:
+    runs_dir = batch_yield_predictor.PREDICTION_RUNS_DIR
+    if not os.path.isdir(runs_dir):
+        return 0
+    cutoff = time.time() - app_settings.PREDICTION_RUN_STATE_RETENTION_DAYS * 86400
+    removed = 0
+    for name in os.listdir(runs_dir):
+        path = os.path.join(runs_dir, name)
+        if name.endswith('.json') and os.path.getmtime(path) < cutoff:
+            os.remove(path)
+            removed += 1
+    return removed
+
+
+def _job_retention() -> dict:
+    db = SessionLocal()
+    try:
+        details = apply_retention(db)
+    finally:
+        db.close()
+    details['prediction_run_states'] = _prune_prediction_run_states()
+    return {'rows': sum(details.values()), 'details': details}
+
+
+class Job:
+    def __init__(self, name: str, schedule: str, func, lock_group: str = None):
+        self.name = name
+        self.schedule = CronSchedule(schedule)
+        self.func = func
+        self.lock_group = lock_group or name # Jobs in the same group never run concurrently
+
+    @property
+    def lock_key(self) -> int:
+        return zlib.crc32(f"tessyfarm_smartloop.job.{self.lock_group}".encode())
+
+
+# The schedules of the former crontab, plus the nightly trainer and retention
+JOBS = [
+    Job("daily_weather_rollup", "30 1 * * *", _job_weather_rollup),
+    Job("yield_model_trainer", "15 2 * * *", _job_trainer),
+    Job("batch_yield_predictor", "5 * * * *", _job_batch_predictor, lock_group="batch_yield_predictor"),
+    Job("batch_yield_predictor_full", "0 3 * * 0", lambda: _job_batch_predictor(full=True), lock_group="batch_yield_predictor"),
+    Job("retention", "45 3 * * *", _job_retention),
+]
+
+
+# --- Run history and locking ---
+
+def _record_start(job: Job, trigger: str, status: str) -> int:
+    db = SessionLocal()
+    try:
+        run = JobRun(job_name=job.name, status=status, trigger=trigger, host=socket.gethostname(),
+                     started_at=datetime.utcnow())
+        db.add(run)
+        db.commit()
+        return run.id
+    finally:
+        db.close()
+
+
+def _record_finish(run_id: int, status: str, started: float, rows: int = None, details: dict = None, error: str = None):
+    db = SessionLocal()
+    try:
+        run = db.get(JobRun, run_id)
+        run.status = status
+        run.finished_at = datetime.utcnow()
+        run.duration_seconds = round(time.monotonic() - started, 3)
+        run.rows_affected = rows
+        run.details = details
+        run.error = error[:2000] if error else None
+        db.commit()
+    finally:
+        db.close()
+
+
+def run_job(job: Job, trigger: str = "schedule") -> str:
+    """Runs a job under its advisory lock and records the run. Returns the final status."""
+    started = time.monotonic()
+    # Autocommit, so the lock connection is not left idle in a transaction for the whole run
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as lock_conn:
+        acquired = lock_conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": job.lock_key}).scalar()
+        if not acquired:
+            print(f"[{datetime.now().isoformat(timespec='seconds')}] {job.name}: lock '{job.lock_group}' held elsewhere; skipped.")
+            run_id = _record_start(job, trigger, "skipped")
+            _record_finish(run_id, "skipped", started, error=f"Lock '{job.lock_group}' held by another run")
+            return "skipped"
+
+        print(f"[{datetime.now().isoformat(timespec='seconds')}] {job.name}: started ({trigger}).")
+        run_id = _record_start(job, trigger, "running")
+        try:
+            result = job.func()
+            status = "failed" if result.get('error') else "succeeded"
+            _record_finish(run_id, status, started, result.get('rows'), result.get('details'), result.get('error'))
+        except Exception as e:
+            traceback.print_exc()
+            status = "failed"
+            _record_finish(run_id, status, started, error=f"{type(e).__name__}: {e}")
+        finally:
+            lock_conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": job.lock_key})
+    print(f"[{datetime.now().isoformat(timespec='seconds')}] {job.name}: {status} in {time.monotonic() - started:.1f}s.")
+    return status
+
+
+# --- Scheduler loop ---
+
+_stop_requested = False
+
+def _request_stop(signum, frame):
+    global _stop_requested
+    print(f"Received signal {signum}; stopping after the current job.")
+    _stop_requested = True
+
+
+def run_scheduler(jobs: list = None):
+    jobs = jobs or JOBS
+    signal.signal(signal.SIGTERM, _request_stop)
+    signal.signal(signal.SIGINT, _request_stop)
+    print(f"Job scheduler started on {socket.gethostname()} with {len(jobs)} jobs:")
+    for job in jobs:
+        print(f"  {job.name:28s} {job.schedule.expression}")
+
+    last_checked = datetime.now().replace(second=0, microsecond=0)
+    while not _stop_requested:
+        # Wake up shortly after each minute boundary, in short sleeps so signals are handled promptly
+        next_minute = last_checked + timedelta(minutes=1)
+        while not _stop_requested and datetime.now() < next_minute:
+            time.sleep(min(1.0, max((next_minute - datetime.now()).total_seconds(), 0.01)))
+        if _stop_requested:
+            break
+        now = datetime.now().replace(second=0, microsecond=0)
+        due = [job for job in jobs if job.schedule.due_between(last_checked, now)]
+        last_checked = now # Minutes that pass while these run are checked next time, so missed runs coalesce
+        for job in due:
+            if _stop_requested:
+                break
+            run_job(job)
+    print("Job scheduler stopped.")
+
+
+def print_history(limit: int = 20):
+    db = SessionLocal()
+    try:
+        runs = db.execute(select(JobRun).order_by(JobRun.started_at.desc()).limit(limit)).scalars().all()
+        for run in runs:
+            duration = "-" if run.duration_seconds is None else f"{run.duration_seconds:.1f}s"
+            print(f"{run.started_at.isoformat(timespec='seconds')}  {run.job_name:28s} {run.status:9s} "
+                  f"{duration:>9s}  rows={run.rows_affected}  {run.error or ''}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Resident scheduler for the predictor, trainer, rollup and retention jobs.")
+    parser.add_argument("--run-now", metavar="JOB", choices=[job.name for job in JOBS], default=None, help="Run one job now (under its lock) and exit.")
+    parser.add_argument("--list", action="store_true", help="List jobs and schedules and exit.")
+    parser.add_argument("--history", type=int, nargs="?", const=20, default=None, metavar="N", help="Print the last N runs and exit.")
+    args = parser.parse_args()
+    if args.list:
+        for job in JOBS:
+            print(f"{job.name:28s} {job.schedule.expression:14s} lock={job.lock_group}")
+    elif args.history is not None:
+        print_history(args.history)
+    elif args.run_now:
+        status = run_job(next(job for job in JOBS if job.name == args.run_now), trigger="manual")
+        sys.exit(0 if status == "succeeded" else 1)
+    else:
+        run_scheduler()
@@ -1,13 +1,15 @@
 # tessyfarm_smartloop/ml_models/scripts/yield_model_trainer.py
 import os
 import sys
+import math
+import json
+import argparse
 import pandas as pd
 import numpy as np
 from datetime import datetime # timedelta was imported but not used, can be removed if not needed
-import joblib # For saving the model
-import json # <--- ADDED: For saving feature names
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
-from sklearn.model_selection import train_test_split
+from sklearn.model_selection import train_test_split, GroupKFold, ParameterGrid, ParameterSampler
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.metrics import mean_squared_error, r2_score
 from sklearn.preprocessing import StandardScaler
@@ -24,129 +26,423 @@ try:
     from sqlalchemy import create_engine # text was imported but not used
     from sqlalchemy.orm import sessionmaker, Session # <--- UPDATED: Import Session for type hinting
     from app.core.config import settings as app_settings # <--- UPDATED: Assuming backend_api/app/ is at /app/app/
-    from app.models.farm import CropCycle, SensorReading, Field # <--- UPDATED: Models are under app.models
+    from app.services.yield_features import build_training_features, FEATURE_COLUMNS, FEATURE_VERSION, TARGET_COLUMN # Shared with batch_yield_predictor.py
+    from app.services.model_registry import register_model, load_bundle, read_artifact, get_active_version, ModelRegistryError
+    from app.services.training_snapshot import load_training_snapshot
+    from app.services.model_family import GROUP_BY_OPTIONS, group_keys
+    from app.services.stage_profiler import StageProfiler, enable_profiling
 except ImportError as e:
     print(f"Error importing backend modules: {e}")
     print(f"Ensure backend_api is mounted at /app in Docker and PYTHONPATH is effectively /app.")
     print(f"Current sys.path: {sys.path}")
     sys.exit(1)
 
-# --- Constants for Model Artifact Paths ---
-# These paths are relative to the container's filesystem, assuming ml_models is mounted at /app/ml_models
-BASE_ML_MODELS_PATH_IN_CONTAINER = "/app/ml_models"
-MODEL_DIR = os.path.join(BASE_ML_MODELS_PATH_IN_CONTAINER, "saved_models")
-MODEL_FILENAME = "yield_prediction_model_v1.joblib"
-SCALER_FILENAME = "yield_feature_scaler_v1.joblib"
-FEATURE_NAMES_FILENAME = "yield_model_feature_names_v1.json"
-
-MODEL_PATH = os.path.join(MODEL_DIR, MODEL_FILENAME)
-SCALER_PATH = os.path.join(MODEL_DIR, SCALER_FILENAME)
-FEATURE_NAMES_PATH = os.path.join(MODEL_DIR, FEATURE_NAMES_FILENAME)
+# --- Model Registry ---
+# Trained bundles (model, scaler, feature names, metrics, feature version) are stored under a
+# version id in the registry (app/services/model_registry.py, settings.MODEL_REGISTRY_DIR)
+# and the new version is activated for the batch predictor.
+MODEL_DIR = app_settings.MODEL_REGISTRY_DIR
+
+# --- Hyperparameter Search (--search) ---
+# Sampled configurations are cross-validated with GroupKFold by field, so cycles of the same
+# field never appear in both the training and the validation side of a fold. Folds are run
+# as successive halving: every surviving configuration is scored on the next fold, then only
+# the best SEARCH_KEEP_FRACTION (by mean RMSE so far) continue. Once SEARCH_MIN_SURVIVORS or
+# fewer remain, their remaining folds run all at once. Fits run in a process pool.
+SEARCH_PARAM_GRID = {
+    'n_estimators': [100, 200, 400],
+    'max_depth': [6, 10, 14, None],
+    'min_samples_split': [2, 5, 10],
+    'min_samples_leaf': [1, 2, 4],
+    'max_features': [1.0, 0.5, 'sqrt'],
+}
+SEARCH_DEFAULT_FOLDS = 5
+SEARCH_DEFAULT_MAX_CONFIGS = 40
+SEARCH_KEEP_FRACTION = 0.5
+SEARCH_MIN_SURVIVORS = 3
+SEARCH_RANDOM_STATE = 42
+SEARCH_RESULTS_FILENAME = "search_results.csv" # Stored with the registered version
+
+# --- Per-group models (--group-by crop|crop_soil) ---
+# One model per crop type (or crop type and soil type), trained in parallel with the same
+# hyperparameters as the global model and stored in the same registry version. Groups with
+# fewer than GROUP_MIN_ROWS cycles get no model; the predictor scores them with the global one.
+GROUP_MIN_ROWS = 30
+
+# --- Incremental retraining (--incremental) ---
+# Cycles completed since the active version was trained are learned by growing its forest
+# (warm_start): new trees are fitted on the new cycles only, in proportion to their share of
+# all training cycles, so each cycle keeps roughly the same weight in the forest average.
+# A share of the new cycles joins the version's holdout. The scaler is kept as it is, since
+# the existing trees split on features scaled with it. A full build runs instead when:
+# - the active model's RMSE on the new cycles exceeds INCREMENTAL_MAX_RMSE_RATIO x its holdout RMSE
+# - a feature's mean over the new cycles is more than INCREMENTAL_MAX_FEATURE_SHIFT training
+#   standard deviations from the training mean
+# - the forest would grow past INCREMENTAL_MAX_TREE_GROWTH x the trees of the last full build
+# - the updated model is worse on the holdout than the active one (beyond INCREMENTAL_HOLDOUT_TOLERANCE)
+# Edited cycles that were already trained on are only relearned by the next full build.
+TRAINING_CYCLES_FILENAME = "training_cycles.json" # Trained / held-out cycle ids, stored with each version
+INCREMENTAL_MIN_NEW_CYCLES = 10 # With fewer new cycles nothing is registered
+INCREMENTAL_HOLDOUT_FRACTION = 0.2
+INCREMENTAL_MAX_RMSE_RATIO = 1.25
+INCREMENTAL_MAX_FEATURE_SHIFT = 0.5
+INCREMENTAL_MAX_TREE_GROWTH = 2.0
+INCREMENTAL_HOLDOUT_TOLERANCE = 0.02
 
 
 # --- Database Setup ---
 db_url = app_settings.ASSEMBLED_DATABASE_URL
 engine = create_engine(db_url)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Feature queries read from the replica when one is configured (see app/core/db.py); writes stay on engine
+read_engine = create_engine(app_settings.REPLICA_DATABASE_URL) if app_settings.REPLICA_DATABASE_URL else engine
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
 
-def fetch_historical_data(db: Session) -> pd.DataFrame: # <--- UPDATED: Type hint to Session
+def fetch_historical_data(db: Session, use_snapshot: bool = True, refresh_snapshot: bool = False,
+                          read_db: Session = None) -> pd.DataFrame: # <--- UPDATED: Type hint to Session
     """
     Fetches historical crop cycle data and associated aggregated sensor readings.
+    Feature engineering is shared with the batch predictor (app/services/yield_features.py);
+    per-cycle aggregates are served from the cycle_features store when unchanged.
+    With use_snapshot, the engineered matrix comes from the local training snapshot
+    (app/services/training_snapshot.py) and only new or changed cycles are rebuilt.
+    read_db (the replica session, if any) serves the reads; cycle_features writes go through db.
     """
+    if use_snapshot:
+        print(f"Loading training data via snapshot in {app_settings.TRAINING_SNAPSHOT_DIR}...")
+        return load_training_snapshot(db, refresh=refresh_snapshot, read_db=read_db)
     print("Fetching historical data from database...")
-    
-    query = db.query(
-        CropCycle.id.label("crop_cycle_id"),
-        CropCycle.field_id.label("field_id"), # <--- ADDED: To use in sensor data query filter
-        CropCycle.crop_type,
-        CropCycle.planting_date,
-        CropCycle.actual_harvest_date,
-        CropCycle.actual_yield_tonnes,
-        Field.area_hectares.label("field_area_hectares"),
-        Field.soil_type
-    ).join(Field, CropCycle.field_id == Field.id)\
-     .filter(CropCycle.actual_yield_tonnes.isnot(None))\
-     .filter(CropCycle.actual_harvest_date.isnot(None))
-    
-    crop_cycles_df = pd.read_sql(query.statement, db.bind) # Use db.bind for SQLAlchemy < 2.0, or db for >= 2.0 with new API
-    print(f"Found {len(crop_cycles_df)} completed crop cycles with yield data.")
-    if crop_cycles_df.empty:
-        return pd.DataFrame()
-
-    all_features_list = [] # Renamed to avoid conflict with 'features' dict
-    for index, cycle in crop_cycles_df.iterrows():
-        print(f"Processing crop cycle ID: {cycle['crop_cycle_id']} (Field ID: {cycle['field_id']})")
-        
-        # Fetch sensor data for this cycle.
-        # IMPORTANT: The device_id filtering logic here is a placeholder.
-        # You need a robust way to link sensors to specific fields/crop_cycles.
-        # This might involve a device_to_field mapping table or specific device naming conventions.
-        sensor_query = db.query(SensorReading)\
-            .filter(SensorReading.timestamp >= cycle['planting_date'])\
-            .filter(SensorReading.timestamp <= cycle['actual_harvest_date'])\
-            .filter(SensorReading.device_id.contains(f"field_{cycle['field_id']}")) # Example filter
-            # If your device IDs don't follow this pattern, this query will not find data.
-            # Consider broader query for debugging:
-            # .filter(SensorReading.device_id.startswith("field_")) # or based on known device IDs for that field
-
-        sensor_df = pd.read_sql(sensor_query.statement, db.bind)
-        
-        if sensor_df.empty:
-            print(f"  No sensor data found for crop cycle {cycle['crop_cycle_id']} (Field ID: {cycle['field_id']}) with current filter. Skipping.")
-            continue
-
-        # --- Feature Engineering ---
-        features = {"crop_cycle_id": cycle['crop_cycle_id']}
-
-        cycle_duration_days = (cycle['actual_harvest_date'] - cycle['planting_date']).days
-        if cycle_duration_days <= 0:
-            print(f"  Invalid cycle duration ({cycle_duration_days} days) for cycle {cycle['crop_cycle_id']}. Skipping.")
-            continue
-        features['cycle_duration_days'] = cycle_duration_days
-        
-        # Sensor features (ensure columns exist and handle NaNs from .mean() if sensor_df is empty for a type)
-        features['avg_temp'] = sensor_df['temperature'].mean() if 'temperature' in sensor_df else np.nan
-        features['min_temp'] = sensor_df['temperature'].min() if 'temperature' in sensor_df else np.nan
-        features['max_temp'] = sensor_df['temperature'].max() if 'temperature' in sensor_df else np.nan
-        features['avg_humidity'] = sensor_df['humidity'].mean() if 'humidity' in sensor_df else np.nan
-        features['avg_soil_moisture'] = sensor_df['soil_moisture'].mean() if 'soil_moisture' in sensor_df else np.nan
-        
-        t_base = 10
-        # Ensure min_temp and max_temp are not NaN before GDD calculation
-        if pd.notna(features['max_temp']) and pd.notna(features['min_temp']):
-            avg_daily_temp_proxy = (features['max_temp'] + features['min_temp']) / 2
-            features['gdd_approx'] = max(0, avg_daily_temp_proxy - t_base) * cycle_duration_days
-        else:
-            features['gdd_approx'] = np.nan # Or some other imputation
-
-        features['field_area_hectares'] = cycle['field_area_hectares']
-        # Placeholder for categorical encoding - to be implemented
-        # features['crop_type_encoded'] = encode_crop_type(cycle['crop_type'])
-        # features['soil_type_encoded'] = encode_soil_type(cycle['soil_type'])
-
-        if cycle['field_area_hectares'] and cycle['field_area_hectares'] > 0 and pd.notna(cycle['actual_yield_tonnes']):
-            features['actual_yield_tonnes_per_hectare'] = cycle['actual_yield_tonnes'] / cycle['field_area_hectares']
-        else:
-            print(f"  Field area is 0/None or actual_yield_tonnes is None for cycle {cycle['crop_cycle_id']}. Cannot calculate target. Skipping.")
-            continue
-
-        all_features_list.append(features)
-        print(f"  Engineered features for crop cycle {cycle['crop_cycle_id']}.")
-
-    if not all_features_list:
-        print("No data available after feature engineering.")
-        return pd.DataFrame()
-        
-    return pd.DataFrame(all_features_list)
-
-
-def train_yield_model():
+    return build_training_features(db, read_db=read_db)
+
+
+# Training data for search workers, set once per process by _init_search_worker
+_search_data = None
+
+def _init_search_worker(X: np.ndarray, y: np.ndarray):
+    global _search_data
+    _search_data = (X, y)
+
+
+def _evaluate_fold(config_id: int, params: dict, fold_no: int, train_idx: np.ndarray, test_idx: np.ndarray) -> tuple:
+    """Fits scaler + forest on one fold's training side (one core) and scores the held-out fields."""
+    X, y = _search_data
+    scaler = StandardScaler().fit(X[train_idx])
+    model = RandomForestRegressor(random_state=SEARCH_RANDOM_STATE, n_jobs=1, **params)
+    model.fit(scaler.transform(X[train_idx]), y[train_idx])
+    y_pred = model.predict(scaler.transform(X[test_idx]))
+    rmse = float(np.sqrt(mean_squared_error(y[test_idx], y_pred)))
+    r2 = float(r2_score(y[test_idx], y_pred)) if len(test_idx) > 1 else float('nan')
+    return config_id, fold_no, rmse, r2
+
+
+def run_parameter_search(X: np.ndarray, y: np.ndarray, groups: np.ndarray, n_folds: int = SEARCH_DEFAULT_FOLDS,
+                         max_configs: int = SEARCH_DEFAULT_MAX_CONFIGS, workers: int = None) -> tuple:
+    """
+    Group-aware cross-validated search over SEARCH_PARAM_GRID with successive-halving pruning.
+    Returns (results, best_params): one results row per configuration (params, folds evaluated,
+    mean/std RMSE, mean R2, the fold after which it was pruned), best first.
+    """
+    n_folds = min(n_folds, len(np.unique(groups)))
+    if n_folds < 2:
+        raise ValueError("Parameter search needs completed cycles from at least 2 fields.")
+    workers = workers or os.cpu_count() or 1
+    folds = list(GroupKFold(n_splits=n_folds).split(X, y, groups))
+
+    grid_size = len(ParameterGrid(SEARCH_PARAM_GRID))
+    configs = list(ParameterSampler(SEARCH_PARAM_GRID, n_iter=min(max_configs, grid_size), random_state=SEARCH_RANDOM_STATE))
+    print(f"Searching {len(configs)} of {grid_size} configurations with {n_folds}-fold GroupKFold by field "
+          f"on {len(X)} cycles from {len(np.unique(groups))} fields, {workers} workers.")
+
+    rmses = {i: {} for i in range(len(configs))}
+    r2s = {i: {} for i in range(len(configs))}
+    pruned_after = {}
+    survivors = list(range(len(configs)))
+
+    def mean_rmse(i):
+        return float(np.mean(list(rmses[i].values())))
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_search_worker, initargs=(X, y)) as pool:
+        next_fold = 0
+        while next_fold < n_folds:
+            # Prune one fold at a time while there are many candidates, then finish the rest together
+            if len(survivors) > SEARCH_MIN_SURVIVORS and next_fold < n_folds - 1:
+                fold_nos = [next_fold]
+            else:
+                fold_nos = list(range(next_fold, n_folds))
+            futures = [
+                pool.submit(_evaluate_fold, i, configs[i], fold_no, folds[fold_no][0], folds[fold_no][1])
+                for fold_no in fold_nos for i in survivors
+            ]
+            for future in as_completed(futures):
+                config_id, fold_no, rmse, r2 = future.result()
+                rmses[config_id][fold_no] = rmse
+                r2s[config_id][fold_no] = r2
+            next_fold = fold_nos[-1] + 1
+
+            ranked = sorted(survivors, key=mean_rmse)
+            print(f"  Fold {next_fold}/{n_folds}: {len(ranked)} configurations, best mean RMSE {mean_rmse(ranked[0]):.3f}")
+            if next_fold < n_folds:
+                keep = max(SEARCH_MIN_SURVIVORS, math.ceil(len(ranked) * SEARCH_KEEP_FRACTION))
+                for i in ranked[keep:]:
+                    pruned_after[i] = next_fold
+                survivors = ranked[:keep]
+
+    rows = []
+    for i, params in enumerate(configs):
+        fold_rmses = list(rmses[i].values())
+        fold_r2s = np.array(list(r2s[i].values()))
+        rows.append({
+            'config_id': i,
+            **{f'param_{k}': v for k, v in params.items()},
+            'folds_evaluated': len(fold_rmses),
+            'mean_rmse': float(np.mean(fold_rmses)),
+            'std_rmse': float(np.std(fold_rmses)),
+            'mean_r2': float(np.nanmean(fold_r2s)) if np.isfinite(fold_r2s).any() else float('nan'),
+            'pruned_after_fold': pruned_after.get(i),
+        })
+    results = pd.DataFrame(rows)
+    results['pruned_after_fold'] = results['pruned_after_fold'].astype('Int64') # Empty for finalists
+    # Fully evaluated configurations first, then by how far they got; mean RMSE within each
+    results = results.sort_values(['folds_evaluated', 'mean_rmse'], ascending=[False, True]).reset_index(drop=True)
+    results.insert(0, 'rank', range(1, len(results) + 1))
+    return results, configs[int(results.loc[0, 'config_id'])]
+
+
+def _fit_group_model(key: str, X: np.ndarray, y: np.ndarray, params: dict) -> tuple:
+    """Fits scaler + forest for one group on one core, with test metrics from an 80/20 split."""
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    scaler = StandardScaler().fit(X_train)
+    model = RandomForestRegressor(**{**params, 'n_jobs': 1})
+    model.fit(scaler.transform(X_train), y_train)
+    model.set_params(n_jobs=params.get('n_jobs')) # Scoring uses the same setting as the global model
+    y_pred_test = model.predict(scaler.transform(X_test))
+    metrics = {
+        'test_rmse': float(np.sqrt(mean_squared_error(y_test, y_pred_test))),
+        'test_r2': float(r2_score(y_test, y_pred_test)) if len(y_test) > 1 else None,
+        'training_rows': int(len(X_train)),
+        'test_rows': int(len(X_test)),
+    }
+    return key, model, scaler, metrics
+
+
+def train_group_models(data_df: pd.DataFrame, feature_columns: list, params: dict, group_by: list,
+                       min_rows: int = GROUP_MIN_ROWS, workers: int = None) -> dict:
+    """Per-group models for groups with at least min_rows cycles, fitted in a process pool."""
+    keys = group_keys(data_df, group_by)
+    counts = keys.value_counts()
+    eligible = counts[counts >= min_rows].index.tolist()
+    sparse = counts[counts < min_rows]
+    print(f"Training {len(eligible)} group models by {'/'.join(group_by)}; "
+          f"{len(sparse)} groups ({int(sparse.sum())} cycles) below {min_rows} cycles use the global model.")
+    if not eligible:
+        return {}
+
+    X = data_df[feature_columns].to_numpy(dtype=np.float64)
+    y = data_df['actual_yield_tonnes_per_hectare'].to_numpy(dtype=np.float64)
+    group_models = {}
+    with ProcessPoolExecutor(max_workers=min(workers or os.cpu_count() or 1, len(eligible))) as pool:
+        futures = [pool.submit(_fit_group_model, key, X[(keys == key).to_numpy()], y[(keys == key).to_numpy()], params)
+                   for key in eligible]
+        for future in as_completed(futures):
+            key, model, scaler, metrics = future.result()
+            group_models[key] = {'model': model, 'scaler': scaler, 'metrics': metrics}
+            print(f"  Group '{key}': {metrics['training_rows']} training cycles, test RMSE {metrics['test_rmse']:.3f}")
+    return group_models
+
+
+def _training_cycles_artifact(train_ids, holdout_ids, full_build_version: str = None, full_build_trees: int = None) -> str:
+    """TRAINING_CYCLES_FILENAME content; full_build_version None means the version it is stored with."""
+    return json.dumps({
+        'train': sorted(int(i) for i in train_ids),
+        'holdout': sorted(int(i) for i in holdout_ids),
+        'full_build_version': full_build_version,
+        'full_build_trees': full_build_trees,
+    })
+
+
+def _train_incremental(data_df: pd.DataFrame, feature_columns: list) -> bool:
+    """
+    Warm-start update of the active version with the cycles completed since it was trained
+    (see the --incremental notes above). Returns False when a full build is needed instead.
+    """
+    try:
+        bundle = load_bundle(mmap=False)
+    except ModelRegistryError as e:
+        print(f"{e}; running a full build.")
+        return False
+    state_text = read_artifact(bundle.version, TRAINING_CYCLES_FILENAME)
+    if state_text is None or not isinstance(bundle.model, RandomForestRegressor):
+        print(f"Active version {bundle.version} cannot be updated incrementally "
+              f"(no {TRAINING_CYCLES_FILENAME} or not a RandomForestRegressor); running a full build.")
+        return False
+    if bundle.feature_version != FEATURE_VERSION or list(bundle.feature_names) != list(feature_columns):
+        print(f"Active version {bundle.version} was trained on other features; running a full build.")
+        return False
+
+    state = json.loads(state_text)
+    known_ids = set(state['train']) | set(state['holdout'])
+    new_df = data_df[~data_df['crop_cycle_id'].isin(known_ids)]
+    if len(new_df) < INCREMENTAL_MIN_NEW_CYCLES:
+        print(f"{len(new_df)} cycles completed since version {bundle.version} "
+              f"(minimum {INCREMENTAL_MIN_NEW_CYCLES}); nothing to update.")
+        return True
+    model, scaler = bundle.model, bundle.scaler
+    n_trees = len(model.estimators_)
+    full_build_version = state.get('full_build_version') or bundle.version
+    full_build_trees = state.get('full_build_trees') or n_trees
+
+    # Drift of the new cycles against the active model
+    baseline_rmse = bundle.metrics.get('test_rmse') or bundle.metrics.get('cv_rmse')
+    new_rmse = float(np.sqrt(mean_squared_error(new_df[TARGET_COLUMN], model.predict(scaler.transform(new_df[feature_columns])))))
+    rmse_ratio = new_rmse / baseline_rmse if baseline_rmse else None
+    feature_shift = np.abs(new_df[feature_columns].to_numpy(dtype=np.float64).mean(axis=0) - scaler.mean_) / scaler.scale_
+    shifted = int(np.argmax(feature_shift))
+    print(f"{len(new_df)} cycles completed since version {bundle.version}: RMSE {new_rmse:.3f} "
+          f"(holdout RMSE {'N/A' if baseline_rmse is None else f'{baseline_rmse:.3f}'}), largest feature shift "
+          f"{feature_shift[shifted]:.2f} std devs ({feature_columns[shifted]}).")
+    if rmse_ratio is not None and rmse_ratio > INCREMENTAL_MAX_RMSE_RATIO:
+        print(f"RMSE on new cycles is {rmse_ratio:.2f}x the holdout RMSE (limit {INCREMENTAL_MAX_RMSE_RATIO}); running a full build.")
+        return False
+    if feature_shift[shifted] > INCREMENTAL_MAX_FEATURE_SHIFT:
+        print(f"Feature '{feature_columns[shifted]}' shifted beyond {INCREMENTAL_MAX_FEATURE_SHIFT} std devs; running a full build.")
+        return False
+
+    new_train_df, new_holdout_df = train_test_split(new_df, test_size=INCREMENTAL_HOLDOUT_FRACTION, random_state=42)
+    trees_to_add = max(1, math.ceil(n_trees * len(new_train_df) / max(len(state['train']), 1)))
+    if n_trees + trees_to_add > INCREMENTAL_MAX_TREE_GROWTH * full_build_trees:
+        print(f"Forest would grow to {n_trees + trees_to_add} trees, over {INCREMENTAL_MAX_TREE_GROWTH}x the "
+              f"{full_build_trees} of full build {full_build_version}; running a full build.")
+        return False
+
+    holdout_df = pd.concat([data_df[data_df['crop_cycle_id'].isin(state['holdout'])], new_holdout_df])
+    X_holdout = scaler.transform(holdout_df[feature_columns])
+    y_holdout = holdout_df[TARGET_COLUMN].to_numpy(dtype=np.float64)
+    active_holdout_rmse = float(np.sqrt(mean_squared_error(y_holdout, model.predict(X_holdout))))
+
+    # There is no OOB estimate for the grown forest: the new trees only saw the new cycles, and a
+    # warm-start fit does not recompute it. Drop the full build's oob_score_ rather than carry it
+    # over stale; the holdout RMSE below is the incremental version's quality measure.
+    model.set_params(warm_start=True, n_estimators=n_trees + trees_to_add, oob_score=False)
+    model.fit(scaler.transform(new_train_df[feature_columns]), new_train_df[TARGET_COLUMN].to_numpy(dtype=np.float64))
+    model.set_params(warm_start=False)
+    for attribute in ('oob_score_', 'oob_prediction_'):
+        if hasattr(model, attribute):
+            delattr(model, attribute)
+
+    y_pred_holdout = model.predict(X_holdout)
+    holdout_rmse = float(np.sqrt(mean_squared_error(y_holdout, y_pred_holdout)))
+    print(f"Added {trees_to_add} trees ({n_trees} -> {n_trees + trees_to_add}) for {len(new_train_df)} cycles. "
+          f"Holdout RMSE {active_holdout_rmse:.3f} -> {holdout_rmse:.3f} on {len(holdout_df)} cycles.")
+    if holdout_rmse > active_holdout_rmse * (1 + INCREMENTAL_HOLDOUT_TOLERANCE):
+        print("The updated model is worse on the holdout; running a full build.")
+        return False
+
+    train_ids = set(state['train']) | set(new_train_df['crop_cycle_id'])
+    metrics = {
+        'test_rmse': holdout_rmse,
+        'test_r2': float(r2_score(y_holdout, y_pred_holdout)) if len(y_holdout) > 1 else None,
+        'training_rows': len(train_ids),
+        'test_rows': int(len(holdout_df)),
+        'incremental_from': bundle.version,
+        'full_build_version': full_build_version,
+        'new_cycles': int(len(new_df)),
+        'trees_added': trees_to_add,
+        'new_cycles_rmse_ratio': rmse_ratio,
+        'max_feature_shift': float(feature_shift[shifted]),
+    }
+    # Group models are carried over unchanged; they are retrained by the next full build
+    group_models = {}
+    for key in bundle.manifest.get('groups') or {}:
+        group_bundle = load_bundle(bundle.version, mmap=False, group=key)
+        group_models[key] = {'model': group_bundle.model, 'scaler': group_bundle.scaler, 'metrics': group_bundle.metrics}
+    version = register_model(
+        model, scaler, list(feature_columns),
+        metrics=metrics, feature_version=FEATURE_VERSION, params=model.get_params(),
+        artifacts={TRAINING_CYCLES_FILENAME: _training_cycles_artifact(
+            train_ids, holdout_df['crop_cycle_id'], full_build_version, full_build_trees)},
+        groups=group_models, group_by=bundle.manifest.get('group_by'),
+    )
+    print(f"Incrementally updated model registered and activated as version {version} in {MODEL_DIR}")
+    return True
+
+
+def _train_with_search(data_df: pd.DataFrame, feature_columns: list, n_folds: int, max_configs: int, workers: int,
+                       group_by: list = None, min_group_rows: int = GROUP_MIN_ROWS):
+    """Runs the parameter search, refits the best configuration on all cycles and registers it."""
+    X = data_df[feature_columns].to_numpy(dtype=np.float64)
+    y = data_df['actual_yield_tonnes_per_hectare'].to_numpy(dtype=np.float64)
+    groups = data_df['field_id'].to_numpy()
+    try:
+        results, best_params = run_parameter_search(X, y, groups, n_folds=n_folds, max_configs=max_configs, workers=workers)
+    except ValueError as e:
+        print(f"{e} Exiting training.")
+        return
+    best = results.iloc[0]
+
+    print("\n--- Parameter Search Complete ---")
+    print(results.head(10).to_string(index=False))
+    print(f"Best parameters: {best_params} (CV RMSE {best['mean_rmse']:.3f} +/- {best['std_rmse']:.3f})")
+
+    # Final model on every cycle, with the scaler fitted on the same rows
+    scaler = StandardScaler()
+    X_scaled = scaler.fit_transform(data_df[feature_columns])
+    model = RandomForestRegressor(random_state=SEARCH_RANDOM_STATE, oob_score=True, **best_params)
+    model.fit(X_scaled, y)
+    oob = model.oob_score_ if hasattr(model, 'oob_score_') and model.oob_score_ else None
+    print(f"OOB Score of the refitted model: {'N/A' if oob is None else f'{oob:.3f}'}")
+
+    metrics = {
+        'cv_rmse': float(best['mean_rmse']),
+        'cv_rmse_std': float(best['std_rmse']),
+        'cv_r2': None if np.isnan(best['mean_r2']) else float(best['mean_r2']),
+        'cv_folds': int(best['folds_evaluated']),
+        'cv_grouped_by': 'field_id',
+        'configurations_evaluated': int(len(results)),
+        'oob_score': None if oob is None else float(oob),
+        'training_rows': int(len(X)),
+    }
+    group_models = train_group_models(data_df, feature_columns, model.get_params(), group_by, min_group_rows, workers) if group_by else None
+    version = register_model(
+        model, scaler, list(feature_columns),
+        metrics=metrics, feature_version=FEATURE_VERSION, params=model.get_params(),
+        artifacts={
+            SEARCH_RESULTS_FILENAME: results.to_csv(index=False),
+            TRAINING_CYCLES_FILENAME: _training_cycles_artifact(data_df['crop_cycle_id'], [], full_build_trees=len(model.estimators_)),
+        },
+        groups=group_models, group_by=group_by,
+    )
+    print(f"Model registered and activated as version {version} in {MODEL_DIR} "
+          f"(search results in {SEARCH_RESULTS_FILENAME})")
+
+
+def train_yield_model(search: bool = False, n_folds: int = SEARCH_DEFAULT_FOLDS,
+                      max_configs: int = SEARCH_DEFAULT_MAX_CONFIGS, workers: int = None,
+                      use_snapshot: bool = True, refresh_snapshot: bool = False,
+                      group_by: str = None, min_group_rows: int = GROUP_MIN_ROWS, incremental: bool = False):
+    """With profiling enabled (--profile), a stage summary is written to settings.PROFILE_DIR."""
+    profiler = StageProfiler("yield_model_trainer").start()
+    mode = 'incremental' if incremental else 'search' if search else 'full'
+    try:
+        _train_yield_model(profiler, search, n_folds, max_configs, workers, use_snapshot, refresh_snapshot,
+                           group_by, min_group_rows, incremental)
+    finally:
+        profiler.context.update({'mode': mode, 'group_by': group_by, 'active_version': get_active_version()})
+        profiler.finish()
+
+
+def _train_yield_model(profiler: StageProfiler, search: bool, n_folds: int, max_configs: int, workers: int,
+                       use_snapshot: bool, refresh_snapshot: bool, group_by: str, min_group_rows: int, incremental: bool):
     print("Starting yield model training process...")
     print(f"Attempting to load backend modules. Current sys.path: {sys.path}") # For debugging imports
     db = SessionLocal()
+    read_db = ReadSessionLocal() if read_engine is not engine else db
     try:
-        data_df = fetch_historical_data(db)
+        with profiler.stage("training_data") as record:
+            data_df = fetch_historical_data(db, use_snapshot=use_snapshot, refresh_snapshot=refresh_snapshot, read_db=read_db)
+            record["rows"] = len(data_df)
     finally:
+        if read_db is not db:
+            read_db.close()
         db.close()
 
     if data_df.empty or 'actual_yield_tonnes_per_hectare' not in data_df.columns:
@@ -156,10 +452,7 @@ def train_yield_model():
     # Define critical features needed for training (before NaN drop for these specifically)
     # These are the columns that will go into X after processing
     # Categorical encoded columns would be added here later.
-    feature_columns_for_model = [
-        'avg_temp', 'min_temp', 'max_temp', 'avg_humidity', 'avg_soil_moisture',
-        'gdd_approx', 'cycle_duration_days', 'field_area_hectares'
-    ]
+    feature_columns_for_model = list(FEATURE_COLUMNS)
     # Ensure all these feature columns exist in data_df, even if they are all NaN for some rows
     for col in feature_columns_for_model:
         if col not in data_df.columns:
@@ -169,8 +462,10 @@ def train_yield_model():
     # Essential features here are those that, if missing, make the row unusable.
     # For example, if cycle_duration_days is NaN, the row is likely problematic.
     essential_cols_for_dropna = feature_columns_for_model + ['actual_yield_tonnes_per_hectare']
-    data_df = data_df.dropna(subset=essential_cols_for_dropna, how='any') # Drop if any essential is NaN
-                                                                       # Consider 'all' if some NaNs in features are imputable
+    with profiler.stage("cleaning") as record:
+        data_df = data_df.dropna(subset=essential_cols_for_dropna, how='any').reset_index(drop=True) # Drop if any essential is NaN
+                                                                           # Consider 'all' if some NaNs in features are imputable
+        record["rows"] = len(data_df)
     
     if data_df.empty:
         print("No valid training data after NaN drop based on essential features and target. Exiting.")
@@ -183,19 +478,35 @@ def train_yield_model():
         print("Feature set X is empty. Cannot train model.")
         return
 
+    if incremental:
+        with profiler.stage("incremental_update", rows=len(data_df)):
+            updated = _train_incremental(data_df, feature_columns_for_model)
+        if updated:
+            return
+
+    group_by_columns = GROUP_BY_OPTIONS[group_by] if group_by else None
+    if search:
+        with profiler.stage("parameter_search", rows=len(data_df)):
+            _train_with_search(data_df, feature_columns_for_model, n_folds, max_configs, workers,
+                               group_by=group_by_columns, min_group_rows=min_group_rows)
+        return
+
     X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
 
-    scaler = StandardScaler()
-    X_train_scaled = scaler.fit_transform(X_train)
-    X_test_scaled = scaler.transform(X_test)
+    with profiler.stage("scaling", rows=len(X)):
+        scaler = StandardScaler()
+        X_train_scaled = scaler.fit_transform(X_train)
+        X_test_scaled = scaler.transform(X_test)
     
     trained_feature_names = list(X_train.columns) # Get feature names from DataFrame used for fitting scaler
 
-    model = RandomForestRegressor(n_estimators=100, random_state=42, oob_score=True, max_depth=10, min_samples_split=5)
-    model.fit(X_train_scaled, y_train)
+    with profiler.stage("fit", rows=len(X_train)):
+        model = RandomForestRegressor(n_estimators=100, random_state=42, oob_score=True, max_depth=10, min_samples_split=5)
+        model.fit(X_train_scaled, y_train)
 
-    y_pred_train = model.predict(X_train_scaled)
-    y_pred_test = model.predict(X_test_scaled)
+    with profiler.stage("predict", rows=len(X)):
+        y_pred_train = model.predict(X_train_scaled)
+        y_pred_test = model.predict(X_test_scaled)
 
     train_rmse = np.sqrt(mean_squared_error(y_train, y_pred_train))
     test_rmse = np.sqrt(mean_squared_error(y_test, y_pred_test))
@@ -211,22 +522,54 @@ def train_yield_model():
     print(f"Test R2: {test_r2:.3f}")
     print(f"OOB Score: {oob if isinstance(oob, str) else f'{oob:.3f}'}")
 
-    if not os.path.exists(MODEL_DIR):
-        os.makedirs(MODEL_DIR)
-        print(f"Created directory: {MODEL_DIR}")
-    
-    joblib.dump(model, MODEL_PATH)
-    print(f"Model saved to {MODEL_PATH}")
-    joblib.dump(scaler, SCALER_PATH)
-    print(f"Scaler saved to {SCALER_PATH}")
-    
-    with open(FEATURE_NAMES_PATH, 'w') as f: # Use FEATURE_NAMES_PATH constant
-        json.dump(trained_feature_names, f)
-    print(f"Feature names saved to {FEATURE_NAMES_PATH}")
+    metrics = {
+        'train_rmse': float(train_rmse),
+        'test_rmse': float(test_rmse),
+        'train_r2': float(train_r2),
+        'test_r2': float(test_r2),
+        'oob_score': None if isinstance(oob, str) else float(oob),
+        'training_rows': int(len(X_train)),
+        'test_rows': int(len(X_test)),
+    }
+    group_models = None
+    if group_by_columns:
+        with profiler.stage("group_models", rows=len(data_df)):
+            group_models = train_group_models(data_df, feature_columns_for_model, model.get_params(),
+                                              group_by_columns, min_group_rows, workers)
+    with profiler.stage("store"):
+        version = register_model(
+            model, scaler, trained_feature_names,
+            metrics=metrics, feature_version=FEATURE_VERSION, params=model.get_params(),
+            artifacts={TRAINING_CYCLES_FILENAME: _training_cycles_artifact(
+                data_df.loc[X_train.index, 'crop_cycle_id'], data_df.loc[X_test.index, 'crop_cycle_id'],
+                full_build_trees=len(model.estimators_))},
+            groups=group_models, group_by=group_by_columns,
+        )
+    print(f"Model registered and activated as version {version} in {MODEL_DIR}")
 
 
 if __name__ == "__main__":
     print(f"Running Yield Model Trainer from: {os.getcwd()}")
-    print(f"MODEL_DIR will be: {MODEL_DIR}")
-    train_yield_model()
+    parser = argparse.ArgumentParser(description="Train the yield model and register it.")
+    parser.add_argument("--search", action="store_true", help="Cross-validated parameter search (GroupKFold by field) instead of the fixed configuration.")
+    parser.add_argument("--folds", type=int, default=SEARCH_DEFAULT_FOLDS, help="Number of GroupKFold folds for --search.")
+    parser.add_argument("--max-configs", type=int, default=SEARCH_DEFAULT_MAX_CONFIGS, help="Configurations sampled from the grid for --search.")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes for --search and --group-by (default: all cores).")
+    parser.add_argument("--group-by", choices=sorted(GROUP_BY_OPTIONS), default=None, help="Also train one model per crop type (crop) or per crop and soil type (crop_soil).")
+    parser.add_argument("--min-group-rows", type=int, default=GROUP_MIN_ROWS, help="Minimum cycles for a group model; smaller groups use the global model.")
+    parser.add_argument("--incremental", action="store_true", help="Grow the active forest with newly completed cycles (warm start); full build on drift.")
+    parser.add_argument("--no-snapshot", action="store_true", help="Build the training matrix from the database, bypassing the local snapshot.")
+    parser.add_argument("--rebuild-snapshot", action="store_true", help="Rebuild the local training snapshot from scratch.")
+    parser.add_argument("--stream-readings", action="store_true", help="Aggregate readings client-side from a streamed binary COPY (FEATURE_AGGREGATION_STREAMING).")
+    parser.add_argument("--profile", action="store_true", help="Record per-stage wall/CPU time, rows and peak RSS to a JSON summary in PROFILE_DIR.")
+    parser.add_argument("--profile-sampling", action="store_true", help="With --profile, also write a pyinstrument sampling report (if installed).")
+    args = parser.parse_args()
+    if args.profile or args.profile_sampling:
+        enable_profiling(sampling=args.profile_sampling)
+    if args.stream_readings:
+        app_settings.FEATURE_AGGREGATION_STREAMING = True
+    print(f"Model registry: {MODEL_DIR}")
+    train_yield_model(search=args.search, n_folds=args.folds, max_configs=args.max_configs, workers=args.workers,
+                      use_snapshot=not args.no_snapshot, refresh_snapshot=args.rebuild_snapshot,
+                      group_by=args.group_by, min_group_rows=args.min_group_rows, incremental=args.incremental)
     